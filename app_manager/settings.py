@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -29,12 +30,14 @@ INSTALLED_APPS = [
   "django.contrib.sessions",
   "django.contrib.messages",
   "django.contrib.staticfiles",
+  "django.contrib.postgres",
   "appliance",
 ]
 
 MIDDLEWARE = [
+  "appliance.middleware.RequestMetricsMiddleware",
   "django.middleware.security.SecurityMiddleware",
-  "whitenoise.middleware.WhiteNoiseMiddleware",
+  "appliance.middleware.WhiteNoiseMiddleware",
   "django.contrib.sessions.middleware.SessionMiddleware",
   "django.middleware.common.CommonMiddleware",
   "django.middleware.csrf.CsrfViewMiddleware",
@@ -45,12 +48,23 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "app_manager.urls"
 
+# Compiled templates are kept per worker and warmed at boot, see
+# appliance.template_backends.warm_templates(). Off, templates are read and
+# compiled on every render, so edits show without a restart.
+TEMPLATE_CACHE = os.getenv("TEMPLATE_CACHE", str(not DEBUG)) == "True"
+TEMPLATE_LOADERS = [
+  "django.template.loaders.filesystem.Loader",
+  "django.template.loaders.app_directories.Loader",
+]
+
 TEMPLATES = [
   {
-    "BACKEND": "django.template.backends.django.DjangoTemplates",
+    "BACKEND": "appliance.template_backends.InstrumentedDjangoTemplates",
     "DIRS": [],
-    "APP_DIRS": True,
     "OPTIONS": {
+      "loaders": [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)]
+      if TEMPLATE_CACHE
+      else TEMPLATE_LOADERS,
       "context_processors": [
         "django.template.context_processors.debug",
         "django.template.context_processors.request",
@@ -62,6 +76,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "app_manager.wsgi.application"
+ASGI_APPLICATION = "app_manager.asgi.application"
+
+# "wsgi" serves sync gunicorn workers, "asgi" uvicorn workers; see gunicorn.conf.py
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
 
 
 # Database
@@ -69,9 +87,16 @@ WSGI_APPLICATION = "app_manager.wsgi.application"
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///db.sqlite3")
 
+# Persistent connections are kept per thread. Under ASGI every request runs its
+# queries in a new thread, so connections are closed at the end of the request
+CONN_MAX_AGE = int(os.getenv("CONN_MAX_AGE", "0" if SERVER_MODE == "asgi" else "600"))
+
 DATABASES = {
   "default": dj_database_url.config(
-    env="DATABASE_URL", default=DATABASE_URL, conn_max_age=600
+    env="DATABASE_URL",
+    default=DATABASE_URL,
+    conn_max_age=CONN_MAX_AGE,
+    conn_health_checks=CONN_MAX_AGE > 0,
   )
 }
 
@@ -122,18 +147,68 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGGING = {
   "version": 1,
   "disable_existing_loggers": False,
+  "formatters": {
+    "verbose": {
+      "format": "%(asctime)s %(levelname)s %(name)s %(message)s",
+    },
+    # Request metrics are already JSON, one object per line
+    "structured": {
+      "format": "%(message)s",
+    },
+  },
   "handlers": {
     "console": {
       "class": "logging.StreamHandler",
+      "formatter": "verbose",
+    },
+    "metrics": {
+      "class": "logging.StreamHandler",
+      "formatter": "structured",
     },
   },
   "root": {
     "handlers": ["console"],
     "level": "DEBUG" if DEBUG else "INFO",
   },
+  "loggers": {
+    "appliance.metrics": {
+      "handlers": ["metrics"],
+      "level": os.getenv("METRICS_LOG_LEVEL", "INFO"),
+      "propagate": False,
+    },
+    # Pillow logs every decoded chunk at DEBUG while generating thumbnails
+    "PIL": {"level": "INFO"},
+    "botocore": {"level": "INFO"},
+  },
 }
 
 
+# Request metrics
+##################################################
+# /metrics is only served to these client addresses
+METRICS_ALLOWED_IPS = json.loads(
+  os.getenv("METRICS_ALLOWED_IPS", '["127.0.0.1", "::1"]')
+)
+
+# Per-view limits, keyed by URL name; breaches are logged as warnings
+VIEW_BUDGETS = json.loads(
+  os.getenv(
+    "VIEW_BUDGETS",
+    json.dumps(
+      {
+        "home": {"queries": 10, "duration_ms": 300},
+        "property_view": {"queries": 15, "duration_ms": 300},
+        "property_appliance_view": {"queries": 15, "duration_ms": 300},
+        "explore": {"queries": 10, "duration_ms": 300},
+        "appliance_search": {"queries": 5, "duration_ms": 100},
+        "get_month_dates": {"queries": 5, "duration_ms": 100},
+        "notification_feed": {"queries": 4, "duration_ms": 50},
+      }
+    ),
+  )
+)
+
+
 # Storage
 ##################################################
 
@@ -141,16 +216,30 @@ S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
 S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
 S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+# Public buckets or CDNs serve plain URLs; private buckets need presigning
+S3_CUSTOM_DOMAIN = os.getenv("S3_CUSTOM_DOMAIN")
+S3_QUERYSTRING_AUTH = os.getenv("S3_QUERYSTRING_AUTH", "True") == "True"
+
+# AVIF and WebP variants are encoded after an upload's transaction commits, in
+# the request. False leaves them to `generate_image_variants --watch`, run
+# beside the web workers; pages show the original upload until then.
+IMAGE_VARIANTS_INLINE = os.getenv("IMAGE_VARIANTS_INLINE", "True") == "True"
+
+# Resolved media URLs memoized per worker
+MEDIA_URL_CACHE_SIZE = int(os.getenv("MEDIA_URL_CACHE_SIZE", "10000"))
+MEDIA_URL_CACHE_TTL = int(os.getenv("MEDIA_URL_CACHE_TTL", "3600"))
 
 STORAGES = {
   "default": {
-    "BACKEND": "storages.backends.s3.S3Storage",
+    "BACKEND": "appliance.storage.MediaStorage",
     "OPTIONS": {
       "access_key": S3_ACCESS_KEY,
       "secret_key": S3_SECRET_KEY,
       "bucket_name": S3_BUCKET_NAME,
       "endpoint_url": S3_ENDPOINT_URL,
       "addressing_style": "path",
+      "custom_domain": S3_CUSTOM_DOMAIN,
+      "querystring_auth": S3_QUERYSTRING_AUTH,
     },
   },
   "staticfiles": {
@@ -172,7 +261,146 @@ SESSION_COOKIE_SECURE = True
 AUTH_USER_MODEL = "appliance.User"
 
 
+# Explore catalogue
+##################################################
+CATALOGUE_PAGE_SIZE = int(os.getenv("CATALOGUE_PAGE_SIZE", "50"))
+
+
+# Catalogue search
+##################################################
+SEARCH_RESULTS_LIMIT = int(os.getenv("SEARCH_RESULTS_LIMIT", "50"))
+
+
+# Cache
+##################################################
+# "locmem" keeps a cache per worker process. "file" shares a directory between
+# the workers of a host without another service. "redis" shares one server,
+# or any Redis-compatible one, between every host.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+CACHE_DEFAULT_LOCATIONS = {
+  "locmem": "appliance",
+  "file": "/var/tmp/appliance-cache",
+  "redis": "redis://localhost:6379/0",
+}
+if CACHE_BACKEND not in CACHE_DEFAULT_LOCATIONS:
+  raise ImproperlyConfigured(
+    f"CACHE_BACKEND must be one of {', '.join(CACHE_DEFAULT_LOCATIONS)}"
+  )
+CACHE_OPTIONS = {}
+if CACHE_BACKEND != "redis":
+  # Culled beyond this many entries; Redis evicts by its own maxmemory policy
+  CACHE_OPTIONS["MAX_ENTRIES"] = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+CACHES = {
+  "default": {
+    "BACKEND": {
+      "locmem": "appliance.cache_backends.LocMemCache",
+      "file": "appliance.cache_backends.FileBasedCache",
+      "redis": "appliance.cache_backends.RedisCache",
+    }[CACHE_BACKEND],
+    "LOCATION": os.getenv("CACHE_LOCATION", CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND]),
+    # Keeps deployments sharing a cache apart
+    "KEY_PREFIX": os.getenv("CACHE_KEY_PREFIX", "appliance"),
+    # Bumping it drops every cached value, e.g. after a change to what is pickled
+    "VERSION": int(os.getenv("CACHE_VERSION", "1")),
+    "TIMEOUT": int(os.getenv("CACHE_TIMEOUT", "300")),
+    "OPTIONS": CACHE_OPTIONS,
+  }
+}
+
+
+# Sessions and signed-in users
+##################################################
+# "db" reads the session row on every request. "cached_db" reads it from the
+# cache and writes through to the database. "signed_cookies" keeps the session
+# in the cookie: nothing is stored, but a session cannot be revoked before it
+# expires and logging out only clears that browser's cookie. The cached
+# engine needs a cache every worker of every host sees, so it is only the
+# default on redis: a file cache is per host, and a session ended on one
+# container would stay valid on the others.
+SESSION_STORE = os.getenv(
+  "SESSION_STORE", "cached_db" if CACHE_BACKEND == "redis" else "db"
+)
+SESSION_ENGINES = {
+  "db": "django.contrib.sessions.backends.db",
+  "cached_db": "django.contrib.sessions.backends.cached_db",
+  "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+if SESSION_STORE not in SESSION_ENGINES:
+  raise ImproperlyConfigured(
+    f"SESSION_STORE must be one of {', '.join(SESSION_ENGINES)}"
+  )
+SESSION_ENGINE = SESSION_ENGINES[SESSION_STORE]
+
+AUTHENTICATION_BACKENDS = ["appliance.auth_backends.CachedModelBackend"]
+# Seconds a signed-in user and their permissions are cached; changes to them
+# drop the entries early, but only in the cache of the host that made them.
+# 0 loads them on every request, the default unless the cache is redis: on
+# locmem or file a deactivated user or changed password would still be
+# accepted by other workers or containers until the entry expires.
+AUTH_CACHE_TIMEOUT = int(
+  os.getenv("AUTH_CACHE_TIMEOUT", "300" if CACHE_BACKEND == "redis" else "0")
+)
+
+
+# Template fragment cache
+##################################################
+# Seconds; cached rows embed media URLs, so keep this well under the lifetime
+# of presigned S3 URLs (one hour)
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv("FRAGMENT_CACHE_TIMEOUT", "600"))
+
+
+# Replacement matching
+##################################################
+MATCHING_TOP_K = int(os.getenv("MATCHING_TOP_K", "10"))
+
+
+# Replacement forecasting
+##################################################
+# Yearly price growth applied to replacement costs up to their due date
+FORECAST_COST_INFLATION = float(os.getenv("FORECAST_COST_INFLATION", "0.03"))
+FORECAST_HORIZON_MONTHS = int(os.getenv("FORECAST_HORIZON_MONTHS", "12"))
+
+
+# Replacement scheduling
+##################################################
+SCHEDULE_SLOT_CAPACITY = int(os.getenv("SCHEDULE_SLOT_CAPACITY", "1"))
+
+
+# Notifications
+##################################################
+EMAIL_BACKEND = os.getenv(
+  "EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend"
+)
+EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True") == "True"
+EMAIL_TIMEOUT = int(os.getenv("EMAIL_TIMEOUT", "10"))
+DEFAULT_FROM_EMAIL = os.getenv(
+  "DEFAULT_FROM_EMAIL", "Appliance Management <noreply@appliance-management.co.uk>"
+)
+
+# A dotted path to a class following appliance.sms.BaseSMSBackend
+SMS_BACKEND = os.getenv("SMS_BACKEND", "appliance.sms.ConsoleSMSBackend")
+SMS_FILE_PATH = os.getenv("SMS_FILE_PATH", os.path.join(BASE_DIR, "sent_sms"))
+
+# Outbox rows claimed per batch by the dispatch_notifications worker
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "8"))
+# Seconds; retries back off exponentially from the base delay up to the cap
+NOTIFICATION_RETRY_BASE_DELAY = int(os.getenv("NOTIFICATION_RETRY_BASE_DELAY", "30"))
+NOTIFICATION_RETRY_MAX_DELAY = int(os.getenv("NOTIFICATION_RETRY_MAX_DELAY", "3600"))
+# Seconds a claimed row stays hidden from other workers
+NOTIFICATION_LEASE = int(os.getenv("NOTIFICATION_LEASE", "300"))
+
+# In-app feed: items shown in the bell and seconds between polls
+NOTIFICATION_FEED_SIZE = int(os.getenv("NOTIFICATION_FEED_SIZE", "20"))
+NOTIFICATION_POLL_INTERVAL = int(os.getenv("NOTIFICATION_POLL_INTERVAL", "15"))
+
+
 # Login URL
 ##################################################
 LOGIN_URL = "/admin"
-LOGIN_REDIRECT_URL = "/"
\ No newline at end of file
+LOGIN_REDIRECT_URL = "/"
@@ -3,16 +3,23 @@
 #
 #
 from django.contrib import admin
+from django.db.models import Count
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.html import format_html
 
 from appliance.models import (
   Appliance,
+  DeliveryStatus,
+  OutboxMessage,
   Property,
   PropertyAppliance,
+  ReplacementScore,
   Schedule,
   User,
   UserProperty,
 )
+from appliance.pagination import EstimatedCountPaginator
 
 # Admin configuration
 #
@@ -23,6 +30,21 @@ admin.site.site_title = "Appliance Administration"
 admin.site.index_title = "Admin"
 
 
+# Large table admin
+#
+#
+#
+class LargeTableAdmin(admin.ModelAdmin):
+  """
+  Changelist settings for tables that grow with the fleet. Totals come from
+  planner estimates where possible, and filtered pages skip the second
+  COUNT(*) over the unfiltered table.
+  """
+
+  paginator = EstimatedCountPaginator
+  show_full_result_count = False
+
+
 # User Admin
 #
 #
@@ -64,10 +86,18 @@ class PropertyAdmin(admin.ModelAdmin):
   list_display = ("name", "address", "appliance_count")
   search_fields = ("name", "address")
 
+  def get_queryset(self, request):
+    return (
+      super()
+      .get_queryset(request)
+      .annotate(appliance_total=Count("property_appliances"))
+    )
+
   def appliance_count(self, obj):
-    return obj.property_appliances.count()
+    return obj.appliance_total
 
   appliance_count.short_description = "Appliances"
+  appliance_count.admin_order_field = "appliance_total"
 
 
 # Appliance Admin
@@ -75,13 +105,12 @@ class PropertyAdmin(admin.ModelAdmin):
 #
 #
 @admin.register(Appliance)
-class ApplianceAdmin(admin.ModelAdmin):
+class ApplianceAdmin(LargeTableAdmin):
   list_display = (
     "brand",
     "model",
     "appliance_type",
     "cost",
-    "matching_score",
     "efficiency_rating",
     "display_image",
   )
@@ -103,6 +132,7 @@ class ApplianceAdmin(admin.ModelAdmin):
 @admin.register(UserProperty)
 class UserPropertyAdmin(admin.ModelAdmin):
   list_display = ("username", "property_id", "property_name", "assignment_date")
+  list_select_related = ("user", "property")
   list_filter = ("assignment_date",)
   search_fields = ("user__username", "property__name")
   raw_id_fields = ("user", "property")
@@ -114,14 +144,41 @@ class UserPropertyAdmin(admin.ModelAdmin):
   username.short_description = "Username"
 
   def property_id(self, obj):
-    return obj.property.id
+    return obj.property_id
 
   property_id.short_description = "Property ID"
+  property_id.admin_order_field = "property_id"
 
   def property_name(self, obj):
     return obj.property.name
 
   property_name.short_description = "Property Name"
+  property_name.admin_order_field = "property__name"
+
+
+# Warranty status filter
+#
+#
+#
+class WarrantyStatusFilter(admin.SimpleListFilter):
+  title = "warranty status"
+  parameter_name = "warranty"
+
+  def lookups(self, request, model_admin):
+    return (
+      ("within", "Within warranty"),
+      ("expiring", "Expiring in 30 days"),
+      ("expired", "Out of warranty"),
+    )
+
+  def queryset(self, request, queryset):
+    if self.value() == "within":
+      return queryset.within_warranty()
+    if self.value() == "expiring":
+      return queryset.warranty_expiring(days=30)
+    if self.value() == "expired":
+      return queryset.out_of_warranty()
+    return queryset
 
 
 # PropertyAppliance Admin (Fact Table)
@@ -129,7 +186,7 @@ class UserPropertyAdmin(admin.ModelAdmin):
 #
 #
 @admin.register(PropertyAppliance)
-class PropertyApplianceAdmin(admin.ModelAdmin):
+class PropertyApplianceAdmin(LargeTableAdmin):
   list_display = (
     "property_id",
     "property_name",
@@ -138,27 +195,39 @@ class PropertyApplianceAdmin(admin.ModelAdmin):
     "purchase_date",
     "display_cost",
     "usage",
-    "is_within_warranty",
+    "warranty_ends_on",
+    "within_warranty",
   )
-  list_filter = ("usage", "purchase_date")
+  list_select_related = ("property", "appliance")
+  list_filter = ("usage", WarrantyStatusFilter, "purchase_date")
   search_fields = ("property__name", "appliance__brand", "appliance__model")
   raw_id_fields = ("property", "appliance")
   date_hierarchy = "purchase_date"
 
+  def get_queryset(self, request):
+    return (
+      super()
+      .get_queryset(request)
+      .annotate(effective_cost=Coalesce("actual_cost", "appliance__cost"))
+    )
+
   def property_id(self, obj):
-    return obj.property.id
+    return obj.property_id
 
   property_id.short_description = "Property ID"
+  property_id.admin_order_field = "property_id"
 
   def property_name(self, obj):
     return obj.property.name
 
   property_name.short_description = "Property Name"
+  property_name.admin_order_field = "property__name"
 
   def appliance_id(self, obj):
-    return obj.appliance.id
+    return obj.appliance_id
 
   appliance_id.short_description = "Appliance ID"
+  appliance_id.admin_order_field = "appliance_id"
 
   def appliance_name(self, obj):
     return str(obj.appliance)
@@ -166,9 +235,18 @@ class PropertyApplianceAdmin(admin.ModelAdmin):
   appliance_name.short_description = "Appliance"
 
   def display_cost(self, obj):
-    return obj.get_cost()
+    return obj.effective_cost
 
   display_cost.short_description = "Cost"
+  display_cost.admin_order_field = "effective_cost"
+
+  def within_warranty(self, obj):
+    if obj.warranty_ends_on is None:
+      return None
+    return timezone.now().date() <= obj.warranty_ends_on
+
+  within_warranty.boolean = True
+  within_warranty.short_description = "Within Warranty"
 
 
 # Schedule Admin
@@ -176,13 +254,17 @@ class PropertyApplianceAdmin(admin.ModelAdmin):
 #
 #
 @admin.register(Schedule)
-class ScheduleAdmin(admin.ModelAdmin):
+class ScheduleAdmin(LargeTableAdmin):
   list_display = (
     "property_appliance",
     "formatted_date_time",
     "notifications_enabled",
     "tenant_email",
   )
+  list_select_related = (
+    "property_appliance__property",
+    "property_appliance__appliance",
+  )
   list_filter = ("date", "notifications_enabled")
   search_fields = (
     "property_appliance__property__name",
@@ -195,3 +277,48 @@ class ScheduleAdmin(admin.ModelAdmin):
     return f"{obj.date} at {obj.hour:02d}:{obj.minute:02d}"
 
   formatted_date_time.short_description = "Date & Time"
+
+
+# Replacement Score Admin
+#
+#
+#
+@admin.register(ReplacementScore)
+class ReplacementScoreAdmin(LargeTableAdmin):
+  list_display = ("property_appliance", "candidate", "score", "computed_at")
+  list_select_related = (
+    "property_appliance__property",
+    "property_appliance__appliance",
+    "candidate",
+  )
+  search_fields = ("candidate__brand", "candidate__model")
+  raw_id_fields = ("property_appliance", "candidate")
+
+
+# Outbox Admin
+#
+#
+#
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(LargeTableAdmin):
+  list_display = (
+    "recipient",
+    "channel",
+    "status",
+    "attempts",
+    "next_attempt_at",
+    "sent_at",
+  )
+  list_filter = ("status", "channel")
+  search_fields = ("recipient", "idempotency_key")
+  raw_id_fields = ("schedule",)
+  readonly_fields = ("idempotency_key", "attempts", "last_error", "sent_at")
+  actions = ("retry_now",)
+
+  def retry_now(self, request, queryset):
+    updated = queryset.exclude(status=DeliveryStatus.SENT.value).update(
+      status=DeliveryStatus.PENDING.value, next_attempt_at=timezone.now()
+    )
+    self.message_user(request, f"{updated} notifications queued for delivery")
+
+  retry_now.short_description = "Retry delivery now"
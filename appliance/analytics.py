@@ -0,0 +1,197 @@
+#
+#
+#
+#
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appliance.matching import EFFICIENCY_LEVELS
+from appliance.models import (
+  ApplianceType,
+  EfficiencyRating,
+  Property,
+  PropertyAppliance,
+  PropertySummary,
+  PropertyTypeSpend,
+)
+
+EFFICIENCY_LEVEL = Case(
+  *(
+    When(appliance__efficiency_rating=rating, then=Value(level))
+    for rating, level in EFFICIENCY_LEVELS.items()
+  ),
+  default=Value(0),
+  output_field=IntegerField(),
+)
+EFFECTIVE_COST = Coalesce("actual_cost", "appliance__cost")
+
+
+# Refresh
+#
+#
+#
+def refresh_property_summaries(property_ids, today=None):
+  """
+  Recomputes the summary rows of the given properties with grouped
+  aggregate queries, whatever the number of installed units.
+  """
+  property_ids = set(property_ids)
+  if not property_ids:
+    return
+  today = today or timezone.localdate()
+  units = PropertyAppliance.objects.filter(property_id__in=property_ids)
+
+  totals = {
+    row["property_id"]: row
+    for row in units.values("property_id").annotate(
+      appliance_count=Count("id"),
+      total_spend=Sum(EFFECTIVE_COST),
+      efficiency_total=Sum(EFFICIENCY_LEVEL),
+      under_warranty=Count("id", filter=Q(warranty_ends_on__gte=today)),
+    )
+  }
+  type_spend = units.values("property_id", "appliance__appliance_type").annotate(
+    appliance_count=Count("id"), total_spend=Sum(EFFECTIVE_COST)
+  )
+
+  # Properties deleted since the refresh was queued are skipped
+  existing = set(
+    Property.objects.filter(id__in=property_ids).values_list("id", flat=True)
+  )
+  summaries = []
+  for property_id in existing:
+    row = totals.get(property_id, {})
+    summaries.append(
+      PropertySummary(
+        property_id=property_id,
+        appliance_count=row.get("appliance_count", 0),
+        total_spend=row.get("total_spend") or 0,
+        efficiency_total=row.get("efficiency_total") or 0,
+        under_warranty=row.get("under_warranty", 0),
+        computed_on=today,
+      )
+    )
+
+  type_spends = [
+    PropertyTypeSpend(
+      property_id=row["property_id"],
+      appliance_type=row["appliance__appliance_type"],
+      appliance_count=row["appliance_count"],
+      total_spend=row["total_spend"] or 0,
+    )
+    for row in type_spend
+    if row["property_id"] in existing
+  ]
+  stale_types = Q()
+  for property_id in existing:
+    stale_types |= Q(property_id=property_id) & ~Q(
+      appliance_type__in=[
+        spend.appliance_type
+        for spend in type_spends
+        if spend.property_id == property_id
+      ]
+    )
+
+  # Upserted rather than deleted and recreated, so concurrent refreshes of a
+  # property do not collide on its unique rows
+  with transaction.atomic():
+    PropertySummary.objects.bulk_create(
+      summaries,
+      update_conflicts=True,
+      unique_fields=["property"],
+      update_fields=[
+        "appliance_count",
+        "total_spend",
+        "efficiency_total",
+        "under_warranty",
+        "computed_on",
+      ],
+    )
+    if stale_types:
+      PropertyTypeSpend.objects.filter(stale_types).delete()
+    PropertyTypeSpend.objects.bulk_create(
+      type_spends,
+      update_conflicts=True,
+      unique_fields=["property", "appliance_type"],
+      update_fields=["appliance_count", "total_spend"],
+    )
+
+
+def refresh_on_commit(property_ids):
+  property_ids = {property_id for property_id in property_ids if property_id}
+  if property_ids:
+    transaction.on_commit(lambda: refresh_property_summaries(property_ids))
+
+
+# Read path
+#
+#
+#
+@dataclass
+class Portfolio:
+  appliance_count: int = 0
+  total_spend: int = 0
+  efficiency_total: int = 0
+  under_warranty: int = 0
+  by_property: dict = field(default_factory=dict)
+  by_type: list = field(default_factory=list)
+
+  @property
+  def average_efficiency(self):
+    """The rating nearest the units' mean efficiency level"""
+    if not self.appliance_count:
+      return None
+    level = round(self.efficiency_total / self.appliance_count)
+    return list(EfficiencyRating)[level]
+
+  @property
+  def warranty_coverage(self):
+    if not self.appliance_count:
+      return None
+    return self.under_warranty / self.appliance_count
+
+
+def portfolio_summary(user):
+  """
+  Reads a landlord's totals from the summary tables, so the cost grows with
+  the number of properties rather than installed units. Summaries missing
+  or computed before today are rebuilt first.
+  """
+  today = timezone.localdate()
+  summaries = PropertySummary.objects.filter(property__landlords__user=user)
+  property_ids = set(user.properties.values_list("property_id", flat=True))
+  current = {summary.property_id: summary for summary in summaries}
+  stale = {
+    property_id
+    for property_id in property_ids
+    if property_id not in current or current[property_id].computed_on < today
+  }
+  if stale:
+    refresh_property_summaries(stale, today)
+    current = {summary.property_id: summary for summary in summaries.all()}
+
+  portfolio = Portfolio(by_property=current)
+  for summary in current.values():
+    portfolio.appliance_count += summary.appliance_count
+    portfolio.total_spend += summary.total_spend
+    portfolio.efficiency_total += summary.efficiency_total
+    portfolio.under_warranty += summary.under_warranty
+
+  labels = dict(ApplianceType.choices())
+  portfolio.by_type = [
+    {
+      "appliance_type": row["appliance_type"],
+      "label": labels.get(row["appliance_type"], row["appliance_type"]),
+      "appliance_count": row["count"],
+      "total_spend": row["spend"],
+    }
+    for row in PropertyTypeSpend.objects.filter(property__landlords__user=user)
+    .values("appliance_type")
+    .annotate(count=Sum("appliance_count"), spend=Sum("total_spend"))
+    .order_by("-spend", "appliance_type")
+  ]
+  return portfolio
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApplianceConfig(AppConfig):
   default_auto_field = "django.db.models.BigAutoField"
   name = "appliance"
+
+  def ready(self):
+    from appliance import signals  # noqa: F401
@@ -0,0 +1,83 @@
+#
+#
+#
+#
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+def user_key(user_id):
+  return f"auth:user:{user_id}"
+
+
+def permissions_key(user_id, from_name):
+  return f"auth:permissions:{from_name}:{user_id}"
+
+
+def invalidate_users(user_ids):
+  """Drops the cached rows and permissions of the users"""
+  keys = [
+    key
+    for user_id in user_ids
+    for key in (
+      user_key(user_id),
+      permissions_key(user_id, "user"),
+      permissions_key(user_id, "group"),
+    )
+  ]
+  if not keys:
+    return
+  cache.delete_many(keys)
+  # Again once the change is visible, in case a request cached the old row
+  # between the delete and the commit
+  transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# Backend
+#
+#
+#
+class CachedModelBackend(ModelBackend):
+  """
+  ModelBackend whose user lookup, made by AuthenticationMiddleware on every
+  request, and permission sets are read from the cache for
+  settings.AUTH_CACHE_TIMEOUT seconds. The signals in appliance.signals drop
+  them when the user, their groups or permissions change. A changed password
+  still signs out other sessions, as their hash no longer matches the
+  reloaded row. The entries are only dropped from this host's cache, so
+  the timeout defaults to 0 unless the cache is shared.
+  """
+
+  def get_user(self, user_id):
+    timeout = settings.AUTH_CACHE_TIMEOUT
+    if not timeout:
+      return super().get_user(user_id)
+    key = user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+      user = super().get_user(user_id)
+      if user is not None:
+        cache.set(key, user, timeout)
+    return user
+
+  def _get_permissions(self, user_obj, obj, from_name):
+    timeout = settings.AUTH_CACHE_TIMEOUT
+    perm_cache_name = f"_{from_name}_perm_cache"
+    if (
+      not timeout
+      or not user_obj.is_active
+      or user_obj.is_anonymous
+      or obj is not None
+      or hasattr(user_obj, perm_cache_name)
+    ):
+      return super()._get_permissions(user_obj, obj, from_name)
+    key = permissions_key(user_obj.pk, from_name)
+    perms = cache.get(key)
+    if perms is None:
+      perms = super()._get_permissions(user_obj, obj, from_name)
+      cache.set(key, perms, timeout)
+    else:
+      setattr(user_obj, perm_cache_name, perms)
+    return perms
@@ -0,0 +1,239 @@
+#
+#
+#
+#
+import hashlib
+import json
+import threading
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.utils import timezone
+
+from appliance.models import Schedule
+
+WORKING_HOURS = (8, 9, 10, 11, 12, 13, 14, 15, 16, 17)
+SLOT_MINUTES = (0, 15, 30, 45)
+
+MonthAvailability = namedtuple(
+  "MonthAvailability", ["context", "etag", "last_modified"]
+)
+
+
+# Calendar cells
+#
+#
+#
+class Cell(dict):
+  """Read-only calendar cell shared between months, requests and workers"""
+
+  def _readonly(self, *args, **kwargs):
+    raise TypeError("Calendar cells are immutable")
+
+  __setitem__ = __delitem__ = _readonly
+  clear = pop = popitem = setdefault = update = _readonly
+
+  def __reduce__(self):
+    return (Cell, (dict(self),))
+
+
+# Free minutes by hour; the time selects offer only the minutes of the chosen hour
+FREE_DAY_SLOTS = Cell({hour: SLOT_MINUTES for hour in WORKING_HOURS})
+NO_SLOTS = Cell()
+
+EMPTY_CELL = Cell(
+  date="",
+  day="",
+  is_available=False,
+  available_hours=(),
+  slots=NO_SLOTS,
+  full_slots=(),
+)
+
+
+@lru_cache(maxsize=1024)
+def day_cell(day, is_available):
+  return Cell(
+    date=day.strftime("%Y-%m-%d"),
+    day=day.day,
+    is_available=is_available,
+    available_hours=WORKING_HOURS if is_available else (),
+    slots=FREE_DAY_SLOTS if is_available else NO_SLOTS,
+    full_slots=(),
+  )
+
+
+def partially_booked_cell(day, full_slots):
+  slots = {}
+  for hour in WORKING_HOURS:
+    minutes = tuple(
+      minute for minute in SLOT_MINUTES if (hour, minute) not in full_slots
+    )
+    if minutes:
+      slots[hour] = minutes
+  if not slots:
+    return day_cell(day, False)
+  return Cell(
+    date=day.strftime("%Y-%m-%d"),
+    day=day.day,
+    is_available=True,
+    available_hours=tuple(slots),
+    slots=Cell(slots),
+    full_slots=tuple(f"{hour}:{minute:02d}" for hour, minute in sorted(full_slots)),
+  )
+
+
+# Slot capacity
+#
+#
+#
+def is_bookable_slot(day, hour, minute):
+  """Whether a slot is on the installers' grid, ignoring capacity"""
+  weekday = (day.weekday() + 1) % 7
+  return weekday not in [0, 6] and hour in WORKING_HOURS and minute in SLOT_MINUTES
+
+
+def full_slots_between(first_day, last_day, capacity):
+  """Returns {date: {(hour, minute), ...}} of fully booked slots in one query"""
+  booked = (
+    Schedule.objects.filter(date__range=(first_day, last_day))
+    .values("date", "hour", "minute")
+    .annotate(booked=Count("id"))
+    .filter(booked__gte=capacity)
+    .order_by()
+  )
+  full_slots = {}
+  for slot in booked:
+    full_slots.setdefault(slot["date"], set()).add((slot["hour"], slot["minute"]))
+  return full_slots
+
+
+# Month builder
+#
+#
+#
+def build_availability_context(year, month, today, capacity=None):
+  first_day = date(year, month, 1)
+  last_day = date(year, month, monthrange(year, month)[1])
+  full_slots = {}
+  if last_day > today:
+    full_slots = full_slots_between(
+      first_day, last_day, capacity or settings.SCHEDULE_SLOT_CAPACITY
+    )
+
+  first_weekday = (first_day.weekday() + 1) % 7
+  dates = [EMPTY_CELL] * first_weekday
+
+  current_date = first_day
+  while current_date <= last_day:
+    weekday = (current_date.weekday() + 1) % 7
+    is_available = current_date > today and weekday not in [0, 6]
+    if is_available and current_date in full_slots:
+      dates.append(partially_booked_cell(current_date, full_slots[current_date]))
+    else:
+      dates.append(day_cell(current_date, is_available))
+    current_date += timedelta(days=1)
+
+  last_weekday = (last_day.weekday() + 1) % 7
+  dates.extend([EMPTY_CELL] * (6 - last_weekday))
+
+  return {
+    "dates": tuple(dates),
+    "current_month": first_day,
+    "month_name": first_day.strftime("%B %Y"),
+    "prev_month": (first_day - timedelta(days=1)).strftime("%Y-%m"),
+    "next_month": (last_day + timedelta(days=1)).strftime("%Y-%m"),
+  }
+
+
+# Cache
+#
+#
+#
+MEMO_SIZE = 256
+# Seconds a month is kept; a booking only bumps the version in the cache of the
+# host that took it, so other hosts see it once their entry expires
+MONTH_TIMEOUT = 60
+
+_memo = {}
+_memo_day = None
+_memo_lock = threading.Lock()
+
+
+def seconds_until_midnight(now=None):
+  now = timezone.localtime(now)
+  midnight = datetime.combine(now.date() + timedelta(days=1), time.min)
+  midnight = timezone.make_aware(midnight, now.tzinfo)
+  return max(int((midnight - now).total_seconds()), 1)
+
+
+def month_version_key(year, month):
+  return f"availability-version:{year}-{month:02d}"
+
+
+def invalidate_month(year, month):
+  """Called when bookings change so the workers sharing the cache rebuild it"""
+  cache.set(month_version_key(year, month), time_ns(), timeout=None)
+
+
+def _expired(entry):
+  return timezone.now() >= entry.last_modified + timedelta(seconds=MONTH_TIMEOUT)
+
+
+def month_availability(year, month):
+  """
+  Returns the availability of a month for today, memoized per process and
+  shared across workers through the cache. Entries expire after
+  MONTH_TIMEOUT seconds, at midnight and whenever a booking in the month
+  changes.
+  """
+  global _memo_day
+
+  today = timezone.localdate()
+  version = cache.get(month_version_key(year, month), 0)
+  key = f"availability:{year}-{month:02d}:{today.isoformat()}:{version}"
+
+  with _memo_lock:
+    if _memo_day != today:
+      _memo.clear()
+      _memo_day = today
+    entry = _memo.get(key)
+  if entry is not None and not _expired(entry):
+    return entry
+
+  entry = cache.get(key)
+  if entry is None or _expired(entry):
+    context = build_availability_context(year, month, today)
+    payload = json.dumps(context, cls=DjangoJSONEncoder, sort_keys=True)
+    entry = MonthAvailability(
+      context=context,
+      etag=hashlib.md5(payload.encode(), usedforsecurity=False).hexdigest(),
+      last_modified=timezone.now().replace(microsecond=0),
+    )
+    cache.set(key, entry, timeout=min(MONTH_TIMEOUT, seconds_until_midnight()))
+
+  with _memo_lock:
+    if _memo_day == today:
+      if len(_memo) >= MEMO_SIZE:
+        _memo.clear()
+      _memo[key] = entry
+  return entry
+
+
+def get_availability_context(month=None, year=None):
+  today = timezone.localdate()
+  current_year = today.year
+  current_month = today.month
+
+  if month and year:
+    current_year = int(year)
+    current_month = int(month)
+
+  return month_availability(current_year, current_month).context
@@ -0,0 +1,154 @@
+#
+#
+#
+#
+import itertools
+import os
+import threading
+from time import monotonic
+
+from django.core.cache.backends import filebased, locmem, redis
+
+from appliance import metrics
+
+# Seconds between writes of a worker's hit and miss counts to the shared cache
+STATS_FLUSH_INTERVAL = 10
+STATS_KEYS = {"hit": "cache:stats:hits", "miss": "cache:stats:misses"}
+STATS_KEY_NAMES = frozenset(STATS_KEYS.values())
+# Writes of a worker between the file cache's scans for entries over MAX_ENTRIES
+CULL_CHECK_INTERVAL = 100
+
+_missing = object()
+
+
+# Instrumentation
+#
+#
+#
+class InstrumentedCacheMixin:
+  """
+  Counts hits and misses into the /metrics registry, and every few seconds
+  adds them to counters kept in the cache itself, so the cache_stats command
+  can report a hit ratio across workers. Each backend below also reports
+  what it holds through usage(), as {"entries": int, "bytes": int}.
+  """
+
+  kind = None
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._stats_lock = threading.Lock()
+    self._pending = {"hit": 0, "miss": 0}
+    self._flush_at = monotonic() + STATS_FLUSH_INTERVAL
+
+  def _record(self, hits, misses):
+    for result, count in (("hit", hits), ("miss", misses)):
+      if count:
+        metrics.registry.inc(
+          "cache_requests_total", count, backend=self.kind, result=result
+        )
+    with self._stats_lock:
+      self._pending["hit"] += hits
+      self._pending["miss"] += misses
+      due = monotonic() >= self._flush_at
+    if due:
+      self.flush_stats()
+
+  def flush_stats(self):
+    with self._stats_lock:
+      pending, self._pending = self._pending, {"hit": 0, "miss": 0}
+      self._flush_at = monotonic() + STATS_FLUSH_INTERVAL
+    for result, count in pending.items():
+      if not count:
+        continue
+      key = STATS_KEYS[result]
+      if not super().add(key, count, timeout=None):
+        try:
+          super().incr(key, count)
+        except ValueError:
+          super().set(key, count, timeout=None)
+
+  def stats(self):
+    """Shared hit and miss counts, including this process's unflushed ones"""
+    self.flush_stats()
+    counts = super().get_many(list(STATS_KEYS.values()))
+    return {result: counts.get(key, 0) for result, key in STATS_KEYS.items()}
+
+  def reset_stats(self):
+    with self._stats_lock:
+      self._pending = {"hit": 0, "miss": 0}
+    super().delete_many(list(STATS_KEYS.values()))
+
+  def get(self, key, default=None, version=None):
+    if key in STATS_KEY_NAMES:
+      # The counters do not count themselves
+      return super().get(key, default, version)
+    value = super().get(key, _missing, version)
+    if value is _missing:
+      self._record(0, 1)
+      return default
+    self._record(1, 0)
+    return value
+
+
+# Backends
+#
+#
+#
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+  """Per-process cache; the default, and what the test suite runs on"""
+
+  kind = "locmem"
+
+  def usage(self):
+    with self._lock:
+      values = list(self._cache.values())
+    return {"entries": len(values), "bytes": sum(len(value) for value in values)}
+
+
+class FileBasedCache(InstrumentedCacheMixin, filebased.FileBasedCache):
+  """
+  Shared by every worker on a host without another service. Writes are
+  atomic renames; incr() is not atomic, so the shared counts are
+  approximate under concurrent flushes.
+  """
+
+  kind = "file"
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._writes = itertools.count(1)
+
+  def _cull(self):
+    # Django lists the whole cache directory on every set(); each worker
+    # checks every CULL_CHECK_INTERVAL writes instead, so the cache can run
+    # that many entries per worker over MAX_ENTRIES between checks
+    if not next(self._writes) % CULL_CHECK_INTERVAL:
+      super()._cull()
+
+  def usage(self):
+    entries, size = 0, 0
+    for path in self._list_cache_files():
+      try:
+        size += os.path.getsize(path)
+      except FileNotFoundError:
+        continue
+      entries += 1
+    return {"entries": entries, "bytes": size}
+
+
+class RedisCache(InstrumentedCacheMixin, redis.RedisCache):
+  """Shared by every worker and host; needs the redis package"""
+
+  kind = "redis"
+
+  def get_many(self, keys, version=None):
+    # The other backends' get_many() goes through get() and is counted there
+    keys = list(keys)
+    values = super().get_many(keys, version)
+    self._record(len(values), len(keys) - len(values))
+    return values
+
+  def usage(self):
+    client = self._cache.get_client(write=False)
+    return {"entries": client.dbsize(), "bytes": client.info("memory")["used_memory"]}
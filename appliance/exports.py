@@ -0,0 +1,316 @@
+#
+#
+#
+#
+import csv
+import json
+import zipfile
+import zlib
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+import zstandard
+from asgiref.sync import sync_to_async
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appliance.models import PropertyAppliance, Schedule
+
+EXPORT_FORMATS = {
+  "csv": ("text/csv", "csv"),
+  "jsonl": ("application/x-ndjson", "jsonl"),
+  "xlsx": (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "xlsx",
+  ),
+}
+COMPRESSIONS = {
+  "gzip": ("application/gzip", "gz"),
+  "zstd": ("application/zstd", "zst"),
+}
+CHUNK_ROWS = 500
+WARRANTY_EXPIRING_DAYS = 30
+
+# Header, then the values_list() expression it is read from
+COLUMNS = (
+  ("property", "property__name"),
+  ("address", "property__address"),
+  ("appliance_type", "appliance__appliance_type"),
+  ("brand", "appliance__brand"),
+  ("model", "appliance__model"),
+  ("usage", "usage"),
+  ("purchase_date", "purchase_date"),
+  ("cost", "effective_cost"),
+  ("warranty_ends_on", "warranty_ends_on"),
+  ("warranty_status", None),
+  ("next_replacement_date", "next_replacement_date"),
+  ("next_replacement_hour", "next_replacement_hour"),
+  ("next_replacement_minute", "next_replacement_minute"),
+  ("next_replacement_brand", "next_replacement_brand"),
+  ("next_replacement_model", "next_replacement_model"),
+)
+HEADERS = [header for header, _ in COLUMNS]
+
+
+# Rows
+#
+#
+#
+def portfolio_queryset(properties):
+  """
+  Installed appliances of the given properties with every exported column
+  joined or annotated, so rows are read without per-row lookups.
+  """
+  upcoming = Schedule.objects.filter(
+    property_appliance=OuterRef("pk"), date__gte=timezone.localdate()
+  ).order_by("date", "hour", "minute")
+
+  def next_replacement(field):
+    return Subquery(upcoming.values(field)[:1])
+
+  return (
+    PropertyAppliance.objects.filter(property__in=properties)
+    .annotate(
+      effective_cost=Coalesce("actual_cost", "appliance__cost"),
+      next_replacement_date=next_replacement("date"),
+      next_replacement_hour=next_replacement("hour"),
+      next_replacement_minute=next_replacement("minute"),
+      next_replacement_brand=next_replacement("replacement_appliance__brand"),
+      next_replacement_model=next_replacement("replacement_appliance__model"),
+    )
+    # Follows the property foreign key index, so rows stream without a sort
+    .order_by("property_id", "id")
+    .values_list(*(expression for _, expression in COLUMNS if expression))
+  )
+
+
+def warranty_status(ends_on, today):
+  if ends_on is None:
+    return ""
+  if ends_on < today:
+    return "expired"
+  if ends_on <= today + timedelta(days=WARRANTY_EXPIRING_DAYS):
+    return "expiring"
+  return "within"
+
+
+def iter_rows(queryset, chunk_size=2000):
+  """Yields export rows as lists, streaming the queryset in chunks"""
+  today = timezone.localdate()
+  status_index = HEADERS.index("warranty_status")
+  ends_on_index = HEADERS.index("warranty_ends_on")
+  for values in queryset.iterator(chunk_size=chunk_size):
+    row = list(values)
+    row.insert(status_index, warranty_status(row[ends_on_index], today))
+    yield row
+
+
+def _text(value):
+  if value is None:
+    return ""
+  if isinstance(value, date):
+    return value.isoformat()
+  return value
+
+
+# Writers
+#
+#
+#
+class _Sink:
+  """File-like object collecting writes until the generator yields them"""
+
+  def __init__(self):
+    self.chunks = []
+    self.position = 0
+
+  def write(self, data):
+    if isinstance(data, str):
+      data = data.encode()
+    self.chunks.append(data)
+    self.position += len(data)
+    return len(data)
+
+  def tell(self):
+    return self.position
+
+  def flush(self):
+    pass
+
+  def drain(self):
+    data = b"".join(self.chunks)
+    self.chunks = []
+    return data
+
+
+def write_csv(rows):
+  sink = _Sink()
+  writer = csv.writer(sink)
+  writer.writerow(HEADERS)
+  yield sink.drain()
+  for index, row in enumerate(rows, start=1):
+    writer.writerow([_text(value) for value in row])
+    if index % CHUNK_ROWS == 0:
+      yield sink.drain()
+  yield sink.drain()
+
+
+def write_jsonl(rows):
+  lines = []
+  for row in rows:
+    record = dict(zip(HEADERS, (_text(value) for value in row), strict=True))
+    lines.append(json.dumps(record))
+    if len(lines) == CHUNK_ROWS:
+      yield ("\n".join(lines) + "\n").encode()
+      lines = []
+  if lines:
+    yield ("\n".join(lines) + "\n").encode()
+
+
+XLSX_PARTS = {
+  "[Content_Types].xml": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" '
+    'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    "</Types>"
+  ),
+  "_rels/.rels": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats'
+    '.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+  ),
+  "xl/workbook.xml": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/'
+    'relationships"><sheets><sheet name="Portfolio" sheetId="1" r:id="rId1"/>'
+    "</sheets></workbook>"
+  ),
+  "xl/_rels/workbook.xml.rels": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats'
+    '.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/></Relationships>'
+  ),
+}
+
+
+def _xlsx_row(values):
+  cells = []
+  for value in values:
+    value = _text(value)
+    if isinstance(value, bool) or not isinstance(value, int | float):
+      cells.append(f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    else:
+      cells.append(f"<c><v>{value}</v></c>")
+  return f"<row>{''.join(cells)}</row>"
+
+
+def write_xlsx(rows):
+  """
+  Streams a single-sheet workbook. Cells use inline strings so no shared
+  string table has to be held in memory, and the zip is written to a
+  non-seekable sink so each member is emitted as it is compressed.
+  """
+  sink = _Sink()
+  with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as workbook:
+    for name, content in XLSX_PARTS.items():
+      workbook.writestr(name, content)
+    yield sink.drain()
+
+    with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+      sheet.write(
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/'
+        b'main"><sheetData>'
+      )
+      sheet.write(_xlsx_row(HEADERS).encode())
+      for index, row in enumerate(rows, start=1):
+        sheet.write(_xlsx_row(row).encode())
+        if index % CHUNK_ROWS == 0:
+          yield sink.drain()
+      sheet.write(b"</sheetData></worksheet>")
+  yield sink.drain()
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "xlsx": write_xlsx}
+
+
+# Compression
+#
+#
+#
+def compress(chunks, compression):
+  if compression == "gzip":
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+  elif compression == "zstd":
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+  else:
+    yield from chunks
+    return
+  for index, chunk in enumerate(chunks):
+    data = compressor.compress(chunk)
+    if index == 0:
+      # Push the first chunk out instead of waiting for a full block
+      data += compressor.flush(
+        zlib.Z_SYNC_FLUSH
+        if compression == "gzip"
+        else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+      )
+    if data:
+      yield data
+  yield compressor.flush()
+
+
+# Entry point
+#
+#
+#
+def export_portfolio(properties, file_format="csv", compression=None):
+  """
+  Returns (chunks, content_type, extension) for an export of the properties.
+  chunks is a generator of bytes that reads the database lazily.
+  """
+  if file_format not in WRITERS:
+    raise ValueError(f"Unsupported export format {file_format!r}")
+  if compression and compression not in COMPRESSIONS:
+    raise ValueError(f"Unsupported compression {compression!r}")
+
+  content_type, extension = EXPORT_FORMATS[file_format]
+  chunks = WRITERS[file_format](iter_rows(portfolio_queryset(properties)))
+  # Workbooks are zip archives already
+  if compression and file_format != "xlsx":
+    content_type, suffix = COMPRESSIONS[compression]
+    extension = f"{extension}.{suffix}"
+    chunks = compress(chunks, compression)
+  return (chunk for chunk in chunks if chunk), content_type, extension
+
+
+# Async streaming
+#
+#
+#
+async def aiter_chunks(chunks):
+  """
+  Iterates a chunk generator from an async response. Django's ASGI handler
+  reads a sync iterator into a list before sending anything, so each chunk is
+  pulled on the sync thread, which holds the export's database cursor, as it
+  is sent.
+  """
+  done = object()
+  try:
+    while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+      yield chunk
+  finally:
+    # Closes the server-side cursor when the client goes away mid-export
+    await sync_to_async(chunks.close)()
@@ -0,0 +1,242 @@
+#
+#
+#
+#
+import csv
+import io
+from datetime import date
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appliance.models import (
+  ApplianceType,
+  PropertyAppliance,
+  ReplacementForecast,
+  ReplacementScore,
+  Usage,
+)
+
+# Typical service life per appliance type at medium usage, in years
+LIFESPAN_YEARS = {
+  ApplianceType.WASHING_MACHINE.name: 11,
+  ApplianceType.DISHWASHER.name: 10,
+  ApplianceType.DRYER.name: 13,
+  ApplianceType.OVEN.name: 15,
+  ApplianceType.MICROWAVE.name: 9,
+  ApplianceType.REFRIGERATOR.name: 13,
+  ApplianceType.FREEZER.name: 12,
+  ApplianceType.TOASTER.name: 7,
+  ApplianceType.TOASTER_OVEN.name: 8,
+}
+DEFAULT_LIFESPAN_YEARS = 10
+
+# Heavier use wears units out sooner
+USAGE_LIFE_FACTORS = {
+  Usage.LOW.value: 1.25,
+  Usage.MEDIUM.value: 1.0,
+  Usage.HIGH.value: 0.8,
+  Usage.VERY_HIGH.value: 0.65,
+}
+
+DAYS_PER_YEAR = 365.25
+
+# Ordinal encodings, with the unknown value last
+TYPE_CODES = {name: code for code, name in enumerate(LIFESPAN_YEARS)}
+USAGE_CODES = {name: code for code, name in enumerate(USAGE_LIFE_FACTORS)}
+LIFESPAN_DAYS = np.array(
+  [years * DAYS_PER_YEAR for years in LIFESPAN_YEARS.values()]
+  + [DEFAULT_LIFESPAN_YEARS * DAYS_PER_YEAR],
+  dtype=np.float64,
+)
+LIFE_FACTORS = np.array([*USAGE_LIFE_FACTORS.values(), 1.0], dtype=np.float64)
+
+
+# Columnar fleet
+#
+#
+#
+class Fleet:
+  """Installed units as parallel NumPy arrays, one element per unit"""
+
+  def __init__(self, rows):
+    count = len(rows)
+    self.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    self.purchased = np.fromiter(
+      (row[1].toordinal() for row in rows), dtype=np.int64, count=count
+    )
+    self.type_codes = np.fromiter(
+      (TYPE_CODES.get(row[2], len(TYPE_CODES)) for row in rows),
+      dtype=np.int8,
+      count=count,
+    )
+    self.usage_codes = np.fromiter(
+      (USAGE_CODES.get(row[3], len(USAGE_CODES)) for row in rows),
+      dtype=np.int8,
+      count=count,
+    )
+    # Units without a warranty date use their purchase date, which never wins
+    self.warranty_ends = np.fromiter(
+      ((row[4] or row[1]).toordinal() for row in rows), dtype=np.int64, count=count
+    )
+    self.cost = np.fromiter(
+      (row[5] or 0 for row in rows), dtype=np.float64, count=count
+    )
+
+  def __len__(self):
+    return len(self.ids)
+
+
+def fleet_rows(property_appliance_ids=None):
+  units = PropertyAppliance.objects.all()
+  if property_appliance_ids is not None:
+    units = units.filter(id__in=property_appliance_ids)
+  return (
+    units.annotate(effective_cost=Coalesce("actual_cost", "appliance__cost"))
+    .order_by("id")
+    .values_list(
+      "id",
+      "purchase_date",
+      "appliance__appliance_type",
+      "usage",
+      "warranty_ends_on",
+      "effective_cost",
+    )
+  )
+
+
+# Forecast
+#
+#
+#
+def forecast(fleet, today, inflation):
+  """
+  Returns (due ordinals, replacement costs) for every unit in one pass.
+
+  A unit is due once its type's service life, scaled by usage, has elapsed,
+  and never before its warranty runs out. The replacement cost is today's
+  cost grown by inflation until the due date.
+  """
+  life = LIFESPAN_DAYS[fleet.type_codes] * LIFE_FACTORS[fleet.usage_codes]
+  due = np.maximum(
+    fleet.purchased + np.rint(life).astype(np.int64), fleet.warranty_ends
+  )
+  years_ahead = np.maximum(due - today.toordinal(), 0) / DAYS_PER_YEAR
+  cost = np.rint(fleet.cost * np.power(1.0 + inflation, years_ahead)).astype(np.int64)
+  return due, cost
+
+
+# Writing
+#
+#
+#
+FORECAST_COLUMNS = (
+  "property_appliance_id",
+  "due_on",
+  "replacement_cost",
+  "computed_at",
+)
+
+
+def _forecast_rows(ids, due, cost, computed_at):
+  computed_at = connection.ops.adapt_datetimefield_value(computed_at)
+  return (
+    (unit_id, date.fromordinal(ordinal).isoformat(), amount, computed_at)
+    for unit_id, ordinal, amount in zip(ids, due, cost, strict=True)
+  )
+
+
+def _insert_forecasts(rows):
+  # Plain parameter tuples skip building a model instance per unit
+  table = connection.ops.quote_name(ReplacementForecast._meta.db_table)
+  columns = ", ".join(FORECAST_COLUMNS)
+  with connection.cursor() as cursor:
+    if connection.vendor == "postgresql":
+      buffer = io.StringIO()
+      csv.writer(buffer).writerows(rows)
+      buffer.seek(0)
+      cursor.cursor.copy_expert(
+        f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
+      )
+    else:
+      cursor.executemany(
+        f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s)", list(rows)
+      )
+
+
+def write_forecasts(ids, due, cost, computed_at, replace_range):
+  ids, due, cost = ids.tolist(), due.tolist(), cost.tolist()
+  stale = ReplacementForecast.objects.all()
+  if replace_range:
+    # A full run reads units in id order, so each chunk is one id range
+    stale = stale.filter(pk__gte=ids[0], pk__lte=ids[-1])
+  else:
+    stale = stale.filter(pk__in=ids)
+
+  with transaction.atomic():
+    stale.delete()
+    _insert_forecasts(_forecast_rows(ids, due, cost, computed_at))
+
+
+def forecast_replacements(property_appliance_ids=None, chunk_size=100_000):
+  """
+  Recomputes the forecast table and returns the number of units forecast.
+  Without ids the whole fleet is streamed in chunks of chunk_size units.
+  """
+  today = timezone.localdate()
+  computed_at = timezone.now()
+  inflation = settings.FORECAST_COST_INFLATION
+  # Forecasts of removed units go with them, so only live units are written
+  full_run = property_appliance_ids is None
+
+  forecast_units = 0
+  chunk = []
+  rows = fleet_rows(property_appliance_ids).iterator(chunk_size=min(chunk_size, 10_000))
+  for row in rows:
+    chunk.append(row)
+    if len(chunk) >= chunk_size:
+      forecast_units += _forecast_chunk(chunk, today, inflation, computed_at, full_run)
+      chunk = []
+  if chunk:
+    forecast_units += _forecast_chunk(chunk, today, inflation, computed_at, full_run)
+  return forecast_units
+
+
+def _forecast_chunk(rows, today, inflation, computed_at, replace_range):
+  fleet = Fleet(rows)
+  due, cost = forecast(fleet, today, inflation)
+  write_forecasts(fleet.ids, due, cost, computed_at, replace_range)
+  return len(fleet)
+
+
+# Read path
+#
+#
+#
+def due_within(property_id, months, today=None):
+  """
+  Forecasts of the property's units due in the next months, overdue first,
+  each with its best scored replacement as a suggestion.
+  """
+  today = today or timezone.localdate()
+  best = ReplacementScore.objects.filter(
+    property_appliance=OuterRef("property_appliance")
+  ).order_by("-score", "candidate_id")
+  return (
+    ReplacementForecast.objects.filter(
+      property_appliance__property_id=property_id,
+      due_on__lte=today + relativedelta(months=months),
+    )
+    .select_related("property_appliance__appliance")
+    .annotate(
+      suggested_id=Subquery(best.values("candidate_id")[:1]),
+      suggested_brand=Subquery(best.values("candidate__brand")[:1]),
+      suggested_model=Subquery(best.values("candidate__model")[:1]),
+    )
+    .order_by("due_on", "property_appliance_id")
+  )
@@ -3,11 +3,26 @@
 #
 #
 from django import forms
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import transaction
 from django.utils import timezone
 
-from .models import Appliance, PropertyAppliance, Schedule, Usage
+from .availability import is_bookable_slot
+from .models import (
+  Appliance,
+  ApplianceType,
+  EfficiencyRating,
+  PropertyAppliance,
+  Schedule,
+  Usage,
+  UserProperty,
+)
+from .outbox import enqueue_schedule_notifications
+
+# Rows accepted by one bulk add, which inserts them in one transaction
+BULK_ADD_MAX_ROWS = 500
 
 
 #
@@ -129,6 +144,19 @@ class ScheduleForm(forms.ModelForm):
         raise ValidationError("Phone number must be at least 10 digits")
     return phone
 
+  #
+  #
+  #
+  #
+  def clean(self):
+    cleaned_data = super().clean()
+    date = cleaned_data.get("date")
+    hour = cleaned_data.get("hour")
+    minute = cleaned_data.get("minute")
+    if None not in (date, hour, minute) and not is_bookable_slot(date, hour, minute):
+      raise ValidationError("Replacements can only be booked in working hour slots")
+    return cleaned_data
+
   #
   #
   #
@@ -155,7 +183,26 @@ class ScheduleForm(forms.ModelForm):
     instance.property_appliance = self.cleaned_data["property_appliance_id"]
     instance.replacement_appliance = self.cleaned_data["replacement_appliance_id"]
     if commit:
-      instance.save()
+      self.book_slot(instance)
+    return instance
+
+  def book_slot(self, instance):
+    """
+    Saves the schedule into a free installer slot or raises ValidationError.
+    The tenant's notifications are queued in the same transaction.
+    """
+    try:
+      with transaction.atomic():
+        # Schedule.save() takes the lowest free slot_index, and the unique
+        # slot constraint settles concurrent bookings
+        instance.save()
+        if instance.slot_index >= settings.SCHEDULE_SLOT_CAPACITY:
+          raise ValidationError("This slot is fully booked")
+        enqueue_schedule_notifications(instance)
+    except ValidationError:
+      instance.pk = None
+      instance._state.adding = True
+      raise
     return instance
 
 
@@ -163,7 +210,33 @@ class ScheduleForm(forms.ModelForm):
 #
 #
 #
-class PropertyApplianceForm(forms.ModelForm):
+class UnitFieldsMixin:
+  """Validation shared by the single and bulk add forms"""
+
+  def clean_actual_cost(self):
+    actual_cost = self.cleaned_data.get("actual_cost")
+    if actual_cost is not None and actual_cost < 0:
+      raise ValidationError("Cost cannot be negative")
+    return actual_cost
+
+  def clean_actual_warranty_period(self):
+    warranty_period = self.cleaned_data.get("actual_warranty_period")
+    if warranty_period is not None and warranty_period.days < 0:
+      raise ValidationError("Warranty period cannot be negative")
+    return warranty_period
+
+  def clean_usage(self):
+    usage = self.cleaned_data.get("usage")
+    if usage not in [u.value for u in Usage]:
+      raise ValidationError("Invalid usage level")
+    return usage
+
+
+#
+#
+#
+#
+class PropertyApplianceForm(UnitFieldsMixin, forms.ModelForm):
   appliance = forms.IntegerField()
   actual_cost = forms.IntegerField(required=False)
   actual_warranty_period = forms.DurationField(required=False)
@@ -189,28 +262,18 @@ class PropertyApplianceForm(forms.ModelForm):
     except Appliance.DoesNotExist:
       raise ValidationError("Invalid appliance") from None
 
-  def clean_actual_cost(self):
-    actual_cost = self.cleaned_data.get("actual_cost")
-    if actual_cost is not None and actual_cost < 0:
-      raise ValidationError("Cost cannot be negative")
-    return actual_cost
-
-  def clean_actual_warranty_period(self):
-    warranty_period = self.cleaned_data.get("actual_warranty_period")
-    if warranty_period is not None and warranty_period.days < 0:
-      raise ValidationError("Warranty period cannot be negative")
-    return warranty_period
-
-  def clean_usage(self):
-    usage = self.cleaned_data.get("usage")
-    if usage not in [u.value for u in Usage]:
-      raise ValidationError("Invalid usage level")
-    return usage
-
   def clean(self):
     cleaned_data = super().clean()
     if not self.property_id:
       raise ValidationError("Property ID is required")
+    appliance = cleaned_data.get("appliance")
+    if (
+      appliance is not None
+      and PropertyAppliance.objects.filter(
+        property_id=self.property_id, appliance=appliance
+      ).exists()
+    ):
+      raise ValidationError("This appliance is already installed at the property")
     return cleaned_data
 
   def save(self, commit=True):
@@ -219,3 +282,173 @@ class PropertyApplianceForm(forms.ModelForm):
     if commit:
       instance.save()
     return instance
+
+
+#
+#
+#
+#
+class PropertyApplianceRowForm(UnitFieldsMixin, forms.Form):
+  appliance = forms.IntegerField()
+  actual_cost = forms.IntegerField(required=False)
+  actual_warranty_period = forms.DurationField(required=False)
+  usage = forms.ChoiceField(
+    choices=[(u.value, u.name) for u in Usage], initial=Usage.LOW.value
+  )
+
+  def has_changed(self):
+    # Unticked rows of the modal still post their usage; a row without an
+    # appliance is left out rather than rejected
+    return bool(self.data.get(self.add_prefix("appliance")))
+
+
+class BasePropertyApplianceFormSet(forms.BaseFormSet):
+  """
+  Rows of units installed at one property. The appliances of every row are
+  looked up together, rather than one query per row.
+  """
+
+  def __init__(self, *args, property_id=None, **kwargs):
+    self.property_id = property_id
+    super().__init__(*args, **kwargs)
+
+  @property
+  def rows(self):
+    return [form for form in self.forms if form.cleaned_data]
+
+  def clean(self):
+    if any(self.errors):
+      return
+    rows = self.rows
+    if not rows:
+      raise ValidationError("Select at least one appliance")
+    appliance_ids = [form.cleaned_data["appliance"] for form in rows]
+    if len(set(appliance_ids)) != len(appliance_ids):
+      raise ValidationError("Each appliance can only be added once")
+
+    appliances = Appliance.objects.in_bulk(appliance_ids)
+    installed = set(
+      PropertyAppliance.objects.filter(
+        property_id=self.property_id, appliance_id__in=appliance_ids
+      ).values_list("appliance_id", flat=True)
+    )
+    for form in rows:
+      appliance_id = form.cleaned_data["appliance"]
+      if appliance_id not in appliances:
+        form.add_error("appliance", "Invalid appliance")
+      elif appliance_id in installed:
+        form.add_error(
+          "appliance", "This appliance is already installed at the property"
+        )
+      else:
+        form.cleaned_data["appliance"] = appliances[appliance_id]
+
+  def units(self, installed_at):
+    """Unsaved units at the given property, for onboarding.install()"""
+    return [
+      PropertyAppliance(property=installed_at, **form.cleaned_data)
+      for form in self.rows
+    ]
+
+
+PropertyApplianceFormSet = forms.formset_factory(
+  PropertyApplianceRowForm,
+  formset=BasePropertyApplianceFormSet,
+  extra=0,
+  max_num=BULK_ADD_MAX_ROWS,
+  validate_max=True,
+)
+
+
+#
+#
+#
+#
+class CloneApplianceSetForm(forms.Form):
+  targets = forms.ModelMultipleChoiceField(queryset=UserProperty.objects.none())
+
+  def __init__(self, *args, user=None, source=None, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.fields["targets"].queryset = (
+      UserProperty.objects.filter(user=user)
+      .exclude(property_id=source.property_id)
+      .select_related("property")
+    )
+
+
+#
+#
+#
+#
+class ApplianceFilterForm(forms.Form):
+  q = forms.CharField(
+    max_length=100,
+    required=False,
+    widget=forms.TextInput(
+      attrs={
+        "type": "search",
+        "class": "form-control",
+        "placeholder": "Search brand or model",
+      }
+    ),
+  )
+  appliance_type = forms.ChoiceField(
+    choices=[("", "All types"), *ApplianceType.choices()],
+    required=False,
+    widget=forms.Select(attrs={"class": "form-select"}),
+  )
+  brand = forms.CharField(
+    max_length=50,
+    required=False,
+    widget=forms.Select(attrs={"class": "form-select"}),
+  )
+  efficiency_rating = forms.ChoiceField(
+    choices=[("", "All ratings"), *EfficiencyRating.choices()],
+    required=False,
+    widget=forms.Select(attrs={"class": "form-select"}),
+  )
+  min_cost = forms.IntegerField(
+    min_value=0,
+    required=False,
+    widget=forms.NumberInput(attrs={"class": "form-control", "placeholder": "Min"}),
+  )
+  max_cost = forms.IntegerField(
+    min_value=0,
+    required=False,
+    widget=forms.NumberInput(attrs={"class": "form-control", "placeholder": "Max"}),
+  )
+
+  def __init__(self, *args, **kwargs):
+    brands = kwargs.pop("brands", ())
+    super().__init__(*args, **kwargs)
+    self.fields["brand"].widget.choices = [
+      ("", "All brands"),
+      *((brand, brand) for brand in brands),
+    ]
+
+  def clean(self):
+    cleaned_data = super().clean()
+    min_cost = cleaned_data.get("min_cost")
+    max_cost = cleaned_data.get("max_cost")
+    if min_cost is not None and max_cost is not None and min_cost > max_cost:
+      raise ValidationError("Minimum cost cannot exceed maximum cost")
+    return cleaned_data
+
+  @property
+  def query(self):
+    return self.cleaned_data.get("q", "") if self.is_valid() else ""
+
+  def filter(self, queryset):
+    """Narrows the catalogue by the valid filters, ignoring invalid ones"""
+    if not self.is_valid():
+      return queryset
+    filters = {
+      "appliance_type": self.cleaned_data.get("appliance_type"),
+      "brand": self.cleaned_data.get("brand"),
+      "efficiency_rating": self.cleaned_data.get("efficiency_rating"),
+      "cost__gte": self.cleaned_data.get("min_cost"),
+      "cost__lte": self.cleaned_data.get("max_cost"),
+    }
+    return queryset.filter(
+      **{lookup: value for lookup, value in filters.items() if value not in ("", None)}
+    )
@@ -0,0 +1,58 @@
+#
+#
+#
+#
+import hashlib
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from appliance import metrics
+
+GENERATION_KEY = "fragments:generation"
+
+
+# Versioning
+#
+#
+#
+def generation():
+  return cache.get(GENERATION_KEY, 0)
+
+
+def invalidate():
+  """
+  Makes every worker render all rows again. Row keys already change with the
+  ids and updated_at stamps they render, so this is only for bulk writes that
+  change neither, such as the supplier import.
+  """
+  cache.set(GENERATION_KEY, time_ns(), timeout=None)
+
+
+def fragment_key(name, vary_on, generation):
+  """
+  Rows are keyed by the ids and updated_at stamps they render, so a write
+  re-renders only the rows showing what it changed. The local date is part of
+  the key as rows show date-relative state such as warranty cover.
+  """
+  parts = ":".join(str(value) for value in vary_on)
+  digest = hashlib.md5(parts.encode(), usedforsecurity=False).hexdigest()
+  return f"fragment:{name}:{generation}:{timezone.localdate()}:{digest}"
+
+
+# Read path
+#
+#
+#
+def get_or_render(name, vary_on, render, generation):
+  key = fragment_key(name, vary_on, generation)
+  value = cache.get(key)
+  if value is not None:
+    metrics.registry.inc("fragment_cache_requests_total", fragment=name, result="hit")
+    return value
+  metrics.registry.inc("fragment_cache_requests_total", fragment=name, result="miss")
+  value = render()
+  cache.set(key, value, settings.FRAGMENT_CACHE_TIMEOUT)
+  return value
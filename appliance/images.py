@@ -0,0 +1,163 @@
+#
+#
+#
+#
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from django.db.models.fields.json import KT
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+  from pillow_heif import register_heif_opener
+except ImportError:  # pragma: no cover - HEIC uploads are skipped without it
+  pass
+else:
+  register_heif_opener()
+
+VARIANT_WIDTHS = (64, 128, 320, 640)
+VARIANT_ROOT = "thumbs"
+VARIANT_QUALITY = 80
+
+# AVIF needs a Pillow build with libavif; WebP is always available
+Image.init()
+FORMATS = {
+  extension: (pillow_format, content_type)
+  for extension, pillow_format, content_type in (
+    ("avif", "AVIF", "image/avif"),
+    ("webp", "WEBP", "image/webp"),
+  )
+  if pillow_format in Image.SAVE
+}
+
+# Models whose uploads get variants, as {model label: (file field, variants field)}
+VARIANT_FIELDS = {
+  "appliance.appliance": ("image", "image_variants"),
+  "appliance.property": ("image", "image_variants"),
+  "appliance.user": ("profile_pic", "profile_pic_variants"),
+}
+
+
+# Variant naming
+#
+#
+#
+def content_hash(fieldfile):
+  digest = hashlib.sha256()
+  fieldfile.open("rb")
+  try:
+    for chunk in fieldfile.chunks():
+      digest.update(chunk)
+  finally:
+    fieldfile.close()
+  return digest.hexdigest()[:16]
+
+
+def variant_name(digest, width, extension):
+  return f"{VARIANT_ROOT}/{digest[:2]}/{digest}/{width}.{extension}"
+
+
+# Rendering
+#
+#
+#
+def _load(fieldfile):
+  fieldfile.open("rb")
+  try:
+    image = Image.open(fieldfile)
+    image.load()
+  finally:
+    fieldfile.close()
+  image = ImageOps.exif_transpose(image)
+  if image.mode not in ("RGB", "RGBA"):
+    image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+  return image
+
+
+def _encode(image, pillow_format):
+  buffer = BytesIO()
+  image.save(buffer, format=pillow_format, quality=VARIANT_QUALITY)
+  return buffer.getvalue()
+
+
+def generate_variants(fieldfile):
+  """
+  Writes downscaled WebP (and AVIF when supported) copies of an upload under
+  content-hashed names and returns the variants mapping stored on the model:
+
+    {"source": name, "hash": digest, "width": w, "height": h,
+     "formats": {"webp": [[width, name], ...], ...}}
+
+  Identical uploads share their variants, and already written files are reused.
+  Returns None for missing files and files Pillow cannot decode.
+  """
+  if not fieldfile:
+    return None
+  storage = fieldfile.storage
+  try:
+    digest = content_hash(fieldfile)
+    image = _load(fieldfile)
+  except (UnidentifiedImageError, OSError):
+    return None
+
+  formats = {extension: [] for extension in FORMATS}
+  widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+  for width in widths:
+    thumbnail = image.copy()
+    thumbnail.thumbnail((width, width), Image.Resampling.LANCZOS)
+    for extension, (pillow_format, _) in FORMATS.items():
+      name = variant_name(digest, width, extension)
+      if not storage.exists(name):
+        name = storage.save(name, ContentFile(_encode(thumbnail, pillow_format)))
+      formats[extension].append([thumbnail.width, name])
+
+  return {
+    "source": fieldfile.name,
+    "hash": digest,
+    "width": image.width,
+    "height": image.height,
+    "formats": formats,
+  }
+
+
+def variants_are_current(fieldfile, variants):
+  return bool(variants) and variants.get("source") == fieldfile.name
+
+
+def pending_variants(model):
+  """Saved uploads of a model whose variants are missing or from another file"""
+  file_field, variants_field = VARIANT_FIELDS[model._meta.label_lower]
+  return (
+    model._default_manager.exclude(**{file_field: ""})
+    .exclude(**{f"{file_field}__isnull": True})
+    .alias(variants_source=KT(f"{variants_field}__source"))
+    .filter(Q(variants_source__isnull=True) | ~Q(variants_source=F(file_field)))
+  )
+
+
+def refresh_variants(instance, force=False):
+  """
+  Regenerates the variants of a saved instance when its upload changed. Saves
+  through a queryset update so post_save receivers do not fire again.
+  """
+  file_field, variants_field = VARIANT_FIELDS[instance._meta.label_lower]
+  fieldfile = getattr(instance, file_field)
+  current = getattr(instance, variants_field)
+  if not fieldfile:
+    variants = {}
+  elif not force and variants_are_current(fieldfile, current):
+    return current
+  else:
+    # Undecodable uploads are remembered so they are not retried on every save
+    variants = generate_variants(fieldfile) or {"source": fieldfile.name}
+
+  setattr(instance, variants_field, variants)
+  fields = {variants_field: variants}
+  if any(field.name == "updated_at" for field in instance._meta.fields):
+    # Changes the key of cached rows showing the image
+    fields["updated_at"] = instance.updated_at = timezone.now()
+  type(instance)._default_manager.filter(pk=instance.pk).update(**fields)
+  return variants
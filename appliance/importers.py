@@ -0,0 +1,381 @@
+#
+#
+#
+#
+import csv
+import hashlib
+import json
+import mimetypes
+import operator
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from functools import reduce
+from itertools import islice
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_duration
+
+from appliance import analytics, forecasting, fragments, images, matching, search
+from appliance.models import (
+  Appliance,
+  ApplianceType,
+  EfficiencyRating,
+  PropertyAppliance,
+)
+
+IMPORT_FIELDS = ("appliance_type", "brand", "model", "cost", "efficiency_rating")
+UPDATE_FIELDS = (
+  "appliance_type",
+  "cost",
+  "warranty_period",
+  "efficiency_rating",
+  "updated_at",
+)
+IMAGE_EXTENSIONS = Appliance._meta.get_field("image").validators[0].allowed_extensions
+DOWNLOAD_TIMEOUT = 20
+
+# Feeds name types and ratings either way round, in any case
+APPLIANCE_TYPES = {
+  key.casefold(): appliance_type.name
+  for appliance_type in ApplianceType
+  for key in (appliance_type.name, appliance_type.value)
+}
+EFFICIENCY_RATINGS = {
+  key.casefold(): rating.value
+  for rating in EfficiencyRating
+  for key in (rating.name, rating.value, rating.value.replace("_", " "))
+}
+
+
+class RowError(ValueError):
+  pass
+
+
+# Reading
+#
+#
+#
+def read_rows(path, file_format=None):
+  """Yields (row number, raw dict) from a CSV or JSONL file, one line at a time"""
+  file_format = file_format or Path(path).suffix.lstrip(".").lower()
+  with open(path, newline="", encoding="utf-8-sig") as handle:
+    if file_format == "csv":
+      for number, row in enumerate(csv.DictReader(handle), start=1):
+        yield number, row
+    elif file_format in ("jsonl", "ndjson"):
+      for number, line in enumerate(handle, start=1):
+        if line.strip():
+          try:
+            yield number, json.loads(line)
+          except json.JSONDecodeError as error:
+            yield number, RowError(f"invalid JSON: {error.msg}")
+    else:
+      raise ValueError(f"Unsupported format {file_format!r}, expected csv or jsonl")
+
+
+def batched(rows, size):
+  rows = iter(rows)
+  while batch := list(islice(rows, size)):
+    yield batch
+
+
+# Validation
+#
+#
+#
+@dataclass
+class ImportRow:
+  number: int
+  values: dict
+  image_url: str = ""
+
+
+def parse_row(number, raw):
+  if isinstance(raw, Exception):
+    raise raw
+  if not isinstance(raw, dict):
+    raise RowError("expected an object")
+  raw = {key.strip().lower(): value for key, value in raw.items() if key}
+  missing = [name for name in IMPORT_FIELDS if not str(raw.get(name) or "").strip()]
+  if missing:
+    raise RowError(f"missing {', '.join(missing)}")
+
+  appliance_type = APPLIANCE_TYPES.get(str(raw["appliance_type"]).strip().casefold())
+  if appliance_type is None:
+    raise RowError(f"unknown appliance_type {raw['appliance_type']!r}")
+  efficiency_rating = EFFICIENCY_RATINGS.get(
+    str(raw["efficiency_rating"]).strip().casefold()
+  )
+  if efficiency_rating is None:
+    raise RowError(f"unknown efficiency_rating {raw['efficiency_rating']!r}")
+
+  brand = str(raw["brand"]).strip()
+  model = str(raw["model"]).strip()
+  max_length = Appliance._meta.get_field("brand").max_length
+  if len(brand) > max_length or len(model) > max_length:
+    raise RowError(f"brand and model must be at most {max_length} characters")
+
+  try:
+    cost = int(float(raw["cost"]))
+  except (TypeError, ValueError):
+    raise RowError(f"invalid cost {raw['cost']!r}") from None
+  if cost < 0:
+    raise RowError("cost cannot be negative")
+
+  warranty_period = Appliance._meta.get_field("warranty_period").default
+  warranty = str(raw.get("warranty_period") or raw.get("warranty_days") or "").strip()
+  if warranty:
+    warranty_period = (
+      timedelta(days=int(warranty)) if warranty.isdigit() else parse_duration(warranty)
+    )
+    if warranty_period is None:
+      raise RowError(f"invalid warranty_period {warranty!r}")
+
+  return ImportRow(
+    number=number,
+    values={
+      "appliance_type": appliance_type,
+      "brand": brand,
+      "model": model,
+      "cost": cost,
+      "efficiency_rating": efficiency_rating,
+      "warranty_period": warranty_period,
+    },
+    image_url=str(raw.get("image_url") or raw.get("image") or "").strip(),
+  )
+
+
+# Images
+#
+#
+#
+_sessions = threading.local()
+
+
+def _session():
+  session = getattr(_sessions, "session", None)
+  if session is None:
+    session = _sessions.session = requests.Session()
+  return session
+
+
+def download_image(url):
+  """Stores the image at url under a content-hashed name and returns the name"""
+  response = _session().get(url, timeout=DOWNLOAD_TIMEOUT)
+  response.raise_for_status()
+  content = response.content
+
+  extension = Path(urlparse(url).path).suffix.lstrip(".").lower()
+  if extension not in IMAGE_EXTENSIONS:
+    content_type = response.headers.get("Content-Type", "").split(";")[0]
+    extension = (mimetypes.guess_extension(content_type) or ".jpg").lstrip(".")
+  digest = hashlib.sha256(content).hexdigest()[:24]
+  name = f"{Appliance._meta.get_field('image').upload_to}{digest}.{extension}"
+  if not default_storage.exists(name):
+    name = default_storage.save(name, ContentFile(content))
+  return name
+
+
+# Checkpoints
+#
+#
+#
+def checkpoint_path(path):
+  return f"{path}.checkpoint"
+
+
+def read_checkpoint(path, source):
+  """Returns the number of rows already imported from source, or 0"""
+  try:
+    with open(path) as handle:
+      checkpoint = json.load(handle)
+  except (OSError, ValueError):
+    return 0
+  stat = os.stat(source)
+  if checkpoint.get("size") != stat.st_size or checkpoint.get("mtime") != stat.st_mtime:
+    # The feed changed since the failed run, so start over
+    return 0
+  return checkpoint.get("rows", 0)
+
+
+def write_checkpoint(path, source, rows):
+  stat = os.stat(source)
+  temporary = f"{path}.tmp"
+  with open(temporary, "w") as handle:
+    json.dump({"rows": rows, "size": stat.st_size, "mtime": stat.st_mtime}, handle)
+  os.replace(temporary, path)
+
+
+# Import
+#
+#
+#
+@dataclass
+class ImportResult:
+  rows: int = 0
+  imported: int = 0
+  skipped: int = 0
+  images: int = 0
+  errors: list = field(default_factory=list)
+  appliance_types: set = field(default_factory=set)
+
+
+class ApplianceImporter:
+  """
+  Streams a supplier feed into the catalogue in batches, upserting on brand
+  and model. Memory is bounded by the batch size whatever the file size.
+
+  bulk_create bypasses signals, so each batch refreshes the denormalized
+  warranty dates, replacement forecasts and property summaries itself, and
+  the run ends by rescoring the touched types and invalidating the search
+  index.
+  """
+
+  def __init__(
+    self,
+    batch_size=1000,
+    workers=8,
+    download_images=True,
+    max_errors=100,
+    progress=None,
+  ):
+    self.batch_size = batch_size
+    self.workers = workers
+    self.download_images = download_images
+    self.max_errors = max_errors
+    self.progress = progress
+
+  def run(self, path, file_format=None, resume_from=0, checkpoint=None):
+    result = ImportResult(rows=resume_from)
+    rows = read_rows(path, file_format)
+    if resume_from:
+      rows = islice(rows, resume_from, None)
+
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+      for batch in batched(rows, self.batch_size):
+        self.import_batch(batch, pool, result)
+        result.rows += len(batch)
+        if checkpoint:
+          write_checkpoint(checkpoint, path, result.rows)
+        if self.progress:
+          self.progress(result)
+
+    if result.appliance_types:
+      matching.recompute_scores(appliance_types=sorted(result.appliance_types))
+    search.invalidate_index()
+    # Variants and scores were written without signals
+    fragments.invalidate()
+    return result
+
+  def parse_batch(self, batch, result):
+    parsed = {}
+    for number, raw in batch:
+      try:
+        row = parse_row(number, raw)
+      except RowError as error:
+        result.skipped += 1
+        if len(result.errors) < self.max_errors:
+          result.errors.append((number, str(error)))
+        continue
+      # A feed listing a model twice keeps its last row
+      parsed[(row.values["brand"], row.values["model"])] = row
+    return list(parsed.values())
+
+  def fetch_images(self, rows, pool, result):
+    pending = [row for row in rows if row.image_url] if self.download_images else []
+    names = pool.map(self._download, (row.image_url for row in pending))
+    for row, outcome in zip(pending, names, strict=True):
+      if isinstance(outcome, Exception):
+        if len(result.errors) < self.max_errors:
+          result.errors.append((row.number, f"image download failed: {outcome}"))
+        continue
+      row.values["image"] = outcome
+      result.images += 1
+
+  @staticmethod
+  def _download(url):
+    try:
+      return download_image(url)
+    except (requests.RequestException, OSError) as error:
+      return error
+
+  def import_batch(self, batch, pool, result):
+    rows = self.parse_batch(batch, result)
+    if not rows:
+      return
+    self.fetch_images(rows, pool, result)
+
+    with_image = [Appliance(**row.values) for row in rows if "image" in row.values]
+    without_image = [
+      Appliance(**row.values) for row in rows if "image" not in row.values
+    ]
+    with transaction.atomic():
+      upserted = []
+      for appliances, update_fields in (
+        (with_image, [*UPDATE_FIELDS, "image"]),
+        # Rows without a downloadable image keep the one already stored
+        (without_image, list(UPDATE_FIELDS)),
+      ):
+        if appliances:
+          upserted += Appliance.objects.bulk_create(
+            appliances,
+            update_conflicts=True,
+            unique_fields=["brand", "model"],
+            update_fields=update_fields,
+          )
+      appliance_ids = self.upserted_ids(upserted)
+      installed = PropertyAppliance.objects.filter(appliance_id__in=appliance_ids)
+      installed.refresh_warranty_ends_on()
+      forecasting.forecast_replacements(list(installed.values_list("id", flat=True)))
+      analytics.refresh_property_summaries(
+        installed.values_list("property_id", flat=True).distinct()
+      )
+
+    result.imported += len(rows)
+    result.appliance_types.update(row.values["appliance_type"] for row in rows)
+    if with_image:
+      self.generate_variants(with_image, pool)
+
+  @staticmethod
+  def upserted_ids(appliances):
+    if all(appliance.pk for appliance in appliances):
+      return [appliance.pk for appliance in appliances]
+    if not appliances:
+      return []
+    # Backends that cannot return ids from an upsert; matched on the exact
+    # pairs, as separate brand and model lists would match every combination
+    return list(
+      Appliance.objects.filter(
+        reduce(
+          operator.or_,
+          (Q(brand=appliance.brand, model=appliance.model) for appliance in appliances),
+        )
+      ).values_list("id", flat=True)
+    )
+
+  def generate_variants(self, appliances, pool):
+    # Worker threads only touch storage; the database is written from here
+    stale = Appliance.objects.filter(id__in=self.upserted_ids(appliances)).only(
+      "id", "image", "image_variants"
+    )
+    stale = [
+      appliance
+      for appliance in stale
+      if not images.variants_are_current(appliance.image, appliance.image_variants)
+    ]
+    for appliance, variants in zip(
+      stale,
+      pool.map(lambda appliance: images.generate_variants(appliance.image), stale),
+      strict=True,
+    ):
+      appliance.image_variants = variants or {"source": appliance.image.name}
+    Appliance.objects.bulk_update(stale, ["image_variants"])
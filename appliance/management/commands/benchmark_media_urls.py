@@ -0,0 +1,94 @@
+#
+#
+#
+#
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from storages.backends.s3 import S3Storage
+
+from appliance.models import Appliance
+from appliance.storage import MediaStorage, url_cache
+
+
+class Command(BaseCommand):
+  help = "Measure the per-row cost of resolving media URLs with and without caching"
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--rows", type=int, default=1000, help="Number of image names resolved per pass"
+    )
+    parser.add_argument(
+      "--passes", type=int, default=5, help="Number of page renders simulated"
+    )
+
+  def storage_options(self, **overrides):
+    options = dict(settings.STORAGES["default"].get("OPTIONS", {}))
+    # Presigning is computed locally, so placeholder credentials are enough
+    options["access_key"] = options.get("access_key") or "benchmark"
+    options["secret_key"] = options.get("secret_key") or "benchmark"
+    options["bucket_name"] = options.get("bucket_name") or "benchmark"
+    options["endpoint_url"] = options.get("endpoint_url") or "https://s3.example.com"
+    options.update(overrides)
+    return options
+
+  def names(self, rows):
+    names = list(
+      Appliance.objects.exclude(image="")
+      .order_by("id")
+      .values_list("image", flat=True)[:rows]
+    )
+    names += [f"appliance_pictures/benchmark-{i}.png" for i in range(rows - len(names))]
+    return names
+
+  def per_row(self, storage, names, passes, clear=False):
+    # An untimed pass opens the connection and, unless cleared, fills the cache
+    for name in names:
+      storage.url(name)
+    elapsed = 0.0
+    for _ in range(passes):
+      if clear:
+        url_cache.clear()
+      started = time.perf_counter()
+      for name in names:
+        storage.url(name)
+      elapsed += time.perf_counter() - started
+    return elapsed / (passes * len(names)) * 1e6
+
+  def connection_setup(self, storage_class, options):
+    started = time.perf_counter()
+    storage_class(**options).connection  # noqa: B018
+    return (time.perf_counter() - started) * 1e3
+
+  def handle(self, *args, **options):
+    names = self.names(options["rows"])
+    passes = options["passes"]
+    signed = self.storage_options(querystring_auth=True)
+    public = self.storage_options(querystring_auth=False)
+
+    results = [
+      ("S3Storage, presigned", self.per_row(S3Storage(**signed), names, passes)),
+      ("S3Storage, public", self.per_row(S3Storage(**public), names, passes)),
+      (
+        "MediaStorage, presigned, cold",
+        self.per_row(MediaStorage(**signed), names, passes, clear=True),
+      ),
+      (
+        "MediaStorage, public, cold",
+        self.per_row(MediaStorage(**public), names, passes, clear=True),
+      ),
+      ("MediaStorage, warm", self.per_row(MediaStorage(**signed), names, passes)),
+    ]
+    url_cache.clear()
+
+    self.stdout.write(f"{len(names)} names x {passes} passes")
+    for label, microseconds in results:
+      self.stdout.write(f"  {label:<32} {microseconds:8.2f} us/row")
+
+    self.stdout.write("Connection setup for a new storage instance")
+    for storage_class in (S3Storage, MediaStorage):
+      # The second instance shows the cost paid once a worker is warm
+      self.connection_setup(storage_class, signed)
+      milliseconds = self.connection_setup(storage_class, signed)
+      self.stdout.write(f"  {storage_class.__name__:<32} {milliseconds:8.2f} ms")
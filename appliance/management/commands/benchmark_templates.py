@@ -0,0 +1,149 @@
+#
+#
+#
+#
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from appliance.analytics import portfolio_summary
+from appliance.availability import get_availability_context
+from appliance.forms import ApplianceFilterForm, CloneApplianceSetForm
+from appliance.matching import top_replacements
+from appliance.models import Appliance, User, UserProperty
+from appliance.template_backends import InstrumentedDjangoTemplates, app_template_names
+
+# The htmx partials requested on every modal open
+DEFAULT_TEMPLATES = (
+  "partial/property_appliances/modal/index.html",
+  "partial/property_appliances/modal/calendar.html",
+  "partial/property_appliances/modal/schedule_form.html",
+  "partial/property_view/appliance_add_modal.html",
+  "partial/property_view/appliance_row.html",
+  "partial/property_appliances/recommended_replacements.html",
+)
+
+
+class Command(BaseCommand):
+  help = (
+    "Measure the first and steady-state render time of templates with and "
+    "without the cached template loader"
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--username", required=True, help="User whose data the templates render"
+    )
+    parser.add_argument(
+      "templates",
+      nargs="*",
+      help="Template names; defaults to the modal partials, 'all' renders every one",
+    )
+    parser.add_argument(
+      "--renders", type=int, default=200, help="Steady-state renders per template"
+    )
+
+  def engine(self, cached):
+    params = settings.TEMPLATES[0]
+    loaders = settings.TEMPLATE_LOADERS
+    if cached:
+      loaders = [("django.template.loaders.cached.Loader", loaders)]
+    return InstrumentedDjangoTemplates(
+      {
+        "NAME": "benchmark",
+        "DIRS": params.get("DIRS", []),
+        "APP_DIRS": False,
+        "OPTIONS": {**params.get("OPTIONS", {}), "loaders": loaders},
+      }
+    )
+
+  def request(self, user):
+    request = RequestFactory().get("/")
+    request.user = user
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    return request
+
+  def context(self, user):
+    """One context holding every variable the views pass to the templates"""
+    user_property = (
+      UserProperty.objects.with_dashboard()
+      .filter(user=user, property__property_appliances__isnull=False)
+      .first()
+    )
+    if user_property is None:
+      raise CommandError(f"{user.username} has no property with an appliance")
+    property_appliances = list(user_property.property.property_appliances.all())
+    current = property_appliances[0]
+    recommendations = list(top_replacements(current))
+    return {
+      "user": user,
+      "user_properties": UserProperty.objects.filter(user=user).select_related(
+        "property"
+      ),
+      "portfolio": portfolio_summary(user),
+      "user_property": user_property,
+      "property": user_property.property,
+      "property_appliances": property_appliances,
+      "property_appliance": current,
+      "property_appliance_id": current.id,
+      "current_appliance": current,
+      "appliance": current.appliance,
+      "appliances": list(Appliance.objects.order_by("id")[:50]),
+      "recommendations": recommendations,
+      "matching_score": recommendations[0].score if recommendations else None,
+      "filter_form": ApplianceFilterForm(),
+      "clone_form": CloneApplianceSetForm(user=user, source=user_property),
+      **get_availability_context(),
+    }
+
+  def render(self, engine, name, context, request):
+    started = time.perf_counter()
+    engine.get_template(name).render(context, request)
+    return (time.perf_counter() - started) * 1e3
+
+  def measure(self, name, context, request, renders):
+    """(uncached, cached first, cached steady-state median) in milliseconds"""
+    uncached = self.engine(cached=False)
+    # The first uncached render also imports tag libraries; time the second
+    self.render(uncached, name, context, request)
+    uncached_ms = statistics.median(
+      self.render(uncached, name, context, request)
+      for _ in range(max(renders // 10, 3))
+    )
+    cached = self.engine(cached=True)
+    first_ms = self.render(cached, name, context, request)
+    steady_ms = statistics.median(
+      self.render(cached, name, context, request) for _ in range(renders)
+    )
+    return uncached_ms, first_ms, steady_ms
+
+  def handle(self, *args, **options):
+    try:
+      user = User.objects.get(username=options["username"])
+    except User.DoesNotExist:
+      raise CommandError(f"No user named {options['username']}") from None
+    names = options["templates"] or DEFAULT_TEMPLATES
+    if list(names) == ["all"]:
+      names = app_template_names()
+    context = self.context(user)
+    request = self.request(user)
+
+    self.stdout.write(
+      f"{'template':<58} {'uncached':>10} {'first':>10} {'steady':>10}  (ms)"
+    )
+    for name in names:
+      try:
+        uncached_ms, first_ms, steady_ms = self.measure(
+          name, context, request, options["renders"]
+        )
+      except Exception as error:  # noqa: BLE001
+        self.stdout.write(f"{name:<58} skipped: {error}")
+        continue
+      self.stdout.write(
+        f"{name:<58} {uncached_ms:10.3f} {first_ms:10.3f} {steady_ms:10.3f}"
+      )
@@ -0,0 +1,80 @@
+#
+#
+#
+#
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+
+from appliance.cache_backends import InstrumentedCacheMixin
+
+
+class Command(BaseCommand):
+  help = (
+    "Report the configured cache's hit ratio across workers, its size and a "
+    "round trip check"
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("--alias", default="default", help="Cache in CACHES")
+    parser.add_argument(
+      "--reset", action="store_true", help="Zero the shared hit and miss counters"
+    )
+
+  def round_trip(self, cache):
+    """Milliseconds to set, read back and delete a probe key"""
+    key = f"cache:probe:{get_random_string(12)}"
+    started = time.perf_counter()
+    cache.set(key, 1, timeout=60)
+    value = cache.get(key)
+    cache.delete(key)
+    elapsed = (time.perf_counter() - started) * 1e3
+    if value != 1:
+      raise CommandError("The probe key could not be read back")
+    return elapsed
+
+  def handle(self, *args, **options):
+    alias = options["alias"]
+    if alias not in settings.CACHES:
+      raise CommandError(f"No cache named {alias}")
+    cache = caches[alias]
+    if not isinstance(cache, InstrumentedCacheMixin):
+      raise CommandError(f"{alias} does not use an appliance.cache_backends backend")
+    config = settings.CACHES[alias]
+
+    self.stdout.write(f"Backend      {cache.kind} ({config['BACKEND']})")
+    self.stdout.write(f"Location     {config.get('LOCATION', '')}")
+    self.stdout.write(
+      f"Keys         prefix {cache.key_prefix!r}, version {cache.version}"
+    )
+    if cache.kind == "locmem":
+      self.stdout.write(
+        "             locmem is per process: this reports the command's own "
+        "cache; see cache_requests_total on /metrics for the workers"
+      )
+
+    try:
+      counts = cache.stats()
+      usage = cache.usage()
+      # Probed last so its own lookup is not in the counts shown
+      round_trip = self.round_trip(cache)
+    except CommandError:
+      raise
+    except Exception as error:
+      raise CommandError(f"The cache is not reachable: {error}") from error
+
+    lookups = counts["hit"] + counts["miss"]
+    ratio = f"{counts['hit'] / lookups:.1%}" if lookups else "n/a"
+    self.stdout.write(
+      f"Hit ratio    {ratio} ({counts['hit']} hits, {counts['miss']} misses)"
+    )
+    self.stdout.write(
+      f"Size         {usage['entries']} entries, {usage['bytes'] / 1024:.1f} KiB"
+    )
+    self.stdout.write(f"Round trip   {round_trip:.2f} ms")
+    if options["reset"]:
+      cache.reset_stats()
+      self.stdout.write("Hit and miss counters reset")
@@ -0,0 +1,68 @@
+#
+#
+#
+#
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from appliance.outbox import Dispatcher
+
+
+class Command(BaseCommand):
+  help = "Deliver queued tenant notifications from the outbox"
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--batch-size",
+      type=int,
+      default=None,
+      help="Rows claimed per batch (defaults to NOTIFICATION_BATCH_SIZE)",
+    )
+    parser.add_argument(
+      "--interval",
+      type=float,
+      default=5.0,
+      help="Seconds to wait before polling an empty outbox again",
+    )
+    parser.add_argument(
+      "--once",
+      action="store_true",
+      help="Deliver everything currently due, then exit",
+    )
+
+  def handle(self, *args, **options):
+    self.stopping = False
+    if not options["once"]:
+      signal.signal(signal.SIGTERM, self.stop)
+      signal.signal(signal.SIGINT, self.stop)
+
+    claimed = sent = 0
+    with Dispatcher(batch_size=options["batch_size"]) as dispatcher:
+      while not self.stopping:
+        batch_claimed, batch_sent = dispatcher.drain()
+        claimed += batch_claimed
+        sent += batch_sent
+        if batch_claimed:
+          self.stdout.write(
+            f"Delivered {batch_sent} of {batch_claimed} due notifications"
+          )
+        if options["once"]:
+          break
+        # Long running workers must not hold on to dropped connections
+        close_old_connections()
+        self.sleep(options["interval"])
+
+    failed = claimed - sent
+    style = self.style.SUCCESS if not failed else self.style.WARNING
+    self.stdout.write(style(f"Sent {sent} notifications, {failed} attempts failed"))
+
+  def stop(self, signum, frame):
+    self.stopping = True
+
+  def sleep(self, seconds):
+    deadline = time.monotonic() + seconds
+    while not self.stopping and time.monotonic() < deadline:
+      time.sleep(min(0.5, deadline - time.monotonic()))
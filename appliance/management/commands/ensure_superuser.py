@@ -0,0 +1,39 @@
+#
+#
+#
+#
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError
+
+
+class Command(BaseCommand):
+  help = (
+    "Create the superuser named by SUPERUSER_NAME with SUPERUSER_PASSWORD unless "
+    "a user with that name already exists"
+  )
+
+  # Runs on every release; the system checks would import every view and URL
+  requires_system_checks = []
+
+  def handle(self, *args, **options):
+    username = os.getenv("SUPERUSER_NAME")
+    password = os.getenv("SUPERUSER_PASSWORD")
+    if not username or not password:
+      self.stdout.write("SUPERUSER_NAME or SUPERUSER_PASSWORD is not set, skipping")
+      return
+
+    User = get_user_model()
+    if User.objects.filter(username=username).exists():
+      self.stdout.write(f"Superuser {username} already exists")
+      return
+    email = os.getenv("SUPERUSER_EMAIL", f"{username}@example.com")
+    try:
+      User.objects.create_superuser(username, email, password)
+    except IntegrityError:
+      # Another release created it between the check and the insert
+      self.stdout.write(f"Superuser {username} already exists")
+      return
+    self.stdout.write(self.style.SUCCESS(f"Created superuser {username}"))
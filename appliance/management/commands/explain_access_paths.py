@@ -0,0 +1,156 @@
+#
+#
+#
+#
+import calendar
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+from appliance.models import (
+  Appliance,
+  ApplianceType,
+  Property,
+  PropertyAppliance,
+  Schedule,
+  Usage,
+)
+
+# The migration whose indexes are compared
+INDEX_MIGRATION = ("appliance", "0031_access_path_indexes")
+
+# Seeded catalogue size, and so the number of units per seeded property
+SEED_APPLIANCES = 100
+
+
+class Rollback(Exception):
+  pass
+
+
+def access_paths(today):
+  """The queries the views and admin run, as (label, queryset) pairs"""
+  unit = (
+    PropertyAppliance.objects.order_by("id").values("id", "property_id", "appliance_id")
+  ).first() or {"id": 1, "property_id": 1, "appliance_id": 1}
+  first_day = today.replace(day=1)
+  last_day = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+  return [
+    (
+      "Unit by property and appliance",
+      PropertyAppliance.objects.filter(
+        property_id=unit["property_id"], appliance_id=unit["appliance_id"]
+      ),
+    ),
+    (
+      "Catalogue by type",
+      Appliance.objects.filter(appliance_type=ApplianceType.OVEN.name).order_by(
+        "cost", "id"
+      )[:50],
+    ),
+    ("Calendar month", Schedule.objects.filter(date__range=(first_day, last_day))),
+    ("Bookings in a slot", Schedule.objects.filter(date=today, hour=9, minute=0)),
+    (
+      "Unit's upcoming bookings",
+      Schedule.objects.filter(property_appliance_id=unit["id"], date__gte=today),
+    ),
+    (
+      "Bookings with notifications",
+      Schedule.objects.filter(notifications_enabled=True, date__gte=today).order_by(
+        "date", "hour", "minute"
+      )[:100],
+    ),
+    (
+      "Admin units by purchase date",
+      PropertyAppliance.objects.order_by("-purchase_date")[:100],
+    ),
+  ]
+
+
+class Command(BaseCommand):
+  help = (
+    "Print the query plan of each access path with and without the composite "
+    "indexes. Runs in a transaction that is rolled back, so use a development "
+    "or staging database."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--seed",
+      type=int,
+      default=0,
+      help="Number of synthetic installed units added before planning",
+    )
+
+  def seed(self, units, today):
+    appliances = Appliance.objects.bulk_create(
+      Appliance(
+        appliance_type=list(ApplianceType)[i % len(ApplianceType)].name,
+        brand="Seed",
+        model=f"Seed {i}",
+        cost=100 + i,
+      )
+      for i in range(SEED_APPLIANCES)
+    )
+    properties = Property.objects.bulk_create(
+      Property(name=f"Seed {i}", address=f"{i} Seed Street")
+      for i in range(-(-units // SEED_APPLIANCES))
+    )
+    installed = PropertyAppliance.objects.bulk_create(
+      PropertyAppliance(
+        property=properties[i // SEED_APPLIANCES],
+        appliance=appliances[i % SEED_APPLIANCES],
+        usage=Usage.MEDIUM.value,
+        purchase_date=today - timedelta(days=i % 4000),
+      )
+      for i in range(units)
+    )
+    # One booking per unit across eight hourly slots a day
+    Schedule.objects.bulk_create(
+      Schedule(
+        property_appliance=unit,
+        replacement_appliance=unit.appliance,
+        date=today + timedelta(days=i // 8),
+        hour=9 + i % 8,
+        minute=0,
+        notifications_enabled=i % 10 == 0,
+      )
+      for i, unit in enumerate(installed)
+    )
+
+  def plans(self, today):
+    with connection.cursor() as cursor:
+      cursor.execute("ANALYZE")
+    return {label: queryset.explain() for label, queryset in access_paths(today)}
+
+  def handle(self, *args, **options):
+    applied = MigrationRecorder(connection).applied_migrations()
+    if INDEX_MIGRATION not in applied:
+      raise CommandError(f"Migration {INDEX_MIGRATION[1]} has not been applied")
+
+    loader = MigrationLoader(connection)
+    migration = loader.get_migration(*INDEX_MIGRATION)
+    # unapply() takes the state before the migration
+    state = loader.project_state(INDEX_MIGRATION, at_end=False)
+    today = timezone.localdate()
+
+    try:
+      with connection.schema_editor(atomic=True) as editor:
+        if options["seed"]:
+          self.seed(options["seed"], today)
+        after = self.plans(today)
+        migration.unapply(state, editor)
+        before = self.plans(today)
+        raise Rollback
+    except Rollback:
+      pass
+
+    for label in after:
+      self.stdout.write(self.style.MIGRATE_HEADING(label))
+      for name, plans in (("before", before), ("after", after)):
+        self.stdout.write(f"  {name}:")
+        for line in plans[label].splitlines():
+          self.stdout.write(f"    {line}")
@@ -0,0 +1,70 @@
+#
+#
+#
+#
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appliance.exports import COMPRESSIONS, EXPORT_FORMATS, export_portfolio
+from appliance.models import Property
+
+
+class Command(BaseCommand):
+  help = "Stream an export of installed appliances and scheduled replacements"
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--user",
+      dest="usernames",
+      action="append",
+      help="Only export properties of this landlord (repeatable)",
+    )
+    parser.add_argument(
+      "--property",
+      dest="property_ids",
+      type=int,
+      action="append",
+      help="Only export this property (repeatable)",
+    )
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--compression", choices=sorted(COMPRESSIONS))
+    parser.add_argument(
+      "--output", "-o", help="File to write (defaults to standard output)"
+    )
+
+  def handle(self, *args, **options):
+    properties = Property.objects.all()
+    if options["usernames"]:
+      properties = properties.filter(landlords__user__username__in=options["usernames"])
+    if options["property_ids"]:
+      properties = properties.filter(id__in=options["property_ids"])
+
+    try:
+      chunks, _, _ = export_portfolio(
+        properties.distinct(),
+        file_format=options["format"],
+        compression=options["compression"],
+      )
+    except ValueError as error:
+      raise CommandError(str(error)) from error
+
+    started = time.perf_counter()
+    written = 0
+    with (
+      open(options["output"], "wb")
+      if options["output"]
+      else nullcontext(self.stdout.buffer)
+    ) as stream:
+      for chunk in chunks:
+        stream.write(chunk)
+        written += len(chunk)
+
+    if options["output"]:
+      elapsed = time.perf_counter() - started
+      self.stdout.write(
+        self.style.SUCCESS(
+          f"Wrote {written:,} bytes to {options['output']} in {elapsed:.2f}s"
+        )
+      )
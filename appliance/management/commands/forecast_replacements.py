@@ -0,0 +1,32 @@
+#
+#
+#
+#
+import time
+
+from django.core.management.base import BaseCommand
+
+from appliance.forecasting import forecast_replacements
+
+
+class Command(BaseCommand):
+  help = "Recompute the expected replacement date and cost of every installed unit"
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--chunk-size",
+      type=int,
+      default=100_000,
+      help="Number of installed units forecast per batch",
+    )
+
+  def handle(self, *args, **options):
+    started = time.perf_counter()
+    forecast_units = forecast_replacements(chunk_size=options["chunk_size"])
+    elapsed = time.perf_counter() - started
+    rate = forecast_units / elapsed if elapsed else 0
+    self.stdout.write(
+      self.style.SUCCESS(
+        f"Forecast {forecast_units} installed units in {elapsed:.2f}s ({rate:.0f}/s)"
+      )
+    )
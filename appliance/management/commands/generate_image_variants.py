@@ -0,0 +1,95 @@
+#
+#
+#
+#
+import signal
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from appliance.images import VARIANT_FIELDS, pending_variants, refresh_variants
+
+
+class Command(BaseCommand):
+  help = "Generate thumbnail variants for uploaded appliance, property and user images"
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--model",
+      action="append",
+      dest="models",
+      choices=sorted(VARIANT_FIELDS),
+      help="Only process this model (repeatable)",
+    )
+    parser.add_argument(
+      "--force",
+      action="store_true",
+      help="Regenerate variants even when they are up to date",
+    )
+    parser.add_argument(
+      "--watch",
+      action="store_true",
+      help=(
+        "Keep running and encode new uploads as they arrive, for "
+        "IMAGE_VARIANTS_INLINE=False"
+      ),
+    )
+    parser.add_argument(
+      "--interval",
+      type=float,
+      default=5.0,
+      help="Seconds to wait before looking for new uploads again",
+    )
+
+  def handle(self, *args, **options):
+    labels = options["models"] or sorted(VARIANT_FIELDS)
+    if options["watch"]:
+      self.watch(labels, options["interval"])
+      return
+
+    started = time.perf_counter()
+    processed = 0
+    for label in labels:
+      file_field, _ = VARIANT_FIELDS[label]
+      model = apps.get_model(label)
+      queryset = model._default_manager.exclude(**{file_field: ""}).exclude(
+        **{f"{file_field}__isnull": True}
+      )
+      for instance in queryset.order_by("pk").iterator(chunk_size=200):
+        refresh_variants(instance, force=options["force"])
+        processed += 1
+    elapsed = time.perf_counter() - started
+    self.stdout.write(
+      self.style.SUCCESS(f"Processed {processed} images in {elapsed:.2f}s")
+    )
+
+  def refresh_pending(self, labels):
+    processed = 0
+    for label in labels:
+      pending = pending_variants(apps.get_model(label)).order_by("pk")
+      for instance in pending.iterator(chunk_size=200):
+        refresh_variants(instance)
+        processed += 1
+    return processed
+
+  def watch(self, labels, interval):
+    self.stopping = False
+    signal.signal(signal.SIGTERM, self.stop)
+    signal.signal(signal.SIGINT, self.stop)
+    while not self.stopping:
+      processed = self.refresh_pending(labels)
+      if processed:
+        self.stdout.write(f"Processed {processed} new images")
+      # Long running workers must not hold on to dropped connections
+      close_old_connections()
+      self.sleep(interval)
+
+  def stop(self, signum, frame):
+    self.stopping = True
+
+  def sleep(self, seconds):
+    deadline = time.monotonic() + seconds
+    while not self.stopping and time.monotonic() < deadline:
+      time.sleep(min(0.5, deadline - time.monotonic()))
@@ -0,0 +1,95 @@
+#
+#
+#
+#
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appliance.importers import ApplianceImporter, checkpoint_path, read_checkpoint
+
+
+class Command(BaseCommand):
+  help = "Stream a CSV or JSONL supplier feed into the appliance catalogue"
+
+  def add_arguments(self, parser):
+    parser.add_argument("path", help="CSV or JSONL file to import")
+    parser.add_argument(
+      "--format",
+      choices=["csv", "jsonl"],
+      help="File format (defaults to the file extension)",
+    )
+    parser.add_argument(
+      "--batch-size", type=int, default=1000, help="Rows upserted per transaction"
+    )
+    parser.add_argument(
+      "--workers", type=int, default=8, help="Concurrent image downloads"
+    )
+    parser.add_argument(
+      "--skip-images", action="store_true", help="Do not download image_url columns"
+    )
+    parser.add_argument(
+      "--checkpoint",
+      help="Checkpoint file recording progress (defaults to <path>.checkpoint)",
+    )
+    parser.add_argument(
+      "--restart",
+      action="store_true",
+      help="Ignore an existing checkpoint and import from the first row",
+    )
+    parser.add_argument(
+      "--max-errors",
+      type=int,
+      default=100,
+      help="Number of rejected rows reported",
+    )
+
+  def handle(self, *args, **options):
+    path = options["path"]
+    if not os.path.isfile(path):
+      raise CommandError(f"{path} does not exist")
+    checkpoint = options["checkpoint"] or checkpoint_path(path)
+    resume_from = 0 if options["restart"] else read_checkpoint(checkpoint, path)
+    if resume_from:
+      self.stdout.write(f"Resuming after row {resume_from}")
+
+    started = time.perf_counter()
+
+    def progress(result):
+      rate = (result.rows - resume_from) / max(time.perf_counter() - started, 1e-9)
+      self.stdout.write(
+        f"{result.rows} rows read, {result.imported} imported, "
+        f"{result.skipped} rejected ({rate:,.0f} rows/s)"
+      )
+
+    importer = ApplianceImporter(
+      batch_size=options["batch_size"],
+      workers=options["workers"],
+      download_images=not options["skip_images"],
+      max_errors=options["max_errors"],
+      progress=progress if options["verbosity"] else None,
+    )
+    try:
+      result = importer.run(
+        path,
+        file_format=options["format"],
+        resume_from=resume_from,
+        checkpoint=checkpoint,
+      )
+    except ValueError as error:
+      raise CommandError(str(error)) from error
+
+    if os.path.exists(checkpoint):
+      os.remove(checkpoint)
+    for number, message in result.errors:
+      self.stderr.write(f"Row {number}: {message}")
+
+    elapsed = time.perf_counter() - started
+    rate = (result.rows - resume_from) / max(elapsed, 1e-9)
+    self.stdout.write(
+      self.style.SUCCESS(
+        f"Imported {result.imported} appliances ({result.images} images, "
+        f"{result.skipped} rejected rows) in {elapsed:.2f}s, {rate:,.0f} rows/s"
+      )
+    )
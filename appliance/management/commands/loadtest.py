@@ -0,0 +1,225 @@
+#
+#
+#
+#
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from appliance.models import PropertyAppliance, User
+
+STARTUP_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+  help = (
+    "Load test the htmx modal endpoints and report requests/s and latency. "
+    "Starts gunicorn in each serving mode in turn, or targets a running server."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("--username", required=True, help="User the requests run as")
+    parser.add_argument(
+      "--modes",
+      nargs="+",
+      choices=["wsgi", "asgi"],
+      default=["wsgi", "asgi"],
+      help="Serving modes compared",
+    )
+    parser.add_argument(
+      "--url", help="http:// URL of a running server to test instead of starting one"
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers")
+    parser.add_argument(
+      "--concurrency", type=int, default=32, help="Requests in flight at once"
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+
+  # Requests
+  #
+  #
+  #
+  def session_cookies(self, user):
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    csrf_token = get_random_string(CSRF_SECRET_LENGTH, allowed_chars=CSRF_ALLOWED_CHARS)
+    cookie = (
+      f"{settings.SESSION_COOKIE_NAME}={session.session_key}; "
+      f"{settings.CSRF_COOKIE_NAME}={csrf_token}"
+    )
+    return {"Cookie": cookie, "X-CSRFToken": csrf_token}, session
+
+  def endpoints(self, user):
+    """(method, path, body) of each modal endpoint, requested in turn"""
+    unit = (
+      PropertyAppliance.objects.filter(property__landlords__user=user)
+      .values("property_id", "appliance_id", "property__landlords__id")
+      .first()
+    )
+    if unit is None:
+      raise CommandError(f"{user.username} has no property with an appliance")
+    return [
+      ("GET", reverse("get_month_dates"), None),
+      (
+        "POST",
+        reverse("add_property_appliance", args=[unit["property__landlords__id"]]),
+        "",
+      ),
+      (
+        "POST",
+        reverse(
+          "appliance_replacement_modal",
+          args=[unit["property_id"], unit["appliance_id"]],
+        ),
+        urlencode({"appliance_id": unit["appliance_id"]}),
+      ),
+    ]
+
+  def run(self, host, port, endpoints, headers, total, concurrency):
+    """Returns (elapsed seconds, sorted latencies, failed requests)"""
+    issued = iter(range(total))
+    lock = threading.Lock()
+
+    def client():
+      connection = http.client.HTTPConnection(host, port, timeout=60)
+      latencies, failures = [], 0
+      while True:
+        with lock:
+          index = next(issued, None)
+        if index is None:
+          break
+        method, path, body = endpoints[index % len(endpoints)]
+        request_headers = dict(headers)
+        if body is not None:
+          request_headers["Content-Type"] = "application/x-www-form-urlencoded"
+        started = time.perf_counter()
+        try:
+          connection.request(method, path, body=body, headers=request_headers)
+          response = connection.getresponse()
+          response.read()
+          failures += response.status >= 400
+        except (OSError, http.client.HTTPException):
+          failures += 1
+          connection.close()
+        latencies.append(time.perf_counter() - started)
+      connection.close()
+      return latencies, failures
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+      results = list(pool.map(lambda _: client(), range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for result in results for latency in result[0])
+    return elapsed, latencies, sum(result[1] for result in results)
+
+  # Server
+  #
+  #
+  #
+  def start_server(self, mode, port, workers):
+    env = {
+      **os.environ,
+      "SERVER_MODE": mode,
+      "PORT": str(port),
+      "WEB_CONCURRENCY": str(workers),
+      "ALLOWED_HOSTS": '["127.0.0.1"]',
+    }
+    server = subprocess.Popen(
+      [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py"],
+      cwd=settings.BASE_DIR,
+      env=env,
+      stdout=subprocess.DEVNULL,
+      stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+      if server.poll() is not None:
+        raise CommandError(f"gunicorn exited with status {server.returncode}")
+      try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        return server
+      except OSError:
+        time.sleep(0.2)
+    server.terminate()
+    raise CommandError(f"gunicorn did not start within {STARTUP_TIMEOUT}s")
+
+  def stop_server(self, server):
+    server.terminate()
+    try:
+      server.wait(timeout=STARTUP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+      server.kill()
+
+  # Report
+  #
+  #
+  #
+  def report(self, label, elapsed, latencies, failures):
+    count = len(latencies)
+
+    def percentile(share):
+      return latencies[min(count - 1, int(count * share))] * 1000
+
+    self.stdout.write(
+      f"  {label:<8} {count / elapsed:9.1f} req/s  p50 {percentile(0.5):8.1f} ms"
+      f"  p99 {percentile(0.99):8.1f} ms  errors {failures}"
+    )
+
+  def handle(self, *args, **options):
+    try:
+      user = User.objects.get(username=options["username"])
+    except User.DoesNotExist:
+      raise CommandError(f"No user named {options['username']}") from None
+    endpoints = self.endpoints(user)
+    headers, session = self.session_cookies(user)
+    total, concurrency = options["requests"], options["concurrency"]
+
+    self.stdout.write(
+      f"{total} requests, {concurrency} in flight, across {len(endpoints)} endpoints"
+    )
+    try:
+      if options["url"]:
+        target = urlsplit(options["url"])
+        host, port = target.hostname, target.port or 80
+        headers["Host"] = target.netloc
+        self.run(host, port, endpoints, headers, len(endpoints) * 2, 1)
+        self.report(
+          "target", *self.run(host, port, endpoints, headers, total, concurrency)
+        )
+        return
+
+      for mode in options["modes"]:
+        server = self.start_server(mode, options["port"], options["workers"])
+        try:
+          # Warm each worker's caches and connections before timing
+          self.run(
+            "127.0.0.1", options["port"], endpoints, headers, concurrency, concurrency
+          )
+          self.report(
+            mode,
+            *self.run(
+              "127.0.0.1", options["port"], endpoints, headers, total, concurrency
+            ),
+          )
+        finally:
+          self.stop_server(server)
+    finally:
+      session.delete()
@@ -0,0 +1,47 @@
+#
+#
+#
+#
+import time
+
+from django.core.management.base import BaseCommand
+
+from appliance.matching import recompute_scores
+from appliance.models import ApplianceType
+
+
+class Command(BaseCommand):
+  help = "Recompute the cached replacement scores for installed appliances"
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--type",
+      action="append",
+      dest="appliance_types",
+      choices=[appliance_type.name for appliance_type in ApplianceType],
+      help="Only recompute units of this appliance type (repeatable)",
+    )
+    parser.add_argument(
+      "--chunk-size",
+      type=int,
+      default=1000,
+      help="Number of installed units scored per batch",
+    )
+    parser.add_argument(
+      "--top-k",
+      type=int,
+      default=None,
+      help="Number of replacements kept per unit (defaults to MATCHING_TOP_K)",
+    )
+
+  def handle(self, *args, **options):
+    started = time.perf_counter()
+    scored_units = recompute_scores(
+      appliance_types=options["appliance_types"],
+      chunk_size=options["chunk_size"],
+      top_k_size=options["top_k"],
+    )
+    elapsed = time.perf_counter() - started
+    self.stdout.write(
+      self.style.SUCCESS(f"Scored {scored_units} installed units in {elapsed:.2f}s")
+    )
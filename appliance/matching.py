@@ -0,0 +1,419 @@
+#
+#
+#
+#
+import operator
+from functools import reduce
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appliance.models import (
+  Appliance,
+  EfficiencyRating,
+  PropertyAppliance,
+  ReplacementScore,
+  Usage,
+)
+
+# Ordinal encodings
+#
+#
+#
+EFFICIENCY_LEVELS = {
+  rating.value: level for level, rating in enumerate(EfficiencyRating)
+}
+USAGE_LEVELS = {usage.value: level for level, usage in enumerate(Usage)}
+MAX_EFFICIENCY_LEVEL = len(EFFICIENCY_LEVELS) - 1
+MAX_USAGE_LEVEL = len(USAGE_LEVELS) - 1
+
+
+# Score matrix
+#
+#
+#
+def score_matrix(
+  current_cost,
+  current_efficiency,
+  usage,
+  candidate_cost,
+  candidate_efficiency,
+  candidate_warranty_days,
+  longest_warranty=None,
+):
+  """
+  Scores every candidate against every installed unit in one batched pass.
+
+  Unit arrays have shape (units,) and candidate arrays (candidates,); the result
+  is a (units, candidates) float32 matrix in [0, 1]. Heavier usage shifts weight
+  from cost towards efficiency. Warranties are scored against the longest of
+  the candidates given, unless longest_warranty says otherwise.
+  """
+  current_cost = np.maximum(current_cost.astype(np.float32), 1.0)[:, None]
+  cost_delta = (
+    candidate_cost.astype(np.float32)[None, :] - current_cost
+  ) / current_cost
+  cost_score = np.clip(0.5 - 0.5 * cost_delta, 0.0, 1.0)
+
+  efficiency_delta = (
+    candidate_efficiency.astype(np.float32)[None, :]
+    - current_efficiency.astype(np.float32)[:, None]
+  )
+  efficiency_score = np.clip(
+    0.5 + efficiency_delta / (2 * MAX_EFFICIENCY_LEVEL), 0.0, 1.0
+  )
+
+  if longest_warranty is None:
+    longest_warranty = float(candidate_warranty_days.max(initial=0))
+  longest_warranty = max(longest_warranty, 1.0)
+  warranty_score = (candidate_warranty_days.astype(np.float32) / longest_warranty)[
+    None, :
+  ]
+
+  intensity = (usage.astype(np.float32) / MAX_USAGE_LEVEL)[:, None]
+  cost_weight = 0.45 - 0.15 * intensity
+  efficiency_weight = 0.25 + 0.25 * intensity
+  warranty_weight = 0.30 - 0.10 * intensity
+
+  return (
+    cost_weight * cost_score
+    + efficiency_weight * efficiency_score
+    + warranty_weight * warranty_score
+  ).astype(np.float32)
+
+
+# Top-K selection
+#
+#
+#
+def top_k(scores, k):
+  """Returns (indices, scores) of the k best columns per row, best first"""
+  k = min(k, scores.shape[1])
+  if k < scores.shape[1]:
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+  else:
+    indices = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+  top_scores = np.take_along_axis(scores, indices, axis=1)
+  order = np.argsort(-top_scores, axis=1, kind="stable")
+  return (
+    np.take_along_axis(indices, order, axis=1),
+    np.take_along_axis(top_scores, order, axis=1),
+  )
+
+
+# Batch recompute
+#
+#
+#
+def _load_candidates(appliance_type):
+  rows = list(
+    Appliance.objects.filter(appliance_type=appliance_type).values_list(
+      "id", "cost", "efficiency_rating", "warranty_period"
+    )
+  )
+  return (
+    np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+    np.fromiter((row[1] for row in rows), dtype=np.float32, count=len(rows)),
+    np.fromiter(
+      (EFFICIENCY_LEVELS.get(row[2], 0) for row in rows),
+      dtype=np.float32,
+      count=len(rows),
+    ),
+    np.fromiter(
+      (row[3].total_seconds() / 86400 for row in rows),
+      dtype=np.float32,
+      count=len(rows),
+    ),
+  )
+
+
+def _score_chunk(rows, candidates, k):
+  candidate_ids, candidate_cost, candidate_efficiency, candidate_warranty = candidates
+  unit_ids = np.array([row[0] for row in rows], dtype=np.int64)
+  current_ids = np.array([row[1] for row in rows], dtype=np.int64)
+  scores = score_matrix(
+    np.array([row[2] for row in rows], dtype=np.float32),
+    np.array([EFFICIENCY_LEVELS.get(row[3], 0) for row in rows], dtype=np.float32),
+    np.array([USAGE_LEVELS.get(row[4], 0) for row in rows], dtype=np.float32),
+    candidate_cost,
+    candidate_efficiency,
+    candidate_warranty,
+  )
+  # A unit is never recommended as its own replacement
+  scores[current_ids[:, None] == candidate_ids[None, :]] = -np.inf
+
+  indices, top_scores = top_k(scores, k)
+  scored = []
+  for row, unit_id in enumerate(unit_ids.tolist()):
+    for index, score in zip(
+      indices[row].tolist(), top_scores[row].tolist(), strict=True
+    ):
+      if score == -np.inf:
+        continue
+      scored.append(
+        ReplacementScore(
+          property_appliance_id=unit_id,
+          candidate_id=int(candidate_ids[index]),
+          score=round(score, 6),
+        )
+      )
+  return scored
+
+
+def recompute_scores(
+  appliance_types=None, property_appliance_ids=None, chunk_size=1000, top_k_size=None
+):
+  """
+  Recomputes the cached top-K replacement scores and returns the number of
+  installed units scored. Without filters the whole fleet is recomputed.
+  """
+  k = top_k_size or settings.MATCHING_TOP_K
+  units = PropertyAppliance.objects.all()
+  if property_appliance_ids is not None:
+    units = units.filter(id__in=property_appliance_ids)
+  if appliance_types is None:
+    appliance_types = units.values_list("appliance__appliance_type", flat=True)
+    appliance_types = sorted(set(appliance_types))
+
+  scored_units = 0
+  for appliance_type in appliance_types:
+    candidates = _load_candidates(appliance_type)
+    rows = _unit_rows(units, appliance_type)
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+      chunk.append(row)
+      if len(chunk) >= chunk_size:
+        _write_chunk(chunk, candidates, k)
+        scored_units += len(chunk)
+        chunk = []
+    if chunk:
+      _write_chunk(chunk, candidates, k)
+      scored_units += len(chunk)
+  return scored_units
+
+
+def _unit_rows(units, appliance_type):
+  return (
+    units.filter(appliance__appliance_type=appliance_type)
+    .annotate(effective_cost=Coalesce("actual_cost", "appliance__cost"))
+    .order_by("id")
+    .values_list(
+      "id", "appliance_id", "effective_cost", "appliance__efficiency_rating", "usage"
+    )
+  )
+
+
+def _write_chunk(rows, candidates, k):
+  scored = _score_chunk(rows, candidates, k) if len(candidates[0]) else []
+  unit_ids = [row[0] for row in rows]
+  with transaction.atomic():
+    ReplacementScore.objects.filter(property_appliance_id__in=unit_ids).delete()
+    ReplacementScore.objects.bulk_create(scored, batch_size=1000)
+    # Units without candidates are scored too, just with nothing to show
+    PropertyAppliance.objects.filter(id__in=unit_ids).update(
+      scores_computed_at=timezone.now()
+    )
+
+
+# Incremental updates
+#
+#
+#
+def _longest_warranty(appliance_type, exclude_id):
+  """Longest warranty in days of the type's candidates other than exclude_id"""
+  longest = (
+    Appliance.objects.filter(appliance_type=appliance_type)
+    .exclude(id=exclude_id)
+    .aggregate(longest=Max("warranty_period"))["longest"]
+  )
+  return _days(longest)
+
+
+def _days(warranty_period):
+  return warranty_period.total_seconds() / 86400 if warranty_period else 0.0
+
+
+def _rescore_units_listing(appliance_id, appliance_type):
+  """Drops a candidate from the units of a type that list it, refilling them"""
+  unit_ids = list(
+    ReplacementScore.objects.filter(
+      candidate_id=appliance_id,
+      property_appliance__appliance__appliance_type=appliance_type,
+    ).values_list("property_appliance_id", flat=True)
+  )
+  if not unit_ids:
+    return 0
+  return recompute_scores(
+    appliance_types=[appliance_type], property_appliance_ids=unit_ids
+  )
+
+
+def recompute_for_appliance(
+  appliance,
+  previous_type=None,
+  previous_warranty=None,
+  previous_cost=None,
+  previous_rating=None,
+  chunk_size=1000,
+):
+  """
+  Merges a changed catalogue row into the cached top-K of the units it can
+  replace. The row alone is scored against those units; a unit is only
+  rescored in full when the row fell out of its top-K and another candidate
+  may take its place. A new longest warranty of the type moves every score,
+  so that case recomputes the type, and the units with the row installed are
+  rescored in full when its type, cost or rating changed. Returns the number
+  of units updated.
+  """
+  k = settings.MATCHING_TOP_K
+  appliance_type = appliance.appliance_type
+  rescored = 0
+  type_changed = previous_type is not None and previous_type != appliance_type
+  if type_changed:
+    rescored += _rescore_units_listing(appliance.id, previous_type)
+    previous_warranty = None
+
+  others_longest = _longest_warranty(appliance_type, appliance.id)
+  longest = max(others_longest, _days(appliance.warranty_period))
+  previous_longest = max(others_longest, _days(previous_warranty))
+  if previous_longest != longest:
+    return rescored + recompute_scores(appliance_types=[appliance_type])
+
+  if (
+    type_changed
+    or (previous_cost is not None and previous_cost != appliance.cost)
+    or (previous_rating is not None and previous_rating != appliance.efficiency_rating)
+  ):
+    # The installed units' own cost and rating score every candidate
+    rescored += recompute_scores(
+      appliance_types=[appliance_type],
+      property_appliance_ids=PropertyAppliance.objects.filter(
+        appliance_id=appliance.id
+      ).values_list("id", flat=True),
+    )
+
+  candidate = (
+    np.array([appliance.id], dtype=np.int64),
+    np.array([appliance.cost], dtype=np.float32),
+    np.array([EFFICIENCY_LEVELS.get(appliance.efficiency_rating, 0)], np.float32),
+    np.array([_days(appliance.warranty_period)], dtype=np.float32),
+  )
+  rows = _unit_rows(PropertyAppliance.objects.all(), appliance_type)
+  chunk = []
+  for row in rows.iterator(chunk_size=chunk_size):
+    chunk.append(row)
+    if len(chunk) >= chunk_size:
+      rescored += _merge_candidate(chunk, candidate, appliance_type, longest, k)
+      chunk = []
+  if chunk:
+    rescored += _merge_candidate(chunk, candidate, appliance_type, longest, k)
+  return rescored
+
+
+def _merge_candidate(rows, candidate, appliance_type, longest_warranty, k):
+  candidate_id = int(candidate[0][0])
+  rows = [row for row in rows if row[1] != candidate_id]
+  if not rows:
+    return 0
+  scores = score_matrix(
+    np.array([row[2] for row in rows], dtype=np.float32),
+    np.array([EFFICIENCY_LEVELS.get(row[3], 0) for row in rows], dtype=np.float32),
+    np.array([USAGE_LEVELS.get(row[4], 0) for row in rows], dtype=np.float32),
+    *candidate[1:],
+    longest_warranty=longest_warranty,
+  )[:, 0]
+
+  listed = {}
+  for unit_id, listed_id, score in ReplacementScore.objects.filter(
+    property_appliance_id__in=[row[0] for row in rows]
+  ).values_list("property_appliance_id", "candidate_id", "score"):
+    listed.setdefault(unit_id, {})[listed_id] = score
+
+  upserts, evicted, rescore = [], [], []
+  for row, score in zip(rows, scores.tolist(), strict=True):
+    unit_id = row[0]
+    score = round(score, 6)
+    entries = listed.get(unit_id, {})
+    # A list shorter than k already holds every candidate of the type
+    full = len(entries) >= k
+    lowest = min(entries.values(), default=None)
+    if candidate_id in entries:
+      if full and score < lowest:
+        # Candidates outside the list may now rank above it
+        rescore.append(unit_id)
+        continue
+    elif full:
+      if score <= lowest:
+        continue
+      evicted.append(
+        (unit_id, min(entries, key=lambda listed_id: (entries[listed_id], -listed_id)))
+      )
+    upserts.append(
+      ReplacementScore(
+        property_appliance_id=unit_id, candidate_id=candidate_id, score=score
+      )
+    )
+
+  with transaction.atomic():
+    if evicted:
+      ReplacementScore.objects.filter(
+        reduce(
+          operator.or_,
+          (
+            Q(property_appliance_id=unit_id, candidate_id=listed_id)
+            for unit_id, listed_id in evicted
+          ),
+        )
+      ).delete()
+    ReplacementScore.objects.bulk_create(
+      upserts,
+      batch_size=1000,
+      update_conflicts=True,
+      unique_fields=["property_appliance", "candidate"],
+      update_fields=["score", "computed_at"],
+    )
+  if rescore:
+    recompute_scores(appliance_types=[appliance_type], property_appliance_ids=rescore)
+  return len(upserts) + len(rescore)
+
+
+def remove_candidate(appliance, unit_ids):
+  """
+  Refills the top-K of the units that listed a deleted catalogue row, or
+  recomputes its type when it held the longest warranty
+  """
+  appliance_type = appliance.appliance_type
+  if _days(appliance.warranty_period) > _longest_warranty(appliance_type, None):
+    return recompute_scores(appliance_types=[appliance_type])
+  if not unit_ids:
+    return 0
+  return recompute_scores(
+    appliance_types=[appliance_type], property_appliance_ids=unit_ids
+  )
+
+
+def recompute_for_property_appliance(property_appliance):
+  return recompute_scores(
+    appliance_types=[property_appliance.appliance.appliance_type],
+    property_appliance_ids=[property_appliance.id],
+  )
+
+
+# Read path
+#
+#
+#
+def top_replacements(property_appliance, limit=None):
+  """Returns the cached top-K replacements, scoring the unit on first access"""
+  limit = limit or settings.MATCHING_TOP_K
+  recommendations = ReplacementScore.objects.filter(
+    property_appliance=property_appliance
+  ).select_related("candidate")
+  # Checked rather than the scores, as a unit without candidates has none
+  if property_appliance.scores_computed_at is None:
+    recompute_for_property_appliance(property_appliance)
+  return recommendations.order_by("-score", "candidate_id")[:limit]
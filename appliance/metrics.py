@@ -0,0 +1,185 @@
+#
+#
+#
+#
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 15, 25, 50, 100, 250)
+
+
+# Per-request counters
+#
+#
+#
+@dataclass
+class RequestStats:
+  started: float = field(default_factory=time.perf_counter)
+  queries: int = 0
+  db_time: float = 0.0
+  template_time: float = 0.0
+  s3_calls: int = 0
+
+  @property
+  def duration(self):
+    return time.perf_counter() - self.started
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def start_request():
+  stats = RequestStats()
+  return stats, _current.set(stats)
+
+
+def finish_request(token):
+  _current.reset(token)
+
+
+def current_stats():
+  return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+  """Database execute wrapper adding each query's count and time to the request"""
+  stats = _current.get()
+  if stats is None:
+    return execute(sql, params, many, context)
+  started = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    stats.queries += 1
+    stats.db_time += time.perf_counter() - started
+
+
+def record_template(duration):
+  stats = _current.get()
+  if stats is not None:
+    stats.template_time += duration
+
+
+def record_s3_call(**kwargs):
+  """botocore before-call handler"""
+  stats = _current.get()
+  if stats is not None:
+    stats.s3_calls += 1
+  registry.inc(
+    "s3_calls_total", operation=getattr(kwargs.get("model"), "name", "unknown")
+  )
+
+
+# Registry
+#
+#
+#
+class Registry:
+  """
+  Process-local Prometheus registry of counters and histograms. Each worker
+  exposes its own samples; Prometheus sums them across scrape targets.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._help = {}
+    self._counters = defaultdict(float)
+    self._histograms = {}
+
+  def describe(self, name, help_text):
+    self._help[name] = help_text
+
+  def inc(self, name, value=1, **labels):
+    with self._lock:
+      self._counters[(name, tuple(sorted(labels.items())))] += value
+
+  def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self._lock:
+      histogram = self._histograms.get(key)
+      if histogram is None:
+        histogram = self._histograms[key] = {
+          "buckets": buckets,
+          "counts": [0] * len(buckets),
+          "sum": 0.0,
+          "count": 0,
+        }
+      for index, bound in enumerate(histogram["buckets"]):
+        if value <= bound:
+          histogram["counts"][index] += 1
+      histogram["sum"] += value
+      histogram["count"] += 1
+
+  def value(self, name, **labels):
+    return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+  def reset(self):
+    with self._lock:
+      self._counters.clear()
+      self._histograms.clear()
+
+  def render(self):
+    """Returns the samples in the Prometheus text exposition format"""
+    with self._lock:
+      counters = sorted(self._counters.items())
+      histograms = sorted(
+        (key, {**value, "counts": list(value["counts"])})
+        for key, value in self._histograms.items()
+      )
+
+    lines = []
+    described = set()
+
+    def header(name, kind):
+      if name not in described:
+        described.add(name)
+        if name in self._help:
+          lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+      header(name, "counter")
+      lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    for (name, labels), histogram in histograms:
+      header(name, "histogram")
+      for bound, count in zip(histogram["buckets"], histogram["counts"], strict=True):
+        bucket_labels = (*labels, ("le", _number(bound)))
+        lines.append(f"{name}_bucket{_labels(bucket_labels)} {count}")
+      inf_labels = (*labels, ("le", "+Inf"))
+      lines.append(f"{name}_bucket{_labels(inf_labels)} {histogram['count']}")
+      lines.append(f"{name}_sum{_labels(labels)} {_number(histogram['sum'])}")
+      lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+  if not labels:
+    return ""
+  pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+  return f"{{{pairs}}}"
+
+
+def _escape(value):
+  return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+registry.describe("http_requests_total", "Requests served, by view, method and status")
+registry.describe("http_request_duration_seconds", "Wall time per request")
+registry.describe("db_queries_per_request", "Database queries per request")
+registry.describe("db_duration_seconds", "Database time per request")
+registry.describe("template_render_seconds", "Template render time per request")
+registry.describe("s3_calls_total", "S3 API calls, by operation")
+registry.describe("view_budget_violations_total", "Requests over a view budget")
+registry.describe("cache_requests_total", "Cache lookups, by backend and result")
+registry.describe(
+  "fragment_cache_requests_total", "Template fragment lookups, by fragment and result"
+)
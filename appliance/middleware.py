@@ -0,0 +1,147 @@
+#
+#
+#
+#
+import json
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from appliance import metrics
+
+logger = logging.getLogger("appliance.metrics")
+
+
+# Request metrics
+#
+#
+#
+class RequestMetricsMiddleware:
+  """
+  Records wall time, database queries and time, template render time and S3
+  calls for every request. Each request is logged as one JSON line, added to
+  the /metrics registry and checked against settings.VIEW_BUDGETS.
+  """
+
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    if iscoroutinefunction(get_response):
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if iscoroutinefunction(self):
+      return self.__acall__(request)
+    stats, token = metrics.start_request()
+    try:
+      with ExitStack() as stack:
+        self.wrap_connections(stack)
+        response = self.get_response(request)
+    finally:
+      metrics.finish_request(token)
+    return self.finish(request, response, stats)
+
+  async def __acall__(self, request):
+    stats, token = metrics.start_request()
+    # Connections belong to a thread, and under ASGI the ORM runs in the
+    # request's sync thread rather than on the event loop
+    stack = ExitStack()
+    try:
+      await sync_to_async(self.wrap_connections)(stack)
+      response = await self.get_response(request)
+    finally:
+      await sync_to_async(stack.close)()
+      metrics.finish_request(token)
+    return self.finish(request, response, stats)
+
+  def wrap_connections(self, stack):
+    for connection in connections.all():
+      stack.enter_context(connection.execute_wrapper(metrics.record_query))
+
+  def finish(self, request, response, stats):
+    match = getattr(request, "resolver_match", None)
+    view = match.url_name if match and match.url_name else "unresolved"
+    if view != "metrics":
+      self.record(request, response, view, stats)
+    return response
+
+  def record(self, request, response, view, stats):
+    duration = stats.duration
+    registry = metrics.registry
+    registry.inc(
+      "http_requests_total",
+      view=view,
+      method=request.method,
+      status=response.status_code,
+    )
+    registry.observe("http_request_duration_seconds", duration, view=view)
+    registry.observe(
+      "db_queries_per_request", stats.queries, metrics.QUERY_BUCKETS, view=view
+    )
+    registry.observe("db_duration_seconds", stats.db_time, view=view)
+    registry.observe("template_render_seconds", stats.template_time, view=view)
+
+    sample = {
+      "view": view,
+      "method": request.method,
+      "path": request.path,
+      "status": response.status_code,
+      "duration_ms": round(duration * 1000, 2),
+      "queries": stats.queries,
+      "db_ms": round(stats.db_time * 1000, 2),
+      "template_ms": round(stats.template_time * 1000, 2),
+      "s3_calls": stats.s3_calls,
+    }
+    logger.info(json.dumps(sample))
+
+    budget = settings.VIEW_BUDGETS.get(view, {})
+    violations = {
+      metric: {"limit": limit, "actual": sample[metric]}
+      for metric, limit in budget.items()
+      if sample.get(metric) is not None and sample[metric] > limit
+    }
+    for metric in violations:
+      registry.inc("view_budget_violations_total", view=view, metric=metric)
+    if violations:
+      logger.warning(
+        json.dumps({"event": "budget_exceeded", **sample, "violations": violations})
+      )
+
+
+# Static files
+#
+#
+#
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+  """
+  WhiteNoise that also runs on the event loop, so under ASGI the rest of the
+  middleware chain and async views are not pushed into a thread.
+  """
+
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response=None, settings=settings):
+    super().__init__(get_response, settings)
+    if iscoroutinefunction(get_response):
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if iscoroutinefunction(self):
+      return self.__acall__(request)
+    return super().__call__(request)
+
+  async def __acall__(self, request):
+    if self.autorefresh:
+      static_file = await sync_to_async(self.find_file)(request.path_info)
+    else:
+      static_file = self.files.get(request.path_info)
+    if static_file is not None:
+      return await sync_to_async(self.serve)(static_file, request)
+    return await self.get_response(request)
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:26
+
+from django.db import migrations, models
+
+
+def backfill_warranty_ends_on(apps, schema_editor):
+    PropertyAppliance = apps.get_model("appliance", "PropertyAppliance")
+    batch = []
+    for property_appliance in PropertyAppliance.objects.select_related(
+        "appliance"
+    ).iterator(chunk_size=1000):
+        warranty_period = property_appliance.actual_warranty_period
+        if warranty_period is None:
+            warranty_period = property_appliance.appliance.warranty_period
+        property_appliance.warranty_ends_on = (
+            property_appliance.purchase_date + warranty_period
+        )
+        batch.append(property_appliance)
+        if len(batch) >= 1000:
+            PropertyAppliance.objects.bulk_update(batch, ["warranty_ends_on"])
+            batch = []
+    if batch:
+        PropertyAppliance.objects.bulk_update(batch, ["warranty_ends_on"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0018_remove_propertyappliance_matching_score_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="propertyappliance",
+            name="warranty_ends_on",
+            field=models.DateField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                help_text="Effective warranty end date, kept in sync on save",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(
+            backfill_warranty_ends_on, reverse_code=migrations.RunPython.noop
+        ),
+    ]
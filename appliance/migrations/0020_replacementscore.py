@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:29
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0019_propertyappliance_warranty_ends_on"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="appliance",
+            name="matching_score",
+        ),
+        migrations.CreateModel(
+            name="ReplacementScore",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "score",
+                    models.FloatField(
+                        validators=[
+                            django.core.validators.MinValueValidator(0.0),
+                            django.core.validators.MaxValueValidator(1.0),
+                        ]
+                    ),
+                ),
+                ("computed_at", models.DateTimeField(auto_now=True)),
+                (
+                    "candidate",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="candidate_scores",
+                        to="appliance.appliance",
+                    ),
+                ),
+                (
+                    "property_appliance",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="replacement_scores",
+                        to="appliance.propertyappliance",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["property_appliance", "-score"],
+                        name="replacement_score_rank_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("property_appliance", "candidate"),
+                        name="unique_replacement_score",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+def number_existing_bookings(apps, schema_editor):
+    Schedule = apps.get_model("appliance", "Schedule")
+    seen = {}
+    updated = []
+    for schedule in Schedule.objects.order_by("id").iterator(chunk_size=1000):
+        slot = (schedule.date, schedule.hour, schedule.minute)
+        schedule.slot_index = seen.get(slot, 0)
+        seen[slot] = schedule.slot_index + 1
+        if schedule.slot_index:
+            updated.append(schedule)
+    Schedule.objects.bulk_update(updated, ["slot_index"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0020_replacementscore"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="schedule",
+            name="slot_index",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(
+            number_existing_bookings, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="schedule",
+            constraint=models.UniqueConstraint(
+                fields=("date", "hour", "minute", "slot_index"),
+                name="unique_schedule_slot",
+            ),
+        ),
+    ]
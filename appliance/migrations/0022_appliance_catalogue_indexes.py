@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0021_schedule_slot_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appliance",
+            index=models.Index(
+                fields=["appliance_type", "cost", "id"], name="appliance_catalogue_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appliance",
+            index=models.Index(
+                fields=["brand", "appliance_type", "cost", "id"],
+                name="appliance_brand_catalogue_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appliance",
+            index=models.Index(
+                fields=["efficiency_rating", "appliance_type", "cost", "id"],
+                name="appliance_rating_catalogue_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0023_appliance_search_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appliance",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="property",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="profile_pic_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
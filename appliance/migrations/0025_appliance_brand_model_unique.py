@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_appliances(apps, schema_editor):
+    Appliance = apps.get_model("appliance", "Appliance")
+    PropertyAppliance = apps.get_model("appliance", "PropertyAppliance")
+    Schedule = apps.get_model("appliance", "Schedule")
+    ReplacementScore = apps.get_model("appliance", "ReplacementScore")
+
+    duplicates = (
+        Appliance.objects.values("brand", "model")
+        .annotate(keep_id=Min("id"), rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        merged_ids = list(
+            Appliance.objects.filter(brand=duplicate["brand"], model=duplicate["model"])
+            .exclude(id=duplicate["keep_id"])
+            .values_list("id", flat=True)
+        )
+        # Scores are recomputed on next access
+        ReplacementScore.objects.filter(
+            property_appliance__appliance_id__in=merged_ids
+        ).delete()
+        ReplacementScore.objects.filter(candidate_id__in=merged_ids).delete()
+        moved_ids = list(
+            PropertyAppliance.objects.filter(
+                appliance_id__in=merged_ids, actual_warranty_period__isnull=True
+            ).values_list("id", flat=True)
+        )
+        PropertyAppliance.objects.filter(appliance_id__in=merged_ids).update(
+            appliance_id=duplicate["keep_id"]
+        )
+        # Units without their own period take the kept appliance's warranty
+        warranty_period = Appliance.objects.get(id=duplicate["keep_id"]).warranty_period
+        batch = []
+        for property_appliance in PropertyAppliance.objects.filter(
+            id__in=moved_ids
+        ).iterator(chunk_size=1000):
+            property_appliance.warranty_ends_on = (
+                property_appliance.purchase_date + warranty_period
+            )
+            batch.append(property_appliance)
+        PropertyAppliance.objects.bulk_update(
+            batch, ["warranty_ends_on"], batch_size=1000
+        )
+        Schedule.objects.filter(replacement_appliance_id__in=merged_ids).update(
+            replacement_appliance_id=duplicate["keep_id"]
+        )
+        Appliance.objects.filter(id__in=merged_ids).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0024_image_variants"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_appliances, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="appliance",
+            constraint=models.UniqueConstraint(
+                fields=("brand", "model"), name="unique_appliance_brand_model"
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0027_notification"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReplacementForecast",
+            fields=[
+                (
+                    "property_appliance",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="forecast",
+                        serialize=False,
+                        to="appliance.propertyappliance",
+                    ),
+                ),
+                ("due_on", models.DateField()),
+                ("replacement_cost", models.IntegerField()),
+                ("computed_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [models.Index(fields=["due_on"], name="forecast_due_idx")],
+            },
+        ),
+    ]
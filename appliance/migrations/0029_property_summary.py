@@ -0,0 +1,82 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0028_replacement_forecast"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PropertySummary",
+            fields=[
+                (
+                    "property",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to="appliance.property",
+                    ),
+                ),
+                ("appliance_count", models.PositiveIntegerField(default=0)),
+                ("total_spend", models.BigIntegerField(default=0)),
+                ("efficiency_total", models.PositiveIntegerField(default=0)),
+                ("under_warranty", models.PositiveIntegerField(default=0)),
+                ("computed_on", models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PropertyTypeSpend",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "appliance_type",
+                    models.CharField(
+                        choices=[
+                            ("WASHING_MACHINE", "Washing machine"),
+                            ("DISHWASHER", "Dishwasher"),
+                            ("DRYER", "Dryer"),
+                            ("OVEN", "Oven"),
+                            ("MICROWAVE", "Microwave"),
+                            ("REFRIGERATOR", "Refrigerator"),
+                            ("FREEZER", "Freezer"),
+                            ("TOASTER", "Toaster"),
+                            ("TOASTER_OVEN", "Toaster oven"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("appliance_count", models.PositiveIntegerField(default=0)),
+                ("total_spend", models.BigIntegerField(default=0)),
+                (
+                    "property",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="type_spend",
+                        to="appliance.property",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("property", "appliance_type"),
+                        name="unique_property_type_spend",
+                    )
+                ],
+            },
+        ),
+    ]
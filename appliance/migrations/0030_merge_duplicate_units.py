@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:16
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_units(apps, schema_editor):
+    PropertyAppliance = apps.get_model("appliance", "PropertyAppliance")
+    Schedule = apps.get_model("appliance", "Schedule")
+    PropertySummary = apps.get_model("appliance", "PropertySummary")
+
+    duplicates = (
+        PropertyAppliance.objects.values("property_id", "appliance_id")
+        .annotate(keep_id=Min("id"), rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        merged_ids = list(
+            PropertyAppliance.objects.filter(
+                property_id=duplicate["property_id"],
+                appliance_id=duplicate["appliance_id"],
+            )
+            .exclude(id=duplicate["keep_id"])
+            .values_list("id", flat=True)
+        )
+        Schedule.objects.filter(property_appliance_id__in=merged_ids).update(
+            property_appliance_id=duplicate["keep_id"]
+        )
+        # Scores and forecasts go with the merged rows and are recomputed
+        PropertyAppliance.objects.filter(id__in=merged_ids).delete()
+        # Missing summaries are rebuilt on next read
+        PropertySummary.objects.filter(property_id=duplicate["property_id"]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0029_property_summary"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_units, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0030_merge_duplicate_units"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="propertyappliance",
+            index=models.Index(fields=["purchase_date"], name="unit_purchase_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="schedule",
+            index=models.Index(
+                fields=["property_appliance", "date"], name="schedule_unit_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="schedule",
+            index=models.Index(
+                condition=models.Q(("notifications_enabled", True)),
+                fields=["date", "hour", "minute"],
+                name="schedule_notify_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="propertyappliance",
+            constraint=models.UniqueConstraint(
+                fields=("property", "appliance"), name="unique_property_appliance"
+            ),
+        ),
+    ]
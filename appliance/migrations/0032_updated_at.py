@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0031_access_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appliance",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="propertyappliance",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_scored_units(apps, schema_editor):
+    PropertyAppliance = apps.get_model("appliance", "PropertyAppliance")
+    # Units without scores are scored on next access
+    PropertyAppliance.objects.filter(replacement_scores__isnull=False).update(
+        scores_computed_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("appliance", "0032_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="propertyappliance",
+            name="scores_computed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_scored_units, reverse_code=migrations.RunPython.noop),
+    ]
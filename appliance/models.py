@@ -11,7 +11,7 @@ from django.core.validators import (
   MaxValueValidator,
   MinValueValidator,
 )
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 
 
@@ -83,6 +83,7 @@ class User(AbstractUser):
     blank=True,
     null=True,
   )
+  profile_pic_variants = models.JSONField(default=dict, blank=True, editable=False)
   title = models.CharField(max_length=30, null=True)
 
 
@@ -103,6 +104,7 @@ class Property(models.Model):
     blank=True,
     null=True,
   )
+  image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
   def __str__(self):
     return self.name
@@ -117,9 +119,6 @@ class Appliance(models.Model):
   brand = models.CharField(max_length=50)
   model = models.CharField(max_length=50)
   cost = models.IntegerField()
-  matching_score = models.FloatField(
-    validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
-  )
   warranty_period = models.DurationField(
     help_text="Default duration of the warranty period", default=timedelta(days=365)
   )
@@ -134,6 +133,55 @@ class Appliance(models.Model):
       )
     ],
   )
+  image_variants = models.JSONField(default=dict, blank=True, editable=False)
+  # Part of the cache key of every fragment rendering the row
+  updated_at = models.DateTimeField(auto_now=True)
+
+  class Meta:
+    indexes = [
+      # Explore catalogue keyset order, optionally narrowed by brand or rating
+      models.Index(
+        fields=["appliance_type", "cost", "id"], name="appliance_catalogue_idx"
+      ),
+      models.Index(
+        fields=["brand", "appliance_type", "cost", "id"],
+        name="appliance_brand_catalogue_idx",
+      ),
+      models.Index(
+        fields=["efficiency_rating", "appliance_type", "cost", "id"],
+        name="appliance_rating_catalogue_idx",
+      ),
+    ]
+    constraints = [
+      # Supplier feeds are upserted on the brand and model pair
+      models.UniqueConstraint(
+        fields=["brand", "model"], name="unique_appliance_brand_model"
+      ),
+    ]
+
+  @classmethod
+  def from_db(cls, db, field_names, values):
+    instance = super().from_db(db, field_names, values)
+    instance._loaded_warranty_period = instance.__dict__.get("warranty_period")
+    instance._loaded_appliance_type = instance.__dict__.get("appliance_type")
+    instance._loaded_cost = instance.__dict__.get("cost")
+    instance._loaded_efficiency_rating = instance.__dict__.get("efficiency_rating")
+    return instance
+
+  def save(self, *args, **kwargs):
+    super().save(*args, **kwargs)
+    loaded_warranty_period = getattr(self, "_loaded_warranty_period", None)
+    if loaded_warranty_period is not None and (
+      loaded_warranty_period != self.warranty_period
+    ):
+      # Installed units without their own warranty inherit this one
+      self.appliance_properties.filter(
+        actual_warranty_period__isnull=True
+      ).refresh_warranty_ends_on()
+    self._loaded_warranty_period = self.warranty_period
+    self._loaded_appliance_type = self.appliance_type
+    self._loaded_cost = self.cost
+    self._loaded_efficiency_rating = self.efficiency_rating
 
   def __str__(self):
     return f"{self.brand} {self.model}"
@@ -143,6 +191,17 @@ class Appliance(models.Model):
 #
 #
 #
+class UserPropertyQuerySet(models.QuerySet):
+  def with_dashboard(self):
+    """Loads the whole property dashboard graph in a fixed number of queries"""
+    return self.select_related("user", "property").prefetch_related(
+      models.Prefetch(
+        "property__property_appliances",
+        queryset=PropertyAppliance.objects.for_dashboard(),
+      )
+    )
+
+
 class UserProperty(models.Model):
   user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="properties")
   property = models.ForeignKey(
@@ -150,6 +209,8 @@ class UserProperty(models.Model):
   )
   assignment_date = models.DateField(default=timezone.now)
 
+  objects = UserPropertyQuerySet.as_manager()
+
   class Meta:
     unique_together = [["user", "property"]]
 
@@ -161,6 +222,48 @@ class UserProperty(models.Model):
 #
 #
 #
+class PropertyApplianceQuerySet(models.QuerySet):
+  def for_dashboard(self):
+    """Appliance rows with their catalogue entry and scheduled replacements"""
+    return self.select_related("appliance").prefetch_related(
+      models.Prefetch(
+        "schedules",
+        queryset=Schedule.objects.select_related("replacement_appliance"),
+      )
+    )
+
+  def within_warranty(self, on=None):
+    return self.filter(warranty_ends_on__gte=on or timezone.now().date())
+
+  def out_of_warranty(self, on=None):
+    return self.filter(warranty_ends_on__lt=on or timezone.now().date())
+
+  def warranty_expiring(self, days=30, on=None):
+    """Rows whose warranty ends within the next ``days`` days"""
+    start = on or timezone.now().date()
+    return self.filter(warranty_ends_on__range=(start, start + timedelta(days=days)))
+
+  def refresh_warranty_ends_on(self, batch_size=1000):
+    """Recomputes the denormalized warranty end date for every row"""
+    batch = []
+    # bulk_update() skips auto_now, so the rows' fragments are re-keyed here
+    now = timezone.now()
+    fields = ["warranty_ends_on", "updated_at"]
+    for property_appliance in self.select_related("appliance").iterator(
+      chunk_size=batch_size
+    ):
+      property_appliance.warranty_ends_on = (
+        property_appliance.compute_warranty_ends_on()
+      )
+      property_appliance.updated_at = now
+      batch.append(property_appliance)
+      if len(batch) >= batch_size:
+        PropertyAppliance.objects.bulk_update(batch, fields)
+        batch = []
+    if batch:
+      PropertyAppliance.objects.bulk_update(batch, fields)
+
+
 class PropertyAppliance(models.Model):
   property = models.ForeignKey(
     Property, on_delete=models.CASCADE, related_name="property_appliances"
@@ -175,6 +278,31 @@ class PropertyAppliance(models.Model):
     help_text="Actual warranty period for this specific purchase", null=True, blank=True
   )
   usage = models.CharField(max_length=50, choices=Usage.choices())
+  warranty_ends_on = models.DateField(
+    help_text="Effective warranty end date, kept in sync on save",
+    null=True,
+    blank=True,
+    editable=False,
+    db_index=True,
+  )
+  # Part of the cache key of every fragment rendering the row
+  updated_at = models.DateTimeField(auto_now=True)
+  # Set when the replacement scores were last computed, even if none were found
+  scores_computed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+  objects = PropertyApplianceQuerySet.as_manager()
+
+  class Meta:
+    constraints = [
+      # Views look a unit up by (property, appliance) and expect a single row
+      models.UniqueConstraint(
+        fields=["property", "appliance"], name="unique_property_appliance"
+      )
+    ]
+    indexes = [
+      # Admin ordering and date hierarchy
+      models.Index(fields=["purchase_date"], name="unit_purchase_date_idx")
+    ]
 
   def get_cost(self):
     """Returns the actual cost if set, otherwise the base appliance cost"""
@@ -188,14 +316,21 @@ class PropertyAppliance(models.Model):
       else self.appliance.warranty_period
     )
 
+  def compute_warranty_ends_on(self):
+    """Returns the purchase date plus the effective warranty period"""
+    purchase_date = self._meta.get_field("purchase_date").to_python(self.purchase_date)
+    return purchase_date + self.get_warranty_period()
+
   def is_within_warranty(self):
-    warranty_period = self.get_warranty_period()
-    warranty_end_date = self.purchase_date + warranty_period
-    if isinstance(warranty_end_date, timedelta):
-      warranty_end_date = self.purchase_date + warranty_end_date
-    if hasattr(warranty_end_date, "date"):
-      warranty_end_date = warranty_end_date.date()
-    return timezone.now().date() <= warranty_end_date
+    warranty_ends_on = self.warranty_ends_on or self.compute_warranty_ends_on()
+    return timezone.now().date() <= warranty_ends_on
+
+  def save(self, *args, **kwargs):
+    self.warranty_ends_on = self.compute_warranty_ends_on()
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None:
+      kwargs["update_fields"] = {*update_fields, "warranty_ends_on"}
+    super().save(*args, **kwargs)
 
   def get_usage_color(self):
     """Returns the appropriate color class based on usage level"""
@@ -215,6 +350,9 @@ class PropertyAppliance(models.Model):
 #
 #
 #
+SLOT_ALLOCATION_ATTEMPTS = 5
+
+
 class Schedule(models.Model):
   # The current PropertyAppliance that is being replaced
   property_appliance = models.ForeignKey(
@@ -237,5 +375,271 @@ class Schedule(models.Model):
   tenant_email = models.EmailField(null=True, blank=True)
   tenant_phone = models.CharField(max_length=15, null=True, blank=True)
 
+  # Which installer crew holds the slot, bounded by SCHEDULE_SLOT_CAPACITY
+  slot_index = models.PositiveSmallIntegerField(default=0, editable=False)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(
+        fields=["date", "hour", "minute", "slot_index"], name="unique_schedule_slot"
+      )
+    ]
+    # unique_schedule_slot already serves (date, hour, minute) lookups and the
+    # calendar's date ranges
+    indexes = [
+      # A unit's upcoming bookings
+      models.Index(
+        fields=["property_appliance", "date"], name="schedule_unit_date_idx"
+      ),
+      # Bookings that send tenant notifications, a small share of the table
+      models.Index(
+        fields=["date", "hour", "minute"],
+        condition=models.Q(notifications_enabled=True),
+        name="schedule_notify_idx",
+      ),
+    ]
+
   def __str__(self):
     return f"{self.property_appliance} Replacement {self.date}::{self.hour:02d}:{self.minute:02d}"  # noqa: E501
+
+  def free_slot_index(self):
+    """The lowest slot_index no other booking of the same time holds"""
+    taken = set(
+      Schedule.objects.filter(date=self.date, hour=self.hour, minute=self.minute)
+      .exclude(pk=self.pk)
+      .values_list("slot_index", flat=True)
+    )
+    return next(index for index in range(len(taken) + 1) if index not in taken)
+
+  def save(self, *args, **kwargs):
+    """
+    Takes the lowest free slot_index of the time, so bookings made outside
+    ScheduleForm.book_slot, such as from the admin, never collide with the
+    unique slot constraint. Capacity is enforced by book_slot only, so staff
+    can still overbook a slot.
+    """
+    for attempt in range(SLOT_ALLOCATION_ATTEMPTS):
+      self.slot_index = self.free_slot_index()
+      try:
+        # A concurrent booking can take the same index first
+        with transaction.atomic():
+          return super().save(*args, **kwargs)
+      except IntegrityError:
+        if attempt == SLOT_ALLOCATION_ATTEMPTS - 1:
+          raise
+    return None
+
+
+# Replacement scores
+#
+#
+#
+class ReplacementScore(models.Model):
+  # The installed unit that would be replaced
+  property_appliance = models.ForeignKey(
+    PropertyAppliance,
+    on_delete=models.CASCADE,
+    related_name="replacement_scores",
+  )
+
+  # The catalogue appliance being scored as its replacement
+  candidate = models.ForeignKey(
+    Appliance,
+    on_delete=models.CASCADE,
+    related_name="candidate_scores",
+  )
+
+  score = models.FloatField(
+    validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+  )
+  computed_at = models.DateTimeField(auto_now=True)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(
+        fields=["property_appliance", "candidate"], name="unique_replacement_score"
+      )
+    ]
+    indexes = [
+      models.Index(
+        fields=["property_appliance", "-score"], name="replacement_score_rank_idx"
+      )
+    ]
+
+  def __str__(self):
+    return f"{self.candidate} for {self.property_appliance} ({self.score:.2f})"
+
+
+# Replacement forecasts
+#
+#
+#
+class ReplacementForecast(models.Model):
+  property_appliance = models.OneToOneField(
+    PropertyAppliance,
+    on_delete=models.CASCADE,
+    primary_key=True,
+    related_name="forecast",
+  )
+
+  # Expected end of life, never before the warranty runs out
+  due_on = models.DateField()
+  replacement_cost = models.IntegerField()
+  computed_at = models.DateTimeField()
+
+  class Meta:
+    indexes = [models.Index(fields=["due_on"], name="forecast_due_idx")]
+
+  def __str__(self):
+    return f"{self.property_appliance} due {self.due_on}"
+
+
+# Portfolio analytics
+#
+#
+#
+class PropertySummary(models.Model):
+  """Materialized totals of a property's installed units"""
+
+  property = models.OneToOneField(
+    Property, on_delete=models.CASCADE, primary_key=True, related_name="summary"
+  )
+  appliance_count = models.PositiveIntegerField(default=0)
+  total_spend = models.BigIntegerField(default=0)
+  # Sum of the units' efficiency levels, averaged across the portfolio on read
+  efficiency_total = models.PositiveIntegerField(default=0)
+  under_warranty = models.PositiveIntegerField(default=0)
+  # Warranty coverage depends on the day, so summaries expire at midnight
+  computed_on = models.DateField()
+
+  def __str__(self):
+    return f"{self.property} summary"
+
+
+class PropertyTypeSpend(models.Model):
+  property = models.ForeignKey(
+    Property, on_delete=models.CASCADE, related_name="type_spend"
+  )
+  appliance_type = models.CharField(max_length=20, choices=ApplianceType.choices())
+  appliance_count = models.PositiveIntegerField(default=0)
+  total_spend = models.BigIntegerField(default=0)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(
+        fields=["property", "appliance_type"], name="unique_property_type_spend"
+      )
+    ]
+
+  def __str__(self):
+    return f"{self.property} {self.appliance_type}: {self.total_spend}"
+
+
+# Notification outbox
+#
+#
+#
+class DeliveryChannel(Enum):
+  EMAIL = "email"
+  SMS = "sms"
+
+  @classmethod
+  def choices(cls):
+    return [(x.value, x.name) for x in cls]
+
+
+class DeliveryStatus(Enum):
+  PENDING = "pending"
+  SENT = "sent"
+  FAILED = "failed"
+
+  @classmethod
+  def choices(cls):
+    return [(x.value, x.name) for x in cls]
+
+
+class OutboxMessage(models.Model):
+  # Kept after the schedule is deleted as a record of what was sent
+  schedule = models.ForeignKey(
+    Schedule,
+    on_delete=models.SET_NULL,
+    null=True,
+    blank=True,
+    related_name="outbox_messages",
+  )
+
+  channel = models.CharField(max_length=10, choices=DeliveryChannel.choices())
+  recipient = models.CharField(max_length=254)
+  subject = models.CharField(max_length=200, blank=True)
+  body = models.TextField()
+
+  # Enqueueing the same event twice is a no-op, and providers are handed the
+  # key so a message redelivered after a worker crash can be dropped
+  idempotency_key = models.CharField(max_length=100, unique=True)
+
+  status = models.CharField(
+    max_length=10,
+    choices=DeliveryStatus.choices(),
+    default=DeliveryStatus.PENDING.value,
+  )
+  attempts = models.PositiveSmallIntegerField(default=0)
+  next_attempt_at = models.DateTimeField(default=timezone.now)
+  last_error = models.TextField(blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+  sent_at = models.DateTimeField(null=True, blank=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx")
+    ]
+
+  def __str__(self):
+    return f"{self.channel} to {self.recipient} ({self.status})"
+
+
+# In-app notifications
+#
+#
+#
+class NotificationKind(Enum):
+  APPLIANCE_ADDED = "appliance_added"
+  APPLIANCE_REMOVED = "appliance_removed"
+  REPLACEMENT_BOOKED = "replacement_booked"
+  REPLACEMENT_CANCELLED = "replacement_cancelled"
+
+  @classmethod
+  def choices(cls):
+    return [(x.value, x.name) for x in cls]
+
+
+class Notification(models.Model):
+  user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+  property = models.ForeignKey(
+    Property,
+    on_delete=models.SET_NULL,
+    null=True,
+    blank=True,
+    related_name="notifications",
+  )
+  kind = models.CharField(max_length=30, choices=NotificationKind.choices())
+  message = models.CharField(max_length=255)
+  link = models.CharField(max_length=200, blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+  read_at = models.DateTimeField(null=True, blank=True)
+
+  class Meta:
+    indexes = [
+      # Feed polls read a user's rows after a since-cursor on the id
+      models.Index(fields=["user", "id"], name="notification_feed_idx")
+    ]
+
+  def icon(self):
+    return {
+      NotificationKind.APPLIANCE_ADDED.value: "bi-plus-circle",
+      NotificationKind.APPLIANCE_REMOVED.value: "bi-dash-circle",
+      NotificationKind.REPLACEMENT_BOOKED.value: "bi-calendar-check",
+      NotificationKind.REPLACEMENT_CANCELLED.value: "bi-calendar-x",
+    }.get(self.kind, "bi-bell")
+
+  def __str__(self):
+    return f"{self.user} - {self.message}"
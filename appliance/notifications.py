@@ -0,0 +1,131 @@
+#
+#
+#
+#
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from appliance.models import Notification, NotificationKind, UserProperty
+
+# Seconds; events only drop the entry from the cache of the host that saw
+# them, so other workers can answer 304 for a new notification this long
+LATEST_TIMEOUT = 5
+
+
+def latest_key(user_id):
+  return f"notifications:latest:{user_id}"
+
+
+# Events
+#
+#
+#
+def notify_landlords(property_id, kind, message):
+  """Adds a notification to the feed of every landlord of the property"""
+  landlords = UserProperty.objects.filter(property_id=property_id).values_list(
+    "id", "user_id"
+  )
+  notifications = Notification.objects.bulk_create(
+    Notification(
+      user_id=user_id,
+      property_id=property_id,
+      kind=kind.value,
+      message=message[: Notification._meta.get_field("message").max_length],
+      link=reverse("property_view", args=[user_property_id]),
+    )
+    for user_property_id, user_id in landlords
+  )
+  keys = [latest_key(notification.user_id) for notification in notifications]
+  if keys:
+    transaction.on_commit(lambda: cache.delete_many(keys))
+  return notifications
+
+
+def appliance_added(property_appliance):
+  notify_landlords(
+    property_appliance.property_id,
+    NotificationKind.APPLIANCE_ADDED,
+    f"{property_appliance.appliance} added to {property_appliance.property.name}",
+  )
+
+
+def appliances_added(property, property_appliances):
+  """One notification for a batch of units installed together"""
+  if len(property_appliances) == 1:
+    appliance_added(property_appliances[0])
+    return
+  notify_landlords(
+    property.id,
+    NotificationKind.APPLIANCE_ADDED,
+    f"{len(property_appliances)} appliances added to {property.name}",
+  )
+
+
+def appliance_removed(property_appliance):
+  notify_landlords(
+    property_appliance.property_id,
+    NotificationKind.APPLIANCE_REMOVED,
+    f"{property_appliance.appliance} removed from {property_appliance.property.name}",
+  )
+
+
+def _when(schedule):
+  return f"{schedule.date:%d %b %Y} at {schedule.hour:02d}:{schedule.minute:02d}"
+
+
+def replacement_booked(schedule):
+  property_appliance = schedule.property_appliance
+  notify_landlords(
+    property_appliance.property_id,
+    NotificationKind.REPLACEMENT_BOOKED,
+    f"Replacement of {property_appliance.appliance} at "
+    f"{property_appliance.property.name} booked for {_when(schedule)}",
+  )
+
+
+def replacement_cancelled(schedule):
+  property_appliance = schedule.property_appliance
+  notify_landlords(
+    property_appliance.property_id,
+    NotificationKind.REPLACEMENT_CANCELLED,
+    f"Replacement of {property_appliance.appliance} at "
+    f"{property_appliance.property.name} on {_when(schedule)} cancelled",
+  )
+
+
+# Feed
+#
+#
+#
+def latest_notification_id(user_id):
+  """
+  Id of the user's newest notification. Cached for a few seconds, or until
+  the next event for the user, so most polls with nothing new are answered
+  without touching the table.
+  """
+  key = latest_key(user_id)
+  latest = cache.get(key)
+  if latest is None:
+    latest = (
+      Notification.objects.filter(user_id=user_id)
+      .order_by("-id")
+      .values_list("id", flat=True)
+      .first()
+    ) or 0
+    cache.set(key, latest, LATEST_TIMEOUT)
+  return latest
+
+
+def notifications_since(user_id, since=0, limit=20):
+  """The user's newest notifications after the cursor, newest first"""
+  return list(
+    Notification.objects.filter(user_id=user_id, id__gt=since).order_by("-id")[:limit]
+  )
+
+
+def mark_read(user_id, up_to):
+  return Notification.objects.filter(
+    user_id=user_id, id__lte=up_to, read_at__isnull=True
+  ).update(read_at=timezone.now())
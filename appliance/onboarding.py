@@ -0,0 +1,88 @@
+#
+#
+#
+#
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from appliance import analytics, forecasting, matching, notifications
+from appliance.models import Property, PropertyAppliance
+
+BATCH_SIZE = 1000
+
+
+# Install
+#
+#
+#
+def install(units):
+  """
+  Inserts unsaved installed units in one transaction and runs the work of
+  PropertyAppliance.save() and its post_save receivers once for the batch.
+  Each unit needs its property and appliance instances assigned.
+  """
+  for unit in units:
+    unit.warranty_ends_on = unit.compute_warranty_ends_on()
+
+  with transaction.atomic():
+    units = PropertyAppliance.objects.bulk_create(units, batch_size=BATCH_SIZE)
+    ids = [unit.id for unit in units]
+    by_property = defaultdict(list)
+    for unit in units:
+      by_property[unit.property].append(unit)
+    for installed_at, added in by_property.items():
+      notifications.appliances_added(installed_at, added)
+
+    if ids:
+      transaction.on_commit(
+        lambda: matching.recompute_scores(property_appliance_ids=ids)
+      )
+      transaction.on_commit(lambda: forecasting.forecast_replacements(ids))
+    analytics.refresh_on_commit(installed_at.id for installed_at in by_property)
+  return units
+
+
+# Clone
+#
+#
+#
+def clone_appliance_set(source_property_id, target_property_ids, purchase_date=None):
+  """
+  Installs every appliance of the source property on each target property
+  with the same usage, cost and warranty, skipping appliances a target
+  already has. Returns the created units.
+  """
+  purchase_date = purchase_date or timezone.localdate()
+  targets = Property.objects.filter(id__in=target_property_ids).exclude(
+    id=source_property_id
+  )
+  source_units = list(
+    PropertyAppliance.objects.filter(property_id=source_property_id).select_related(
+      "appliance"
+    )
+  )
+  if not source_units:
+    return []
+  installed = set(
+    PropertyAppliance.objects.filter(
+      property__in=targets,
+      appliance_id__in=[unit.appliance_id for unit in source_units],
+    ).values_list("property_id", "appliance_id")
+  )
+  return install(
+    [
+      PropertyAppliance(
+        property=target,
+        appliance=unit.appliance,
+        usage=unit.usage,
+        actual_cost=unit.actual_cost,
+        actual_warranty_period=unit.actual_warranty_period,
+        purchase_date=purchase_date,
+      )
+      for target in targets
+      for unit in source_units
+      if (target.id, unit.appliance_id) not in installed
+    ]
+  )
@@ -0,0 +1,252 @@
+#
+#
+#
+#
+import hashlib
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail.utils import DNS_NAME
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from appliance import metrics, sms
+from appliance.models import DeliveryChannel, DeliveryStatus, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+metrics.registry.describe("notifications_sent_total", "Notifications delivered")
+metrics.registry.describe(
+  "notifications_failed_total", "Notification delivery attempts that failed"
+)
+
+
+# Enqueueing
+#
+#
+#
+def schedule_messages(schedule, event="booked"):
+  """Builds the unsaved outbox rows telling the tenant about a schedule"""
+  if not schedule.notifications_enabled:
+    return []
+
+  context = {
+    "schedule": schedule,
+    "property": schedule.property_appliance.property,
+    "appliance": schedule.property_appliance.appliance,
+    "replacement": schedule.replacement_appliance,
+    "time": f"{schedule.hour:02d}:{schedule.minute:02d}",
+  }
+  messages = []
+  if schedule.tenant_email:
+    messages.append(
+      OutboxMessage(
+        schedule=schedule,
+        channel=DeliveryChannel.EMAIL.value,
+        recipient=schedule.tenant_email,
+        subject=render_to_string(
+          f"notifications/schedule_{event}_subject.txt", context
+        ).strip(),
+        body=render_to_string(f"notifications/schedule_{event}_email.txt", context),
+      )
+    )
+  if schedule.tenant_phone:
+    messages.append(
+      OutboxMessage(
+        schedule=schedule,
+        channel=DeliveryChannel.SMS.value,
+        recipient=schedule.tenant_phone,
+        body=render_to_string(
+          f"notifications/schedule_{event}_sms.txt", context
+        ).strip(),
+      )
+    )
+  for message in messages:
+    message.idempotency_key = f"schedule-{event}:{schedule.pk}:{message.channel}"
+  return messages
+
+
+def enqueue_schedule_notifications(schedule, event="booked"):
+  """
+  Writes the schedule's notifications to the outbox. Call it inside the
+  transaction saving the schedule so both commit or neither does; delivery
+  happens later in the dispatch_notifications worker.
+  """
+  messages = schedule_messages(schedule, event)
+  if messages:
+    OutboxMessage.objects.bulk_create(messages, ignore_conflicts=True)
+  return messages
+
+
+# Dispatching
+#
+#
+#
+class DeliveryError(Exception):
+  pass
+
+
+def retry_delay(attempts):
+  """Exponential backoff with jitter, capped at NOTIFICATION_RETRY_MAX_DELAY"""
+  delay = min(
+    settings.NOTIFICATION_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0),
+    settings.NOTIFICATION_RETRY_MAX_DELAY,
+  )
+  return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def message_id(idempotency_key):
+  # A stable Message-ID lets mail servers and clients drop redeliveries
+  digest = hashlib.sha256(idempotency_key.encode()).hexdigest()[:32]
+  return f"<{digest}@{DNS_NAME}>"
+
+
+class Dispatcher:
+  """
+  Drains due outbox rows in batches. Rows are claimed by pushing their next
+  attempt past a lease, so several workers can run side by side and a row
+  held by a worker that died becomes due again once the lease runs out.
+
+  One SMTP connection and one SMS backend connection are opened lazily and
+  reused across batches until close().
+  """
+
+  def __init__(self, batch_size=None, max_attempts=None, lease=None):
+    self.batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    self.max_attempts = max_attempts or settings.NOTIFICATION_MAX_ATTEMPTS
+    self.lease = timedelta(seconds=lease or settings.NOTIFICATION_LEASE)
+    self._email_connection = None
+    self._sms_connection = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  # Connections
+  #
+  #
+  #
+  def email_connection(self):
+    if self._email_connection is None:
+      self._email_connection = mail.get_connection()
+      self._email_connection.open()
+    return self._email_connection
+
+  def sms_connection(self):
+    if self._sms_connection is None:
+      self._sms_connection = sms.get_connection()
+      self._sms_connection.open()
+    return self._sms_connection
+
+  def reset_connection(self, channel):
+    # Drop a connection that failed mid-send so the next message reconnects
+    attribute = f"_{channel}_connection"
+    connection = getattr(self, attribute)
+    setattr(self, attribute, None)
+    if connection is not None:
+      try:
+        connection.close()
+      except Exception:
+        logger.exception("Closing the %s connection failed", channel)
+
+  def close(self):
+    for channel in DeliveryChannel:
+      self.reset_connection(channel.value)
+
+  # Delivery
+  #
+  #
+  #
+  def claim(self):
+    now = timezone.now()
+    with transaction.atomic():
+      messages = list(
+        OutboxMessage.objects.select_for_update(skip_locked=True)
+        .filter(status=DeliveryStatus.PENDING.value, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")[: self.batch_size]
+      )
+      OutboxMessage.objects.filter(id__in=[message.id for message in messages]).update(
+        attempts=F("attempts") + 1, next_attempt_at=now + self.lease
+      )
+    for message in messages:
+      message.attempts += 1
+    return messages
+
+  def send(self, message):
+    if message.channel == DeliveryChannel.EMAIL.value:
+      sent = self.email_connection().send_messages(
+        [
+          mail.EmailMessage(
+            subject=message.subject,
+            body=message.body,
+            to=[message.recipient],
+            headers={
+              "Message-ID": message_id(message.idempotency_key),
+              "X-Idempotency-Key": message.idempotency_key,
+            },
+          )
+        ]
+      )
+    elif message.channel == DeliveryChannel.SMS.value:
+      sent = self.sms_connection().send_messages(
+        [sms.SMSMessage(message.recipient, message.body, message.idempotency_key)]
+      )
+    else:
+      raise DeliveryError(f"Unknown channel {message.channel!r}")
+    if not sent:
+      raise DeliveryError("The backend did not accept the message")
+
+  def deliver(self, message, now):
+    try:
+      self.send(message)
+    except Exception as error:  # noqa: BLE001
+      # Any provider error is retried rather than stopping the batch
+      self.reset_connection(message.channel)
+      message.last_error = f"{type(error).__name__}: {error}"[:2000]
+      if message.attempts >= self.max_attempts:
+        message.status = DeliveryStatus.FAILED.value
+        logger.error(
+          "Giving up on %s after %d attempts: %s",
+          message.idempotency_key,
+          message.attempts,
+          message.last_error,
+        )
+      else:
+        message.next_attempt_at = now + retry_delay(message.attempts)
+      metrics.registry.inc("notifications_failed_total", channel=message.channel)
+      return False
+
+    message.status = DeliveryStatus.SENT.value
+    message.sent_at = now
+    message.last_error = ""
+    metrics.registry.inc("notifications_sent_total", channel=message.channel)
+    return True
+
+  def dispatch_batch(self):
+    """Delivers one batch and returns (claimed, sent)"""
+    messages = self.claim()
+    if not messages:
+      return 0, 0
+    now = timezone.now()
+    sent = sum(self.deliver(message, now) for message in messages)
+    OutboxMessage.objects.bulk_update(
+      messages, ["status", "next_attempt_at", "last_error", "sent_at"]
+    )
+    return len(messages), sent
+
+  def drain(self):
+    """Delivers due rows until none are left and returns (claimed, sent)"""
+    claimed = sent = 0
+    while True:
+      batch_claimed, batch_sent = self.dispatch_batch()
+      claimed += batch_claimed
+      sent += batch_sent
+      if batch_claimed < self.batch_size:
+        return claimed, sent
@@ -0,0 +1,148 @@
+#
+#
+#
+#
+import base64
+import binascii
+import json
+from collections import namedtuple
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+KeysetPage = namedtuple("KeysetPage", ["items", "next_cursor", "has_next"])
+
+
+# Cursor encoding
+#
+#
+#
+def encode_cursor(values):
+  payload = json.dumps(list(values), separators=(",", ":")).encode()
+  return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+  """Returns the cursor values, or None when the cursor is missing or invalid"""
+  if not cursor:
+    return None
+  try:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+  except (binascii.Error, ValueError, UnicodeDecodeError):
+    return None
+  if not isinstance(values, list) or len(values) != size:
+    return None
+  if not all(isinstance(value, str | int | float) for value in values):
+    return None
+  return values
+
+
+def cursor_values(model, fields, values):
+  """
+  Converts decoded cursor values to the types of the model fields they sort
+  on, or returns None when one does not fit, as in a tampered cursor
+  """
+  converted = []
+  for name, value in zip(fields, values, strict=True):
+    field = _resolve_field(model, name)
+    try:
+      value = field.to_python(value)
+      field.run_validators(value)
+    except ValidationError:
+      return None
+    converted.append(value)
+  return converted
+
+
+def _resolve_field(model, name):
+  *relations, name = name.split("__")
+  for relation in relations:
+    model = model._meta.get_field(relation).related_model
+  return model._meta.pk if name == "pk" else model._meta.get_field(name)
+
+
+# Keyset pagination
+#
+#
+#
+def after(fields, values):
+  """Q matching rows strictly after ``values`` in ascending ``fields`` order"""
+  condition = Q()
+  for position, field in enumerate(fields):
+    step = Q(**{f"{field}__gt": values[position]})
+    for previous, previous_value in zip(fields[:position], values, strict=False):
+      step &= Q(**{previous: previous_value})
+    condition |= step
+  return condition
+
+
+def keyset_page(queryset, fields, cursor=None, page_size=50):
+  """
+  Returns one page of ``queryset`` ordered by ``fields``. The last field must
+  be unique so every row has a stable position; deep pages cost the same as
+  the first because no OFFSET is used.
+  """
+  queryset = queryset.order_by(*fields)
+  values = decode_cursor(cursor, len(fields))
+  if values is not None:
+    values = cursor_values(queryset.model, fields, values)
+  if values is not None:
+    queryset = queryset.filter(after(fields, values))
+
+  items = list(queryset[: page_size + 1])
+  has_next = len(items) > page_size
+  items = items[:page_size]
+
+  next_cursor = None
+  if has_next:
+    last = items[-1]
+    next_cursor = encode_cursor(
+      float(value) if isinstance(value, Decimal) else value
+      for value in (getattr(last, field) for field in fields)
+    )
+  return KeysetPage(items=items, next_cursor=next_cursor, has_next=has_next)
+
+
+# Estimated counts
+#
+#
+#
+class EstimatedCountPaginator(Paginator):
+  """
+  Paginator that reads the size of an unfiltered PostgreSQL table from the
+  planner statistics instead of running COUNT(*), which scans the whole
+  table. Filtered querysets, small tables and other databases are counted
+  exactly.
+  """
+
+  # Below this many rows an exact count is cheap and the estimate too coarse
+  estimate_threshold = 100_000
+
+  @cached_property
+  def count(self):
+    estimate = self.estimated_count()
+    if estimate is not None and estimate >= self.estimate_threshold:
+      return estimate
+    return super().count
+
+  def estimated_count(self):
+    queryset = self.object_list
+    query = getattr(queryset, "query", None)
+    if query is None or query.where or query.distinct or query.combinator:
+      return None
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+      return None
+    with connection.cursor() as cursor:
+      cursor.execute(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+        [queryset.model._meta.db_table],
+      )
+      row = cursor.fetchone()
+    # Tables never vacuumed or analysed report -1
+    return row[0] if row and row[0] >= 0 else None
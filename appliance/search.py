@@ -0,0 +1,226 @@
+#
+#
+#
+#
+import threading
+from collections import defaultdict
+from time import monotonic
+
+import numpy as np
+from django.db import connection
+from django.db.models import Count, FloatField, Max, Q, Value
+from django.db.models.functions import Greatest
+
+from appliance.models import Appliance, ApplianceType
+
+try:
+  from rapidfuzz import fuzz, process, utils
+except ImportError:  # pragma: no cover - rapidfuzz ships in requirements.txt
+  process = None
+
+# Seconds between a worker's checks for catalogue changes made by other workers
+INDEX_CHECK_INTERVAL = 5
+TOKEN_SCORE_CUTOFF = 70
+TRIGRAM_THRESHOLD = 0.2
+TYPE_LABELS = {
+  appliance_type.name: appliance_type.value for appliance_type in ApplianceType
+}
+
+
+# Tokenizer
+#
+#
+#
+def tokenize(text):
+  if process is None:
+    return text.lower().split()
+  return utils.default_process(text).split()
+
+
+# In-process catalogue index
+#
+#
+#
+class CatalogueIndex:
+  """
+  Token index over brand, model and type. Each query token is fuzzy matched
+  against the distinct token vocabulary once, then scores are accumulated per
+  appliance through the posting lists, so a query costs O(vocabulary) rather
+  than O(catalogue) string comparisons.
+  """
+
+  def __init__(self, rows):
+    ids = []
+    types = []
+    token_rows = defaultdict(list)
+    for position, (appliance_id, appliance_type, brand, model) in enumerate(rows):
+      ids.append(appliance_id)
+      types.append(appliance_type)
+      label = TYPE_LABELS.get(appliance_type, appliance_type)
+      for token in set(tokenize(f"{brand} {model} {label}")):
+        token_rows[token].append(position)
+
+    self.ids = np.array(ids, dtype=np.int64)
+    self.types = np.array(types, dtype=object)
+    self.vocabulary = list(token_rows)
+    self.postings = [
+      np.array(token_rows[token], dtype=np.int64) for token in self.vocabulary
+    ]
+
+  def __len__(self):
+    return len(self.ids)
+
+  def search(self, query, limit=20, appliance_type=None):
+    """Returns [(appliance_id, score)] best first, with scores in [0, 100]"""
+    tokens = tokenize(query)
+    if not tokens or not len(self.ids):
+      return []
+
+    # One batched comparison of every query token against the vocabulary
+    similarity = process.cdist(
+      tokens,
+      self.vocabulary,
+      scorer=fuzz.ratio,
+      processor=None,
+      score_cutoff=TOKEN_SCORE_CUTOFF,
+      dtype=np.uint8,
+      workers=-1,
+    )
+    scores = np.zeros(len(self.ids), dtype=np.float32)
+    for token_similarity in similarity:
+      best = np.zeros(len(self.ids), dtype=np.float32)
+      for index in np.flatnonzero(token_similarity):
+        postings = self.postings[index]
+        best[postings] = np.maximum(best[postings], token_similarity[index])
+      scores += best
+    scores /= len(tokens)
+
+    if appliance_type:
+      scores[self.types != appliance_type] = 0
+
+    limit = min(limit, len(scores))
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [
+      (int(self.ids[position]), float(scores[position]))
+      for position in top
+      if scores[position] > 0
+    ]
+
+
+_index = None
+_index_version = None
+_index_checked_at = None
+_index_lock = threading.Lock()
+
+
+def invalidate_index():
+  """
+  Called when the catalogue changes so this worker checks its index on next
+  use; other workers notice within INDEX_CHECK_INTERVAL seconds
+  """
+  global _index_checked_at
+  with _index_lock:
+    _index_checked_at = None
+
+
+def catalogue_version():
+  """
+  Changes with every saved, created or deleted catalogue row. Writes through
+  QuerySet.update() that leave updated_at alone are only seen by the worker
+  that calls invalidate_index().
+  """
+  version = Appliance.objects.aggregate(rows=Count("id"), updated=Max("updated_at"))
+  return version["rows"], version["updated"]
+
+
+def get_index():
+  global _index, _index_version, _index_checked_at
+
+  with _index_lock:
+    now = monotonic()
+    if (
+      _index is not None
+      and _index_checked_at is not None
+      and now < _index_checked_at + INDEX_CHECK_INTERVAL
+    ):
+      return _index
+    version = catalogue_version()
+    _index_checked_at = now
+    if _index is None or _index_version != version:
+      _index = CatalogueIndex(
+        Appliance.objects.order_by("id")
+        .values_list("id", "appliance_type", "brand", "model")
+        .iterator(chunk_size=5000)
+      )
+      _index_version = version
+    return _index
+
+
+# Search backends
+#
+#
+#
+def _postgres_search(query, limit, queryset):
+  from django.contrib.postgres.search import TrigramSimilarity
+
+  return list(
+    queryset.filter(
+      Q(brand__trigram_similar=query)
+      | Q(model__trigram_similar=query)
+      | Q(appliance_type__trigram_similar=query)
+    )
+    .annotate(
+      search_score=Greatest(
+        TrigramSimilarity("brand", query),
+        TrigramSimilarity("model", query),
+        TrigramSimilarity("appliance_type", query),
+      )
+    )
+    .filter(search_score__gte=TRIGRAM_THRESHOLD)
+    .order_by("-search_score", "id")[:limit]
+  )
+
+
+def _indexed_search(query, limit, queryset, appliance_type):
+  # Over-fetch so filters applied by the queryset still leave a full page
+  ranked = get_index().search(query, limit=limit * 5, appliance_type=appliance_type)
+  appliances = queryset.in_bulk([appliance_id for appliance_id, _ in ranked])
+  results = []
+  for appliance_id, score in ranked:
+    appliance = appliances.get(appliance_id)
+    if appliance is not None:
+      appliance.search_score = score / 100
+      results.append(appliance)
+  return results[:limit]
+
+
+def _substring_search(query, limit, queryset):
+  condition = Q()
+  for token in query.split():
+    condition &= Q(brand__icontains=token) | Q(model__icontains=token)
+  return list(
+    queryset.filter(condition)
+    .annotate(search_score=Value(1.0, output_field=FloatField()))
+    .order_by("brand", "model", "id")[:limit]
+  )
+
+
+def search_appliances(query, limit=20, appliance_type=None, queryset=None):
+  """
+  Typo-tolerant, ranked catalogue search. Uses trigram indexes on Postgres,
+  the in-process RapidFuzz token index elsewhere, and substring matching when
+  RapidFuzz is unavailable.
+  """
+  query = (query or "").strip()
+  if not query:
+    return []
+  queryset = Appliance.objects.all() if queryset is None else queryset
+  if appliance_type:
+    queryset = queryset.filter(appliance_type=appliance_type)
+
+  if connection.vendor == "postgresql":
+    return _postgres_search(query, limit, queryset)
+  if process is not None:
+    return _indexed_search(query, limit, queryset, appliance_type)
+  return _substring_search(query, limit, queryset)
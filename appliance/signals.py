@@ -0,0 +1,201 @@
+#
+#
+#
+#
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from appliance import (
+  analytics,
+  auth_backends,
+  availability,
+  forecasting,
+  images,
+  matching,
+  search,
+)
+from appliance.models import Appliance, Property, PropertyAppliance, Schedule, User
+
+
+# Replacement scores
+#
+#
+#
+@receiver(post_save, sender=Appliance)
+def rescore_catalogue_change(sender, instance, raw=False, **kwargs):
+  if raw:
+    return
+  previous_type = getattr(instance, "_loaded_appliance_type", None)
+  previous_warranty = getattr(instance, "_loaded_warranty_period", None)
+  previous_cost = getattr(instance, "_loaded_cost", None)
+  previous_rating = getattr(instance, "_loaded_efficiency_rating", None)
+  transaction.on_commit(
+    lambda: matching.recompute_for_appliance(
+      instance,
+      previous_type=previous_type,
+      previous_warranty=previous_warranty,
+      previous_cost=previous_cost,
+      previous_rating=previous_rating,
+    )
+  )
+
+
+@receiver(pre_delete, sender=Appliance)
+def rescore_catalogue_removal(sender, instance, **kwargs):
+  # Read before the scores listing it are deleted with it
+  unit_ids = list(
+    instance.candidate_scores.values_list("property_appliance_id", flat=True)
+  )
+  transaction.on_commit(lambda: matching.remove_candidate(instance, unit_ids))
+
+
+@receiver(post_save, sender=PropertyAppliance)
+def rescore_property_appliance(sender, instance, raw=False, **kwargs):
+  if raw:
+    return
+  transaction.on_commit(lambda: matching.recompute_for_property_appliance(instance))
+
+
+# Replacement forecasts
+#
+#
+#
+@receiver(post_save, sender=PropertyAppliance)
+def forecast_property_appliance(sender, instance, raw=False, **kwargs):
+  if raw:
+    return
+  transaction.on_commit(lambda: forecasting.forecast_replacements([instance.id]))
+
+
+@receiver(post_save, sender=Appliance)
+def forecast_catalogue_change(sender, instance, raw=False, created=False, **kwargs):
+  if raw or created:
+    return
+  transaction.on_commit(
+    lambda: forecasting.forecast_replacements(
+      list(instance.appliance_properties.values_list("id", flat=True))
+    )
+  )
+
+
+# Portfolio analytics
+#
+#
+#
+@receiver(post_save, sender=PropertyAppliance)
+@receiver(post_delete, sender=PropertyAppliance)
+def refresh_property_summary(sender, instance, raw=False, **kwargs):
+  if raw:
+    return
+  analytics.refresh_on_commit([instance.property_id])
+
+
+@receiver(post_save, sender=Appliance)
+def refresh_catalogue_summaries(sender, instance, raw=False, created=False, **kwargs):
+  if raw or created:
+    return
+  transaction.on_commit(
+    lambda: analytics.refresh_property_summaries(
+      instance.appliance_properties.values_list("property_id", flat=True).distinct()
+    )
+  )
+
+
+# Availability calendar
+#
+#
+#
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def invalidate_booked_month(sender, instance, **kwargs):
+  # After the commit, so no worker can rebuild the month without the booking
+  # under the new version
+  year, month = instance.date.year, instance.date.month
+  transaction.on_commit(lambda: availability.invalidate_month(year, month))
+
+
+# Catalogue search index
+#
+#
+#
+@receiver(post_save, sender=Appliance)
+@receiver(post_delete, sender=Appliance)
+def invalidate_search_index(sender, instance, **kwargs):
+  transaction.on_commit(search.invalidate_index)
+
+
+# Image variants
+#
+#
+#
+@receiver(post_save, sender=Appliance)
+@receiver(post_save, sender=Property)
+@receiver(post_save, sender=User)
+def generate_image_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+  if raw:
+    return
+  file_field, variants_field = images.VARIANT_FIELDS[sender._meta.label_lower]
+  if update_fields is not None and file_field not in update_fields:
+    return
+  fieldfile = getattr(instance, file_field)
+  if not fieldfile and not getattr(instance, variants_field):
+    return
+  if fieldfile and images.variants_are_current(
+    fieldfile, getattr(instance, variants_field)
+  ):
+    return
+  if fieldfile and not settings.IMAGE_VARIANTS_INLINE:
+    # Encoded by generate_image_variants --watch
+    return
+  transaction.on_commit(lambda: images.refresh_variants(instance))
+
+
+# Cached users
+#
+#
+#
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+  auth_backends.invalidate_users([instance.pk])
+
+
+def _permission_user_ids(sender, instance, reverse, pk_set):
+  """Users whose permissions a change to one of the auth m2m relations affects"""
+  if sender is Group.permissions.through:
+    if not reverse:
+      return instance.user_set.values_list("pk", flat=True)
+    groups = pk_set if pk_set is not None else instance.group_set.all()
+    return (
+      User.objects.filter(groups__in=groups).values_list("pk", flat=True).distinct()
+    )
+  if not reverse:
+    return [instance.pk]
+  if pk_set is not None:
+    return pk_set
+  return instance.user_set.values_list("pk", flat=True)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+  # A clear has no pk_set, so who it affects is read before the rows go
+  if action == "pre_clear":
+    instance._cleared_user_ids = list(
+      _permission_user_ids(sender, instance, reverse, None)
+    )
+  elif action == "post_clear":
+    auth_backends.invalidate_users(instance.__dict__.pop("_cleared_user_ids", []))
+  elif action in ("post_add", "post_remove"):
+    auth_backends.invalidate_users(
+      list(_permission_user_ids(sender, instance, reverse, pk_set))
+    )
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_group_members(sender, instance, **kwargs):
+  auth_backends.invalidate_users(list(instance.user_set.values_list("pk", flat=True)))
@@ -0,0 +1,107 @@
+#
+#
+#
+#
+import json
+import os
+import sys
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+@dataclass
+class SMSMessage:
+  to: str
+  body: str
+  idempotency_key: str = ""
+
+
+def get_connection(backend=None, fail_silently=False, **kwargs):
+  """Returns an SMS backend instance, like django.core.mail.get_connection"""
+  backend_class = import_string(backend or settings.SMS_BACKEND)
+  return backend_class(fail_silently=fail_silently, **kwargs)
+
+
+# Backends
+#
+#
+#
+class BaseSMSBackend(ABC):
+  """
+  Backends follow the Django email backend API. A provider backend opens its
+  HTTP session in open(), reuses it for every send_messages() call until
+  close(), and forwards each message's idempotency key to the provider.
+  """
+
+  def __init__(self, fail_silently=False, **kwargs):
+    self.fail_silently = fail_silently
+
+  def open(self):
+    return False
+
+  def close(self):  # noqa: B027 - optional, like open()
+    pass
+
+  def __enter__(self):
+    self.open()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  @abstractmethod
+  def send_messages(self, messages):
+    """Sends the messages and returns how many were sent"""
+
+
+class ConsoleSMSBackend(BaseSMSBackend):
+  """Writes messages to stdout"""
+
+  def __init__(self, *args, stream=None, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.stream = stream or sys.stdout
+    self._lock = threading.RLock()
+
+  def format(self, message):
+    return (
+      f"To: {message.to}\n"
+      f"Idempotency-Key: {message.idempotency_key}\n\n"
+      f"{message.body}\n" + "-" * 79 + "\n"
+    )
+
+  def send_messages(self, messages):
+    with self._lock:
+      for message in messages:
+        self.stream.write(self.format(message))
+      self.stream.flush()
+    return len(messages)
+
+
+class FileSMSBackend(BaseSMSBackend):
+  """Appends messages as JSON lines to one file per connection in SMS_FILE_PATH"""
+
+  def __init__(self, *args, file_path=None, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.file_path = os.path.abspath(file_path or settings.SMS_FILE_PATH)
+    os.makedirs(self.file_path, exist_ok=True)
+    self._fname = None
+    self._lock = threading.RLock()
+
+  def _get_filename(self):
+    if self._fname is None:
+      timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+      self._fname = os.path.join(self.file_path, f"{timestamp}-{id(self)}.jsonl")
+    return self._fname
+
+  def close(self):
+    self._fname = None
+
+  def send_messages(self, messages):
+    with self._lock, open(self._get_filename(), "a") as handle:
+      handle.writelines(json.dumps(asdict(message)) + "\n" for message in messages)
+    return len(messages)
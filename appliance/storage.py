@@ -0,0 +1,200 @@
+#
+#
+#
+#
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+import botocore
+from botocore.config import Config
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
+from storages.backends.s3 import S3Storage
+from storages.utils import clean_name
+
+from appliance import metrics
+from appliance.images import FORMATS, VARIANT_ROOT
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CONTENT_TYPES = {f".{extension}": spec[1] for extension, spec in FORMATS.items()}
+
+
+# URL cache
+#
+#
+#
+class TTLCache:
+  """Thread-safe LRU whose entries also expire after a per-entry lifetime"""
+
+  def __init__(self, maxsize):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[1] > monotonic():
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+      if entry is not None:
+        del self._entries[key]
+      self.misses += 1
+      return None
+
+  def set(self, key, value, ttl):
+    with self._lock:
+      self._entries[key] = (value, monotonic() + ttl)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.hits = self.misses = 0
+
+
+url_cache = TTLCache(settings.MEDIA_URL_CACHE_SIZE)
+
+
+# Shared connections
+#
+#
+#
+_connections = threading.local()
+
+
+def _reset_connections():
+  # boto3 sessions and their connection pools must not cross a fork
+  global _connections
+  _connections = threading.local()
+  url_cache.clear()
+
+
+os.register_at_fork(after_in_child=_reset_connections)
+
+
+def shared_resource(storage, signed=True):
+  """
+  Returns the S3 resource for the storage's endpoint and credentials, created
+  once per thread and reused by every storage instance in the process.
+  """
+  resources = getattr(_connections, "resources", None)
+  if resources is None:
+    resources = _connections.resources = {}
+
+  key = (
+    signed,
+    storage.session_profile,
+    storage.access_key,
+    storage.secret_key,
+    storage.security_token,
+    storage.region_name,
+    storage.endpoint_url,
+    storage.use_ssl,
+    storage.verify,
+  )
+  resource = resources.get(key)
+  if resource is None:
+    config = storage.client_config
+    if not signed:
+      config = config.merge(Config(signature_version=botocore.UNSIGNED))
+    resource = resources[key] = storage._create_session().resource(
+      "s3",
+      region_name=storage.region_name,
+      use_ssl=storage.use_ssl,
+      endpoint_url=storage.endpoint_url,
+      config=config,
+      verify=storage.verify,
+    )
+    resource.meta.client.meta.events.register("before-call.s3", metrics.record_s3_call)
+  return resource
+
+
+# Media storage
+#
+#
+#
+class MediaStorage(S3Storage):
+  """
+  S3 storage for uploads. Image variants live under content-hashed names that
+  never change, so they are served with a one year immutable cache lifetime.
+
+  URLs are memoized per (storage, name). Public buckets, behind a custom domain
+  or path-addressed, get plain URLs built without signing or boto3 calls;
+  presigned URLs are reused for at most half of their validity.
+  """
+
+  def get_default_settings(self):
+    return {
+      **super().get_default_settings(),
+      "url_cache_ttl": settings.MEDIA_URL_CACHE_TTL,
+    }
+
+  @property
+  def connection(self):
+    return shared_resource(self, signed=True)
+
+  @property
+  def unsigned_connection(self):
+    return shared_resource(self, signed=False)
+
+  @property
+  def cache_namespace(self):
+    return (
+      self.endpoint_url,
+      self.custom_domain,
+      self.bucket_name,
+      self.location,
+      self.querystring_auth,
+    )
+
+  def get_object_parameters(self, name):
+    params = super().get_object_parameters(name)
+    if name.startswith(f"{VARIANT_ROOT}/"):
+      params.setdefault("CacheControl", IMMUTABLE_CACHE_CONTROL)
+      for suffix, content_type in CONTENT_TYPES.items():
+        if name.endswith(suffix):
+          params.setdefault("ContentType", content_type)
+    return params
+
+  @property
+  def signs_urls(self):
+    if not self.querystring_auth:
+      return False
+    return not self.custom_domain or self.cloudfront_signer is not None
+
+  def public_url(self, name):
+    """Builds the URL of an object in a public path-addressed bucket"""
+    if (
+      self.querystring_auth
+      or self.custom_domain
+      or not self.endpoint_url
+      or self.addressing_style != "path"
+    ):
+      return None
+    name = self._normalize_name(clean_name(name))
+    return f"{self.endpoint_url.rstrip('/')}/{self.bucket_name}/{filepath_to_uri(name)}"
+
+  def url(self, name, parameters=None, expire=None, http_method=None):
+    if parameters or expire is not None or http_method:
+      return super().url(name, parameters, expire, http_method)
+
+    key = (self.cache_namespace, name)
+    url = url_cache.get(key)
+    if url is None:
+      url = self.public_url(name) or super().url(name)
+      ttl = self.url_cache_ttl
+      if self.signs_urls:
+        ttl = min(ttl, self.querystring_expire // 2)
+      url_cache.set(key, url, ttl)
+    return url
@@ -0,0 +1,65 @@
+#
+#
+#
+#
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.template import engines
+from django.template.backends.django import DjangoTemplates, Template
+
+from appliance import metrics
+
+
+# Timed templates
+#
+#
+#
+class TimedTemplate(Template):
+  """Adds the render time of each top-level template to the current request"""
+
+  def render(self, context=None, request=None):
+    started = time.perf_counter()
+    try:
+      return super().render(context, request)
+    finally:
+      metrics.record_template(time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+  def from_string(self, template_code):
+    template = super().from_string(template_code)
+    return TimedTemplate(template.template, self)
+
+  def get_template(self, template_name):
+    template = super().get_template(template_name)
+    return TimedTemplate(template.template, self)
+
+
+# Warm-up
+#
+#
+#
+def app_template_names(app_label="appliance"):
+  """Names of every template shipped under the app's templates directory"""
+  root = Path(apps.get_app_config(app_label).path) / "templates"
+  return sorted(path.relative_to(root).as_posix() for path in root.rglob("*.html"))
+
+
+def warm_templates():
+  """
+  Compiles every app template into the cached loader so the first request
+  of each worker does not pay for it. Called from gunicorn.conf.py; with
+  preload_app the master warms once and workers inherit the compiled
+  templates. Returns the number of templates compiled.
+  """
+  if not settings.TEMPLATE_CACHE:
+    # Nothing would keep the compiled templates
+    return 0
+  names = app_template_names()
+  for engine in engines.all():
+    for name in names:
+      engine.get_template(name)
+  return len(names)
@@ -2,9 +2,14 @@
 #
 #
 #
+import json
 from datetime import datetime
 
 from django import template
+from django.core.serializers.json import DjangoJSONEncoder
+
+from appliance import fragments
+from appliance.images import FORMATS, variants_are_current
 
 register = template.Library()
 
@@ -53,6 +58,16 @@ def get(value, arg):
   return value
 
 
+#
+#
+#
+#
+@register.filter
+def to_json(value):
+  """For data- attributes; autoescaping keeps the quotes inside the attribute"""
+  return json.dumps(value, cls=DjangoJSONEncoder)
+
+
 #
 #
 #
@@ -63,3 +78,91 @@ def parse_date(value):
     return datetime.strptime(value, "%Y-%m-%d")
   except (ValueError, TypeError):
     return None
+
+
+#
+#
+#
+#
+@register.inclusion_tag("partial/picture.html")
+def picture(fieldfile, alt="", sizes="100vw", **attrs):
+  """
+  Renders an upload as a <picture> with a srcset per generated format, falling
+  back to the original file until its variants exist.
+  """
+  attrs.setdefault("loading", "lazy")
+  attrs.setdefault("decoding", "async")
+  context = {"alt": alt, "attrs": attrs, "sources": [], "src": ""}
+  if not fieldfile:
+    return context
+
+  variants = getattr(fieldfile.instance, f"{fieldfile.field.name}_variants", None)
+  # Variants of a replaced upload still show the old image
+  if not variants_are_current(fieldfile, variants):
+    variants = None
+  formats = (variants or {}).get("formats", {})
+  storage = fieldfile.storage
+  for extension, (_, content_type) in FORMATS.items():
+    candidates = formats.get(extension)
+    if not candidates:
+      continue
+    context["sources"].append(
+      {
+        "type": content_type,
+        "srcset": ", ".join(
+          f"{storage.url(name)} {width}w" for width, name in candidates
+        ),
+        "sizes": sizes,
+      }
+    )
+    # The largest WebP doubles as the <img> fallback
+    context["src"] = storage.url(candidates[-1][1])
+
+  if not context["src"]:
+    context["src"] = fieldfile.url
+  return context
+
+
+#
+#
+#
+#
+class FragmentCacheNode(template.Node):
+  def __init__(self, nodelist, name, vary_on):
+    self.nodelist = nodelist
+    self.name = name
+    self.vary_on = vary_on
+
+  def render(self, context):
+    # Read once per page render, however many rows are cached
+    memo = context.render_context.dicts[0]
+    if FragmentCacheNode not in memo:
+      memo[FragmentCacheNode] = fragments.generation()
+    vary_on = [var.resolve(context) for var in self.vary_on]
+    return fragments.get_or_render(
+      self.name,
+      vary_on,
+      lambda: self.nodelist.render(context),
+      memo[FragmentCacheNode],
+    )
+
+
+@register.tag
+def fragmentcache(parser, token):
+  """
+  Caches a fragment until a value it varies on changes or fragments.invalidate()
+  is called:
+
+    {% fragmentcache "name" row.id row.updated_at %} ... {% endfragmentcache %}
+  """
+  nodelist = parser.parse(("endfragmentcache",))
+  parser.delete_first_token()
+  tokens = token.split_contents()
+  if len(tokens) < 3:
+    raise template.TemplateSyntaxError(
+      f"{tokens[0]!r} takes a fragment name and the values it varies on"
+    )
+  name = tokens[1].strip("\"'")
+  return FragmentCacheNode(
+    nodelist, name, [parser.compile_filter(token) for token in tokens[2:]]
+  )
@@ -2,23 +2,90 @@
 #
 #
 #
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
 from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-from django.test import Client, TestCase
+import zstandard
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template, engines
+from django.template.loader import render_to_string
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from PIL import Image
 
+from appliance import metrics
+from appliance.analytics import portfolio_summary, refresh_property_summaries
+from appliance.auth_backends import CachedModelBackend
+from appliance.availability import (
+  MONTH_TIMEOUT,
+  build_availability_context,
+  get_availability_context,
+  month_availability,
+  seconds_until_midnight,
+)
+from appliance.cache_backends import CULL_CHECK_INTERVAL, FileBasedCache
+from appliance.forecasting import Fleet, forecast, forecast_replacements
+from appliance.forms import ScheduleForm
+from appliance.images import FORMATS, VARIANT_WIDTHS, pending_variants
+from appliance.importers import ApplianceImporter, checkpoint_path, write_checkpoint
+from appliance.management.commands.generate_image_variants import (
+  Command as GenerateImageVariants,
+)
 from appliance.models import (
   Appliance,
   ApplianceType,
+  DeliveryStatus,
   EfficiencyRating,
+  Notification,
+  NotificationKind,
+  OutboxMessage,
   Property,
   PropertyAppliance,
+  PropertySummary,
+  PropertyTypeSpend,
+  ReplacementForecast,
+  ReplacementScore,
   Schedule,
   Usage,
   User,
   UserProperty,
 )
+from appliance.notifications import LATEST_TIMEOUT, notify_landlords
+from appliance.outbox import Dispatcher, enqueue_schedule_notifications, retry_delay
+from appliance.pagination import EstimatedCountPaginator, encode_cursor
+from appliance.search import (
+  INDEX_CHECK_INTERVAL,
+  get_index,
+  invalidate_index,
+  search_appliances,
+)
+from appliance.storage import (
+  IMMUTABLE_CACHE_CONTROL,
+  MediaStorage,
+  TTLCache,
+  url_cache,
+)
+from appliance.template_backends import app_template_names, warm_templates
 
 
 class ViewTests(TestCase):
@@ -45,7 +112,6 @@ class ViewTests(TestCase):
       model="Test Model",
       cost=1000,
       efficiency_rating=EfficiencyRating.GOOD.value,
-      matching_score=0.8,
     )
 
     # Create test property appliance
@@ -159,3 +225,2325 @@ class ViewTests(TestCase):
     self.assertEqual(
       self.property_appliance.get_usage_color(), "text-warning"
     )  # For MEDIUM usage
+
+
+# Test storages that resolve media and static URLs without S3 or a manifest
+#
+#
+#
+LOCAL_STORAGES = {
+  "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+  "staticfiles": {
+    "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+  },
+}
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class PropertyDashboardTests(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(
+      username="landlord",
+      password="testpass123",
+      profile_pic="user_pictures/landlord.png",
+    )
+    self.client = Client()
+    self.client.login(username="landlord", password="testpass123")
+    self.property = Property.objects.create(name="Block A", address="1 Mill Lane")
+    self.user_property = UserProperty.objects.create(
+      user=self.user, property=self.property
+    )
+
+  def add_appliances(self, count):
+    # Models stay unique across calls, as (brand, model) is
+    created = Appliance.objects.count()
+    for i in range(count):
+      appliance = Appliance.objects.create(
+        appliance_type=ApplianceType.OVEN.name,
+        brand="Brand",
+        model=f"Model {created + i}",
+        cost=100 + i,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+        image="appliance_pictures/oven.png",
+      )
+      property_appliance = PropertyAppliance.objects.create(
+        property=self.property, appliance=appliance, usage=Usage.LOW.value
+      )
+      Schedule.objects.create(
+        property_appliance=property_appliance,
+        replacement_appliance=appliance,
+        date=date.today() + timedelta(days=1),
+        hour=9,
+        minute=0,
+      )
+
+  def count_property_view_queries(self):
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(reverse("property_view", args=[self.user_property.id]))
+    self.assertEqual(response.status_code, 200)
+    return len(queries)
+
+  def test_with_dashboard_walks_graph_without_extra_queries(self):
+    self.add_appliances(3)
+    with self.assertNumQueries(3):
+      user_property = UserProperty.objects.with_dashboard().get(
+        id=self.user_property.id
+      )
+    with self.assertNumQueries(0):
+      for property_appliance in user_property.property.property_appliances.all():
+        property_appliance.is_within_warranty()
+        for schedule in property_appliance.schedules.all():
+          str(schedule.property_appliance.appliance)
+          str(schedule.replacement_appliance)
+
+  def test_property_view_query_count_is_constant(self):
+    self.add_appliances(1)
+    baseline = self.count_property_view_queries()
+    self.add_appliances(20)
+    self.assertEqual(self.count_property_view_queries(), baseline)
+
+  def test_add_property_appliance_submit_renders_row(self):
+    self.add_appliances(1)
+    appliance = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Brand",
+      model="Model new",
+      cost=100,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+    )
+    response = self.client.post(
+      reverse("add_property_appliance_submit"),
+      {"appliance": appliance.id, "property": self.user_property.id, "usage": "low"},
+    )
+    self.assertEqual(response.status_code, 200)
+    self.assertTemplateUsed(response, "partial/property_view/appliance_row.html")
+
+  def test_add_property_appliance_submit_rejects_installed_appliance(self):
+    self.add_appliances(1)
+    appliance = Appliance.objects.first()
+    response = self.client.post(
+      reverse("add_property_appliance_submit"),
+      {"appliance": appliance.id, "property": self.user_property.id, "usage": "low"},
+    )
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(PropertyAppliance.objects.filter(appliance=appliance).count(), 1)
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class BulkOnboardingTests(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.force_login(self.user)
+    self.property = Property.objects.create(name="Block A", address="1 Mill Lane")
+    self.user_property = UserProperty.objects.create(
+      user=self.user, property=self.property
+    )
+    self.catalogue = Appliance.objects.bulk_create(
+      Appliance(
+        appliance_type=ApplianceType.OVEN.name,
+        brand="Brand",
+        model=f"Model {i}",
+        cost=100 + i,
+        warranty_period=timedelta(days=365),
+        efficiency_rating=EfficiencyRating.GOOD.value,
+      )
+      for i in range(30)
+    )
+
+  def rows(self, appliances, **fields):
+    data = {"rows-TOTAL_FORMS": len(appliances), "rows-INITIAL_FORMS": 0}
+    for i, appliance in enumerate(appliances):
+      data[f"rows-{i}-appliance"] = appliance.id
+      data[f"rows-{i}-usage"] = Usage.MEDIUM.value
+      for name, value in fields.items():
+        data[f"rows-{i}-{name}"] = value
+    return data
+
+  def bulk_add(self, data, user_property=None):
+    user_property = user_property or self.user_property
+    return self.client.post(
+      reverse("bulk_add_property_appliances", args=[user_property.id]), data
+    )
+
+  def test_bulk_add_installs_every_row_in_one_fragment(self):
+    with self.captureOnCommitCallbacks(execute=True):
+      response = self.bulk_add(self.rows(self.catalogue[:3], actual_cost=90))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response["HX-Trigger"], "refreshApplianceList")
+    self.assertTemplateUsed(response, "partial/property_view/appliance_rows.html")
+    for appliance in self.catalogue[:3]:
+      self.assertContains(response, appliance.model)
+
+    units = PropertyAppliance.objects.filter(property=self.property)
+    self.assertEqual(units.count(), 3)
+    for unit in units:
+      self.assertEqual(unit.usage, Usage.MEDIUM.value)
+      self.assertEqual(unit.actual_cost, 90)
+      self.assertEqual(unit.warranty_ends_on, unit.compute_warranty_ends_on())
+    # The work of the per-unit post_save receivers runs once for the batch
+    self.assertEqual(ReplacementForecast.objects.count(), 3)
+    self.assertEqual(PropertySummary.objects.get().appliance_count, 3)
+    notification = Notification.objects.get(user=self.user)
+    self.assertEqual(notification.message, "3 appliances added to Block A")
+
+  def test_bulk_add_query_count_is_constant(self):
+    counts = []
+    for appliances in (self.catalogue[:2], self.catalogue[2:30]):
+      with CaptureQueriesContext(connection) as queries:
+        response = self.bulk_add(self.rows(appliances))
+      self.assertEqual(response.status_code, 200)
+      counts.append(len(queries))
+    self.assertEqual(counts[0], counts[1])
+
+  def test_bulk_add_skips_rows_without_an_appliance(self):
+    data = self.rows(self.catalogue[:2])
+    del data["rows-1-appliance"]
+    response = self.bulk_add(data)
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(PropertyAppliance.objects.count(), 1)
+
+  def test_bulk_add_rejects_the_whole_batch(self):
+    PropertyAppliance.objects.create(
+      property=self.property, appliance=self.catalogue[1], usage=Usage.LOW.value
+    )
+    data = self.rows(self.catalogue[:3])
+    data["rows-2-appliance"] = 0
+    response = self.bulk_add(data)
+    self.assertEqual(response.status_code, 400)
+    errors = response.json()["errors"]
+    self.assertEqual(errors[0], {})
+    self.assertEqual(
+      errors[1]["appliance"][0]["message"],
+      "This appliance is already installed at the property",
+    )
+    self.assertEqual(errors[2]["appliance"][0]["message"], "Invalid appliance")
+    self.assertEqual(PropertyAppliance.objects.count(), 1)
+
+    response = self.bulk_add(self.rows([self.catalogue[4], self.catalogue[4]]))
+    self.assertEqual(response.status_code, 400)
+    response = self.bulk_add({"rows-TOTAL_FORMS": 0, "rows-INITIAL_FORMS": 0})
+    self.assertEqual(response.status_code, 400)
+
+  def test_bulk_add_is_limited_to_own_properties(self):
+    other = UserProperty.objects.create(
+      user=User.objects.create_user(username="other"), property=self.property
+    )
+    response = self.bulk_add(self.rows(self.catalogue[:1]), user_property=other)
+    self.assertEqual(response.status_code, 404)
+
+  def test_clone_copies_the_appliance_set(self):
+    for appliance in self.catalogue[:3]:
+      PropertyAppliance.objects.create(
+        property=self.property,
+        appliance=appliance,
+        usage=Usage.HIGH.value,
+        actual_warranty_period=timedelta(days=30),
+      )
+    targets = [
+      UserProperty.objects.create(
+        user=self.user,
+        property=Property.objects.create(name=f"Block {name}", address="2 Mill Lane"),
+      )
+      for name in "BC"
+    ]
+    # Already installed on the first target, so skipped there
+    PropertyAppliance.objects.create(
+      property=targets[0].property, appliance=self.catalogue[0], usage="low"
+    )
+    not_owned = Property.objects.create(name="Block D", address="3 Mill Lane")
+    UserProperty.objects.create(
+      user=User.objects.create_user(username="other"), property=not_owned
+    )
+
+    with self.captureOnCommitCallbacks(execute=True):
+      response = self.client.post(
+        reverse("clone_appliance_set", args=[self.user_property.id]),
+        {"targets": [target.id for target in targets]},
+      )
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, "Copied 5 appliances")
+    for target, count in zip(targets, (3, 3), strict=True):
+      units = PropertyAppliance.objects.filter(property=target.property)
+      self.assertEqual(units.count(), count)
+    cloned = PropertyAppliance.objects.filter(
+      property=targets[1].property, appliance=self.catalogue[2]
+    ).get()
+    self.assertEqual(cloned.usage, Usage.HIGH.value)
+    self.assertEqual(cloned.warranty_ends_on, cloned.compute_warranty_ends_on())
+    self.assertEqual(ReplacementForecast.objects.count(), 5)
+
+    response = self.client.post(
+      reverse("clone_appliance_set", args=[self.user_property.id]),
+      {"targets": [not_owned.landlords.get().id]},
+    )
+    self.assertEqual(response.status_code, 400)
+    self.assertFalse(PropertyAppliance.objects.filter(property=not_owned).exists())
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class FragmentCacheTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    metrics.registry.reset()
+    self.addCleanup(metrics.registry.reset)
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.force_login(self.user)
+    self.property = Property.objects.create(name="Block A", address="1 Mill Lane")
+    self.user_property = UserProperty.objects.create(
+      user=self.user, property=self.property
+    )
+    self.units = [
+      PropertyAppliance.objects.create(
+        property=self.property,
+        appliance=Appliance.objects.create(
+          appliance_type=ApplianceType.OVEN.name,
+          brand="Brand",
+          model=f"Model {i}",
+          cost=100 + i,
+          efficiency_rating=EfficiencyRating.GOOD.value,
+        ),
+        usage=Usage.LOW.value,
+      )
+      for i in range(5)
+    ]
+
+  def lookups(self, result):
+    return metrics.registry.value(
+      "fragment_cache_requests_total", fragment="appliance_row", result=result
+    )
+
+  def render_property(self):
+    response = self.client.get(reverse("property_view", args=[self.user_property.id]))
+    self.assertEqual(response.status_code, 200)
+    return response
+
+  def test_hot_property_page_serves_rows_from_cache(self):
+    first = self.render_property()
+    self.assertEqual((self.lookups("hit"), self.lookups("miss")), (0, 5))
+    second = self.render_property()
+    self.assertEqual((self.lookups("hit"), self.lookups("miss")), (5, 5))
+    rows = first.content.decode().split('id="appliance-list"')[1].split("</tbody>")[0]
+    self.assertIn(rows, second.content.decode())
+
+  def test_saving_a_row_re_renders_only_that_row(self):
+    self.render_property()
+    unit = self.units[0]
+    with self.captureOnCommitCallbacks(execute=True):
+      unit.usage = Usage.HIGH.value
+      unit.save()
+    response = self.render_property()
+    self.assertEqual((self.lookups("hit"), self.lookups("miss")), (4, 6))
+    self.assertContains(response, "High")
+
+  def test_bookings_leave_cached_rows_alone(self):
+    self.render_property()
+    with self.captureOnCommitCallbacks(execute=True):
+      Schedule.objects.create(
+        property_appliance=self.units[0],
+        replacement_appliance=self.units[1].appliance,
+        date=timezone.localdate() + timedelta(days=7),
+        hour=9,
+        minute=0,
+      )
+    self.render_property()
+    self.assertEqual((self.lookups("hit"), self.lookups("miss")), (5, 5))
+
+  def test_writes_without_signals_change_the_row_key(self):
+    self.render_property()
+    unit = self.units[0]
+    unit.appliance.warranty_period = timedelta(days=0)
+    # A queryset update skips the signals and auto_now
+    Appliance.objects.filter(id=unit.appliance_id).update(
+      warranty_period=timedelta(days=0)
+    )
+    PropertyAppliance.objects.filter(id=unit.id).refresh_warranty_ends_on()
+    self.render_property()
+    self.assertEqual((self.lookups("hit"), self.lookups("miss")), (4, 6))
+
+  def test_fragments_vary_on_their_values(self):
+    template = Template(
+      "{% load appliance_filters %}"
+      '{% fragmentcache "greeting" name %}Hello {{ name }}{% endfragmentcache %}'
+    )
+    self.assertEqual(template.render(Context({"name": "Ada"})), "Hello Ada")
+    self.assertEqual(template.render(Context({"name": "Bob"})), "Hello Bob")
+    self.assertEqual(template.render(Context({"name": "Ada"})), "Hello Ada")
+    self.assertEqual(
+      metrics.registry.value(
+        "fragment_cache_requests_total", fragment="greeting", result="hit"
+      ),
+      1,
+    )
+
+
+class WarrantyEndsOnTests(TestCase):
+  def setUp(self):
+    self.appliance = Appliance.objects.create(
+      appliance_type=ApplianceType.DRYER.name,
+      brand="Brand",
+      model="Dryer",
+      cost=300,
+      efficiency_rating=EfficiencyRating.HIGH.value,
+      warranty_period=timedelta(days=365),
+    )
+
+  def create_property_appliance(self, purchase_date, **kwargs):
+    # A property holds at most one unit of a catalogue appliance
+    return PropertyAppliance.objects.create(
+      property=Property.objects.create(name="Block B", address="2 Mill Lane"),
+      appliance=self.appliance,
+      usage=Usage.LOW.value,
+      purchase_date=purchase_date,
+      **kwargs,
+    )
+
+  def test_warranty_ends_on_is_kept_in_sync_on_save(self):
+    purchase_date = date(2024, 1, 1)
+    property_appliance = self.create_property_appliance(purchase_date)
+    self.assertEqual(
+      property_appliance.warranty_ends_on, purchase_date + timedelta(days=365)
+    )
+
+    property_appliance.actual_warranty_period = timedelta(days=30)
+    property_appliance.save(update_fields=["actual_warranty_period"])
+    property_appliance.refresh_from_db()
+    self.assertEqual(
+      property_appliance.warranty_ends_on, purchase_date + timedelta(days=30)
+    )
+
+  def test_catalogue_warranty_change_updates_inheriting_rows(self):
+    inheriting = self.create_property_appliance(date(2024, 1, 1))
+    overridden = self.create_property_appliance(
+      date(2024, 1, 1), actual_warranty_period=timedelta(days=10)
+    )
+
+    appliance = Appliance.objects.get(id=self.appliance.id)
+    appliance.warranty_period = timedelta(days=730)
+    appliance.save()
+
+    inheriting.refresh_from_db()
+    overridden.refresh_from_db()
+    self.assertEqual(inheriting.warranty_ends_on, date(2025, 12, 31))
+    self.assertEqual(overridden.warranty_ends_on, date(2024, 1, 11))
+
+  def test_warranty_status_querysets(self):
+    today = timezone.now().date()
+    expired = self.create_property_appliance(today - timedelta(days=400))
+    expiring = self.create_property_appliance(today - timedelta(days=350))
+    covered = self.create_property_appliance(today)
+
+    self.assertQuerySetEqual(
+      PropertyAppliance.objects.out_of_warranty(), [expired], ordered=False
+    )
+    self.assertQuerySetEqual(
+      PropertyAppliance.objects.warranty_expiring(days=30), [expiring], ordered=False
+    )
+    self.assertQuerySetEqual(
+      PropertyAppliance.objects.within_warranty(),
+      [expiring, covered],
+      ordered=False,
+    )
+    self.assertFalse(expired.is_within_warranty())
+    self.assertTrue(covered.is_within_warranty())
+
+
+class ReplacementMatchingTests(TestCase):
+  def setUp(self):
+    self.property = Property.objects.create(name="Block C", address="3 Mill Lane")
+    self.current = self.create_appliance("Current", 500, EfficiencyRating.BAD)
+    self.cheap_efficient = self.create_appliance(
+      "Cheap efficient", 400, EfficiencyRating.VERY_HIGH
+    )
+    self.pricey_inefficient = self.create_appliance(
+      "Pricey inefficient", 900, EfficiencyRating.VERY_LOW
+    )
+    self.other_type = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Brand",
+      model="Oven",
+      cost=100,
+      efficiency_rating=EfficiencyRating.VERY_HIGH.value,
+    )
+    self.property_appliance = PropertyAppliance.objects.create(
+      property=self.property, appliance=self.current, usage=Usage.HIGH.value
+    )
+
+  def create_appliance(self, model, cost, efficiency_rating):
+    return Appliance.objects.create(
+      appliance_type=ApplianceType.FREEZER.name,
+      brand="Brand",
+      model=model,
+      cost=cost,
+      efficiency_rating=efficiency_rating.value,
+    )
+
+  def test_score_matrix_is_batched_and_bounded(self):
+    import numpy as np
+
+    from appliance.matching import score_matrix
+
+    scores = score_matrix(
+      np.array([500, 100]),
+      np.array([2, 6]),
+      np.array([3, 0]),
+      np.array([400, 900, 100]),
+      np.array([6, 0, 3]),
+      np.array([365, 730, 0]),
+    )
+    self.assertEqual(scores.shape, (2, 3))
+    self.assertTrue(((scores >= 0) & (scores <= 1)).all())
+    self.assertGreater(scores[0, 0], scores[0, 1])
+
+  def test_recompute_ranks_same_type_candidates_only(self):
+    from appliance.matching import recompute_scores
+
+    self.assertEqual(recompute_scores(), 1)
+    ranked = list(
+      self.property_appliance.replacement_scores.order_by("-score").values_list(
+        "candidate_id", flat=True
+      )
+    )
+    self.assertEqual(ranked, [self.cheap_efficient.id, self.pricey_inefficient.id])
+
+  def test_catalogue_change_rescores_incrementally(self):
+    from appliance.matching import recompute_scores
+
+    recompute_scores()
+    with self.captureOnCommitCallbacks(execute=True):
+      self.pricey_inefficient.cost = 100
+      self.pricey_inefficient.efficiency_rating = EfficiencyRating.VERY_HIGH.value
+      self.pricey_inefficient.save()
+    best = self.property_appliance.replacement_scores.order_by("-score").first()
+    self.assertEqual(best.candidate, self.pricey_inefficient)
+
+  def ranking(self):
+    return list(
+      ReplacementScore.objects.order_by(
+        "property_appliance_id", "-score", "candidate_id"
+      ).values_list("property_appliance_id", "candidate_id", "score")
+    )
+
+  @override_settings(MATCHING_TOP_K=2)
+  def test_catalogue_changes_merge_into_the_top_k(self):
+    from appliance.matching import recompute_scores
+
+    other_unit = PropertyAppliance.objects.create(
+      property=self.property, appliance=self.cheap_efficient, usage=Usage.LOW.value
+    )
+    recompute_scores()
+    with (
+      mock.patch(
+        "appliance.matching.recompute_scores", wraps=recompute_scores
+      ) as recompute,
+      self.captureOnCommitCallbacks(execute=True),
+    ):
+      best = self.create_appliance("Best", 300, EfficiencyRating.VERY_HIGH)
+    # Only the new row was scored, against each unit
+    recompute.assert_not_called()
+    merged = self.ranking()
+    self.assertIn(
+      (self.property_appliance.id, best.id),
+      [(unit_id, candidate_id) for unit_id, candidate_id, _ in merged],
+    )
+    self.assertEqual(self.property_appliance.replacement_scores.count(), 2)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      best.cost = 5000
+      best.efficiency_rating = EfficiencyRating.VERY_LOW.value
+      best.save()
+    with self.captureOnCommitCallbacks(execute=True):
+      self.pricey_inefficient.delete()
+    merged = self.ranking()
+    # Merging gave the same ranking as recomputing from scratch
+    recompute_scores()
+    self.assertEqual(merged, self.ranking())
+    self.assertEqual(other_unit.replacement_scores.count(), 2)
+
+  def test_editing_an_installed_appliance_rescores_its_units(self):
+    from appliance.matching import recompute_scores
+
+    recompute_scores()
+    with self.captureOnCommitCallbacks(execute=True):
+      self.current.cost = 2000
+      self.current.save()
+    merged = self.ranking()
+    recompute_scores()
+    self.assertEqual(merged, self.ranking())
+
+  def test_a_new_longest_warranty_recomputes_the_type(self):
+    from appliance.matching import recompute_scores
+
+    recompute_scores()
+    with self.captureOnCommitCallbacks(execute=True):
+      Appliance.objects.create(
+        appliance_type=ApplianceType.FREEZER.name,
+        brand="Brand",
+        model="Long warranty",
+        cost=700,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+        warranty_period=timedelta(days=3650),
+      )
+    merged = self.ranking()
+    recompute_scores()
+    self.assertEqual(merged, self.ranking())
+
+  def test_units_without_candidates_are_scored_once(self):
+    from appliance.matching import top_replacements
+
+    unit = PropertyAppliance.objects.create(
+      property=self.property, appliance=self.other_type, usage=Usage.LOW.value
+    )
+    unit.refresh_from_db()
+    self.assertEqual(list(top_replacements(unit)), [])
+    unit.refresh_from_db()
+    self.assertIsNotNone(unit.scores_computed_at)
+    with mock.patch("appliance.matching.recompute_scores") as recompute:
+      self.assertEqual(list(top_replacements(unit)), [])
+    recompute.assert_not_called()
+
+  def test_recompute_command_respects_top_k(self):
+    call_command("recompute_matching_scores", "--top-k", "1", stdout=StringIO())
+    self.assertEqual(self.property_appliance.replacement_scores.count(), 1)
+
+  @override_settings(STORAGES=LOCAL_STORAGES)
+  def test_property_appliance_view_lists_top_replacements(self):
+    User.objects.create_user(
+      username="ranker", password="testpass123", profile_pic="user_pictures/r.png"
+    )
+    Appliance.objects.update(image="appliance_pictures/freezer.png")
+    self.client.login(username="ranker", password="testpass123")
+    response = self.client.get(
+      reverse("property_appliance_view", args=[self.property.id, self.current.id])
+    )
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+      [r.candidate for r in response.context["recommendations"]],
+      [self.cheap_efficient, self.pricey_inefficient],
+    )
+
+
+class AvailabilityCalendarTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    # Months memoized by earlier tests would skip the cache entirely
+    memo = mock.patch.dict("appliance.availability._memo", clear=True)
+    memo.start()
+    self.addCleanup(memo.stop)
+    User.objects.create_user(username="calendar", password="testpass123")
+    self.client.login(username="calendar", password="testpass123")
+    self.today = timezone.localdate()
+
+  def test_month_is_memoized_with_shared_immutable_cells(self):
+    first = month_availability(self.today.year, self.today.month)
+    second = month_availability(self.today.year, self.today.month)
+    self.assertIs(first, second)
+    self.assertIn(len(first.context["dates"]) // 7, (5, 6))
+    with self.assertRaises(TypeError):
+      first.context["dates"][0]["is_available"] = True
+
+  def test_cache_entries_are_scoped_to_today(self):
+    entry = month_availability(self.today.year, self.today.month)
+    key = f"availability:{self.today.year}-{self.today.month:02d}:{self.today}:0"
+    self.assertEqual(cache.get(key).etag, entry.etag)
+    self.assertLessEqual(seconds_until_midnight(), 24 * 60 * 60)
+
+  def test_months_are_rebuilt_after_the_timeout(self):
+    first = month_availability(self.today.year, self.today.month)
+    later = timezone.now() + timedelta(seconds=MONTH_TIMEOUT)
+    with mock.patch("django.utils.timezone.now", return_value=later):
+      second = month_availability(self.today.year, self.today.month)
+    self.assertIsNot(first, second)
+    self.assertEqual(first.etag, second.etag)
+
+  def test_get_month_dates_supports_conditional_requests(self):
+    url = reverse("get_month_dates")
+    params = {"year": self.today.year, "month": self.today.month}
+    response = self.client.get(url, params)
+    self.assertEqual(response.status_code, 200)
+    self.assertIn("ETag", response)
+    self.assertIn("Last-Modified", response)
+
+    response = self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+    self.assertEqual(response.status_code, 304)
+
+
+class SlotAllocationTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.property = Property.objects.create(name="Block D", address="4 Mill Lane")
+    self.appliance = Appliance.objects.create(
+      appliance_type=ApplianceType.TOASTER.name,
+      brand="Brand",
+      model="Toaster",
+      cost=30,
+      efficiency_rating=EfficiencyRating.LOW.value,
+    )
+    self.property_appliance = PropertyAppliance.objects.create(
+      property=self.property, appliance=self.appliance, usage=Usage.LOW.value
+    )
+    # A weekday at least a week ahead
+    self.day = timezone.localdate() + timedelta(days=7)
+    self.day += timedelta(days=(7 - self.day.weekday()) % 7)
+
+  def book(self, hour=9, minute=0):
+    return ScheduleForm(
+      {
+        "property_appliance_id": self.property_appliance.id,
+        "replacement_appliance_id": self.appliance.id,
+        "date": self.day.isoformat(),
+        "hour": hour,
+        "minute": minute,
+      }
+    )
+
+  def day_cell(self):
+    context = get_availability_context(self.day.month, self.day.year)
+    return next(d for d in context["dates"] if d["date"] == self.day.isoformat())
+
+  def test_month_view_is_one_query_regardless_of_bookings(self):
+    for minute in (0, 15, 30):
+      Schedule.objects.create(
+        property_appliance=self.property_appliance,
+        replacement_appliance=self.appliance,
+        date=self.day,
+        hour=8,
+        minute=minute,
+      )
+    with self.assertNumQueries(1):
+      build_availability_context(self.day.year, self.day.month, timezone.localdate())
+
+  def test_full_slots_are_hidden_from_the_calendar(self):
+    self.assertEqual(self.day_cell()["full_slots"], ())
+    form = self.book(hour=9, minute=0)
+    self.assertTrue(form.is_valid(), form.errors)
+    with self.captureOnCommitCallbacks(execute=True):
+      form.save()
+    self.assertEqual(self.day_cell()["full_slots"], ("9:00",))
+    # Only the booked hour loses the minute
+    self.assertEqual(self.day_cell()["slots"][9], (15, 30, 45))
+    self.assertEqual(self.day_cell()["slots"][10], (0, 15, 30, 45))
+
+    for minute in (15, 30, 45):
+      form = self.book(hour=17, minute=minute)
+      self.assertTrue(form.is_valid(), form.errors)
+      with self.captureOnCommitCallbacks(execute=True):
+        form.save()
+    form = self.book(hour=17, minute=0)
+    self.assertTrue(form.is_valid(), form.errors)
+    with self.captureOnCommitCallbacks(execute=True):
+      form.save()
+    self.assertNotIn(17, self.day_cell()["available_hours"])
+    self.assertNotIn(17, self.day_cell()["slots"])
+
+  def test_month_is_invalidated_once_the_booking_commits(self):
+    self.day_cell()
+    with self.captureOnCommitCallbacks() as callbacks:
+      form = self.book(hour=9, minute=0)
+      self.assertTrue(form.is_valid(), form.errors)
+      form.save()
+      self.assertEqual(self.day_cell()["full_slots"], ())
+    for callback in callbacks:
+      callback()
+    self.assertEqual(self.day_cell()["full_slots"], ("9:00",))
+
+  def test_bookings_outside_the_form_take_the_next_slot_index(self):
+    for _ in range(2):
+      Schedule.objects.create(
+        property_appliance=self.property_appliance,
+        replacement_appliance=self.appliance,
+        date=self.day,
+        hour=9,
+        minute=0,
+      )
+    self.assertEqual(
+      sorted(Schedule.objects.values_list("slot_index", flat=True)), [0, 1]
+    )
+    # The slot is over capacity, so the form still refuses it
+    form = self.book(hour=9, minute=0)
+    self.assertTrue(form.is_valid(), form.errors)
+    with self.assertRaises(ValidationError):
+      form.save()
+    self.assertEqual(Schedule.objects.count(), 2)
+
+  def test_capacity_is_enforced_on_save(self):
+    first = self.book()
+    self.assertTrue(first.is_valid(), first.errors)
+    first.save()
+    second = self.book()
+    self.assertTrue(second.is_valid(), second.errors)
+    with self.assertRaises(ValidationError):
+      second.save()
+    self.assertEqual(Schedule.objects.count(), 1)
+
+  @override_settings(SCHEDULE_SLOT_CAPACITY=2)
+  def test_each_crew_gets_its_own_slot_index(self):
+    for _ in range(2):
+      form = self.book()
+      self.assertTrue(form.is_valid(), form.errors)
+      form.save()
+    self.assertEqual(
+      sorted(Schedule.objects.values_list("slot_index", flat=True)), [0, 1]
+    )
+
+  def test_slots_off_the_installer_grid_are_rejected(self):
+    form = self.book(hour=7, minute=10)
+    self.assertFalse(form.is_valid())
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, CATALOGUE_PAGE_SIZE=3)
+class ExploreCatalogueTests(TestCase):
+  def setUp(self):
+    User.objects.create_user(
+      username="explorer", password="testpass123", profile_pic="user_pictures/e.png"
+    )
+    self.client.login(username="explorer", password="testpass123")
+    for i, appliance_type in enumerate([ApplianceType.OVEN, ApplianceType.DRYER] * 4):
+      Appliance.objects.create(
+        appliance_type=appliance_type.name,
+        brand="Acme" if i % 2 else "Globex",
+        model=f"Model {i}",
+        cost=100 * (i % 3),
+        efficiency_rating=EfficiencyRating.GOOD.value,
+        image="appliance_pictures/a.png",
+      )
+
+  def test_keyset_pages_cover_the_catalogue_in_order(self):
+    seen = []
+    response = self.client.get(reverse("explore"))
+    self.assertEqual(response.status_code, 200)
+    while True:
+      seen.extend(response.context["appliances"])
+      next_url = response.context["next_url"]
+      if not next_url:
+        break
+      response = self.client.get(next_url, HTTP_HX_REQUEST="true")
+      self.assertTemplateUsed(response, "partial/explore/rows.html")
+    expected = list(Appliance.objects.order_by("appliance_type", "cost", "id"))
+    self.assertEqual(seen, expected)
+
+  def test_filters_are_applied_server_side(self):
+    response = self.client.get(
+      reverse("explore"),
+      {"appliance_type": ApplianceType.DRYER.name, "brand": "Acme", "max_cost": 100},
+      HTTP_HX_REQUEST="true",
+    )
+    appliances = response.context["appliances"]
+    self.assertTrue(appliances)
+    for appliance in appliances:
+      self.assertEqual(appliance.appliance_type, ApplianceType.DRYER.name)
+      self.assertEqual(appliance.brand, "Acme")
+      self.assertLessEqual(appliance.cost, 100)
+
+  def test_invalid_cursor_falls_back_to_first_page(self):
+    first = self.client.get(reverse("explore"))
+    tampered = self.client.get(reverse("explore"), {"cursor": "not-a-cursor"})
+    self.assertEqual(first.context["appliances"], tampered.context["appliances"])
+
+  def test_cursor_values_of_the_wrong_type_fall_back_to_first_page(self):
+    first = self.client.get(reverse("explore"))
+    for values in (
+      [ApplianceType.OVEN.name, "abc", 1],
+      [ApplianceType.OVEN.name, 100, "abc"],
+      [ApplianceType.OVEN.name, 100, 10**30],
+    ):
+      with self.subTest(values=values):
+        tampered = self.client.get(
+          reverse("explore"), {"cursor": encode_cursor(values)}
+        )
+        self.assertEqual(tampered.status_code, 200)
+        self.assertEqual(first.context["appliances"], tampered.context["appliances"])
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class CatalogueSearchTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    User.objects.create_user(
+      username="searcher", password="testpass123", profile_pic="user_pictures/s.png"
+    )
+    self.client.login(username="searcher", password="testpass123")
+    catalogue = [
+      (ApplianceType.WASHING_MACHINE, "Bosch", "Serie 6 WAU28"),
+      (ApplianceType.WASHING_MACHINE, "Samsung", "EcoBubble WW90"),
+      (ApplianceType.DISHWASHER, "Bosch", "Serie 4 SMS4"),
+      (ApplianceType.DISHWASHER, "Miele", "G 7000"),
+    ]
+    for appliance_type, brand, model in catalogue:
+      Appliance.objects.create(
+        appliance_type=appliance_type.name,
+        brand=brand,
+        model=model,
+        cost=500,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+        image="appliance_pictures/a.png",
+      )
+
+    # The index of an earlier test may be younger than the check interval
+    invalidate_index()
+
+  def test_search_tolerates_typos_and_ranks_best_match_first(self):
+    results = search_appliances("bosh wasing machne")
+    self.assertEqual(
+      (results[0].brand, results[0].appliance_type),
+      ("Bosch", ApplianceType.WASHING_MACHINE.name),
+    )
+    self.assertEqual(
+      [result.search_score for result in results],
+      sorted((result.search_score for result in results), reverse=True),
+    )
+
+  def test_search_filters_by_type(self):
+    results = search_appliances("bosch", appliance_type=ApplianceType.DISHWASHER.name)
+    self.assertEqual([result.model for result in results], ["Serie 4 SMS4"])
+
+  def test_index_is_rebuilt_when_the_catalogue_changes(self):
+    index = get_index()
+    with self.captureOnCommitCallbacks(execute=True):
+      Appliance.objects.create(
+        appliance_type=ApplianceType.OVEN.name,
+        brand="Smeg",
+        model="Victoria",
+        cost=900,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+        image="appliance_pictures/a.png",
+      )
+    self.assertIsNot(get_index(), index)
+    self.assertEqual(search_appliances("smeg viktoria")[0].brand, "Smeg")
+
+  def test_other_workers_rebuild_their_index_within_the_interval(self):
+    index = get_index()
+    # Saved by another worker, whose invalidation this one never saw
+    Appliance.objects.filter(brand="Miele").update(
+      brand="Smeg", updated_at=timezone.now()
+    )
+    self.assertIs(get_index(), index)
+    later = time.monotonic() + INDEX_CHECK_INTERVAL + 1
+    with mock.patch("appliance.search.monotonic", return_value=later):
+      self.assertEqual(search_appliances("smeg")[0].brand, "Smeg")
+
+  def test_explore_uses_ranked_search_for_queries(self):
+    response = self.client.get(
+      reverse("explore"), {"q": "samsng"}, HTTP_HX_REQUEST="true"
+    )
+    self.assertEqual(
+      [appliance.brand for appliance in response.context["appliances"]], ["Samsung"]
+    )
+    self.assertIsNone(response.context["next_url"])
+
+  def test_modal_search_rejects_non_integer_property_ids(self):
+    for params in ({"q": "miele", "property": "abc"}, {"q": "miele"}):
+      with self.subTest(params=params):
+        response = self.client.get(
+          reverse("appliance_search"), params, HTTP_HX_REQUEST="true"
+        )
+        self.assertEqual(response.status_code, 400)
+
+  def test_search_endpoint_returns_json(self):
+    response = self.client.get(reverse("appliance_search"), {"q": "miele"})
+    results = response.json()["results"]
+    self.assertEqual(results[0]["brand"], "Miele")
+    self.assertLessEqual(results[0]["score"], 1)
+
+
+class ImageVariantTests(TestCase):
+  def setUp(self):
+    self.media_root = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+    settings_override = override_settings(
+      STORAGES=LOCAL_STORAGES, MEDIA_ROOT=self.media_root
+    )
+    settings_override.enable()
+    self.addCleanup(settings_override.disable)
+
+  def upload(self, name="washer.png", size=(1200, 900)):
+    buffer = BytesIO()
+    Image.new("RGB", size, "steelblue").save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+  def create_appliance(self, image, model="Serie 6"):
+    with self.captureOnCommitCallbacks(execute=True):
+      appliance = Appliance.objects.create(
+        appliance_type=ApplianceType.WASHING_MACHINE.name,
+        brand="Bosch",
+        model=model,
+        cost=500,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+        image=image,
+      )
+    appliance.refresh_from_db()
+    return appliance
+
+  def test_upload_generates_content_hashed_variants(self):
+    appliance = self.create_appliance(self.upload())
+    variants = appliance.image_variants
+    self.assertEqual(variants["source"], appliance.image.name)
+    self.assertEqual(set(variants["formats"]), set(FORMATS))
+    webp = variants["formats"]["webp"]
+    self.assertEqual([width for width, _ in webp], list(VARIANT_WIDTHS))
+    for width, name in webp:
+      self.assertTrue(name.startswith(f"thumbs/{variants['hash'][:2]}/"))
+      with appliance.image.storage.open(name) as variant:
+        self.assertEqual(Image.open(variant).size, (width, width * 3 // 4))
+
+  def test_identical_uploads_share_variants(self):
+    first = self.create_appliance(self.upload("a.png"))
+    second = self.create_appliance(self.upload("b.png"), model="Serie 8")
+    self.assertEqual(first.image_variants["formats"], second.image_variants["formats"])
+
+  def test_small_images_are_not_upscaled(self):
+    appliance = self.create_appliance(self.upload(size=(100, 50)))
+    widths = [width for width, _ in appliance.image_variants["formats"]["webp"]]
+    self.assertEqual(widths, [64, 100])
+
+  def test_unreadable_upload_keeps_the_original(self):
+    upload = SimpleUploadedFile("broken.png", b"not an image")
+    appliance = self.create_appliance(upload)
+    self.assertEqual(appliance.image_variants, {"source": appliance.image.name})
+
+  def test_picture_tag_emits_srcset(self):
+    appliance = self.create_appliance(self.upload())
+    html = Template(
+      '{% load appliance_filters %}{% picture appliance.image alt="Washer" %}'
+    ).render(Context({"appliance": appliance}))
+    self.assertIn('type="image/webp"', html)
+    self.assertIn(" 640w", html)
+    self.assertIn('loading="lazy"', html)
+    self.assertNotIn(appliance.image.url, html)
+
+  @override_settings(IMAGE_VARIANTS_INLINE=False)
+  def test_deferred_uploads_are_encoded_by_the_worker(self):
+    appliance = self.create_appliance(self.upload())
+    self.assertEqual(appliance.image_variants, {})
+    self.assertEqual(list(pending_variants(Appliance)), [appliance])
+
+    command = GenerateImageVariants(stdout=StringIO())
+
+    def stop(seconds):
+      command.stopping = True
+
+    with (
+      mock.patch.object(command, "sleep", side_effect=stop),
+      mock.patch("signal.signal"),
+    ):
+      command.handle(models=["appliance.appliance"], watch=True, interval=0)
+    appliance.refresh_from_db()
+    self.assertEqual(appliance.image_variants["source"], appliance.image.name)
+    self.assertFalse(pending_variants(Appliance).exists())
+
+  def test_picture_tag_ignores_variants_of_a_replaced_upload(self):
+    appliance = self.create_appliance(self.upload())
+    appliance.image = "appliance_pictures/replaced.png"
+    html = Template("{% load appliance_filters %}{% picture appliance.image %}").render(
+      Context({"appliance": appliance})
+    )
+    self.assertIn(appliance.image.url, html)
+    self.assertNotIn("<source", html)
+
+  def test_picture_tag_falls_back_to_the_original(self):
+    appliance = Appliance(image="appliance_pictures/a.png")
+    html = Template("{% load appliance_filters %}{% picture appliance.image %}").render(
+      Context({"appliance": appliance})
+    )
+    self.assertIn(appliance.image.url, html)
+    self.assertNotIn("<source", html)
+
+  def test_variants_are_uploaded_with_immutable_cache_headers(self):
+    storage = MediaStorage(bucket_name="media")
+    params = storage.get_object_parameters("thumbs/ab/abcdef/64.webp")
+    self.assertEqual(params["CacheControl"], IMMUTABLE_CACHE_CONTROL)
+    self.assertEqual(params["ContentType"], "image/webp")
+    self.assertNotIn("CacheControl", storage.get_object_parameters("x/a.png"))
+
+
+class MediaUrlTests(TestCase):
+  options = {
+    "access_key": "key",
+    "secret_key": "secret",
+    "bucket_name": "media",
+    "endpoint_url": "https://s3.example.com",
+    "addressing_style": "path",
+  }
+
+  def setUp(self):
+    url_cache.clear()
+    self.addCleanup(url_cache.clear)
+
+  def test_public_bucket_urls_are_built_without_boto3(self):
+    storage = MediaStorage(**self.options, querystring_auth=False)
+    with mock.patch("appliance.storage.shared_resource") as shared_resource:
+      url = storage.url("appliance_pictures/a b.png")
+    shared_resource.assert_not_called()
+    self.assertEqual(url, "https://s3.example.com/media/appliance_pictures/a%20b.png")
+
+  def test_custom_domain_urls_are_not_signed(self):
+    storage = MediaStorage(
+      **self.options, custom_domain="cdn.example.com", querystring_auth=True
+    )
+    self.assertFalse(storage.signs_urls)
+    self.assertEqual(
+      storage.url("thumbs/ab/abc/64.webp"),
+      "https://cdn.example.com/thumbs/ab/abc/64.webp",
+    )
+
+  def test_presigned_urls_are_memoized_per_storage_and_name(self):
+    storage = MediaStorage(**self.options)
+    first = storage.url("appliance_pictures/a.png")
+    self.assertIn("Signature", first)
+    self.assertEqual(
+      MediaStorage(**self.options).url("appliance_pictures/a.png"), first
+    )
+    self.assertNotEqual(storage.url("appliance_pictures/b.png"), first)
+    self.assertEqual((url_cache.hits, url_cache.misses), (1, 2))
+
+  def test_explicit_expiry_bypasses_the_cache(self):
+    storage = MediaStorage(**self.options)
+    storage.url("appliance_pictures/a.png", expire=60)
+    self.assertEqual(len(url_cache), 0)
+
+  def test_storages_share_one_connection_per_thread(self):
+    self.assertIs(
+      MediaStorage(**self.options).connection, MediaStorage(**self.options).connection
+    )
+
+  def test_ttl_cache_expires_and_evicts_least_recently_used(self):
+    cache = TTLCache(maxsize=2)
+    with mock.patch("appliance.storage.monotonic", return_value=0):
+      cache.set("a", 1, ttl=10)
+      cache.set("b", 2, ttl=10)
+      cache.get("a")
+      cache.set("c", 3, ttl=10)
+      self.assertIsNone(cache.get("b"))
+      self.assertEqual(cache.get("a"), 1)
+    with mock.patch("appliance.storage.monotonic", return_value=11):
+      self.assertIsNone(cache.get("a"))
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, VIEW_BUDGETS={})
+class RequestMetricsTests(TestCase):
+  def setUp(self):
+    metrics.registry.reset()
+    self.addCleanup(metrics.registry.reset)
+    User.objects.create_user(
+      username="observer", password="testpass123", profile_pic="user_pictures/o.png"
+    )
+    self.client.login(username="observer", password="testpass123")
+
+  def request_sample(self, *args, **kwargs):
+    with self.assertLogs("appliance.metrics", "INFO") as logs:
+      response = self.client.get(*args, **kwargs)
+    return response, json.loads(logs.records[-1].getMessage())
+
+  def test_requests_are_logged_with_queries_and_template_time(self):
+    response, sample = self.request_sample(reverse("explore"))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(sample["view"], "explore")
+    self.assertEqual(sample["status"], 200)
+    self.assertGreater(sample["queries"], 0)
+    self.assertGreater(sample["template_ms"], 0)
+    self.assertGreaterEqual(sample["duration_ms"], sample["template_ms"])
+    self.assertEqual(
+      metrics.registry.value(
+        "http_requests_total", view="explore", method="GET", status=200
+      ),
+      1,
+    )
+
+  def test_budget_violations_are_logged(self):
+    with (
+      self.settings(VIEW_BUDGETS={"explore": {"queries": 0}}),
+      self.assertLogs("appliance.metrics", "WARNING") as logs,
+    ):
+      self.client.get(reverse("explore"))
+    violation = json.loads(logs.records[0].getMessage())
+    self.assertEqual(violation["event"], "budget_exceeded")
+    self.assertEqual(violation["violations"]["queries"]["limit"], 0)
+    self.assertEqual(
+      metrics.registry.value(
+        "view_budget_violations_total", view="explore", metric="queries"
+      ),
+      1,
+    )
+
+  def test_metrics_endpoint_renders_prometheus_text(self):
+    self.request_sample(reverse("explore"))
+    response = self.client.get(reverse("metrics"))
+    self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+    body = response.content.decode()
+    self.assertIn("# TYPE http_requests_total counter", body)
+    self.assertIn(
+      'http_requests_total{method="GET",status="200",view="explore"} 1', body
+    )
+    self.assertIn('db_queries_per_request_bucket{view="explore",le="+Inf"} 1', body)
+
+  def test_metrics_endpoint_is_local_only(self):
+    response = self.client.get(reverse("metrics"), REMOTE_ADDR="203.0.113.7")
+    self.assertEqual(response.status_code, 404)
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class ApplianceImportTests(TestCase):
+  header = "appliance_type,brand,model,cost,efficiency_rating,warranty_days,image_url\n"
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+  def feed(self, lines, name="feed.csv"):
+    path = f"{self.directory}/{name}"
+    with open(path, "w") as handle:
+      handle.write("".join(lines))
+    return path
+
+  def run_import(self, path, *args):
+    stdout, stderr = StringIO(), StringIO()
+    call_command(
+      "import_appliances", path, *args, "--skip-images", stdout=stdout, stderr=stderr
+    )
+    return stdout.getvalue(), stderr.getvalue()
+
+  def test_csv_rows_are_validated_and_upserted(self):
+    Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Smeg",
+      model="Victoria",
+      cost=900,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+      image="appliance_pictures/a.png",
+    )
+    path = self.feed(
+      [
+        self.header,
+        "Oven,Smeg,Victoria,950,HIGH,730,\n",
+        "washing_machine,Bosch,Serie 6,500,very low,,\n",
+        "Blender,Acme,B1,50,good,,\n",
+        "Dryer,Miele,T1,-5,good,,\n",
+      ]
+    )
+    stdout, stderr = self.run_import(path, "--batch-size", "2")
+
+    self.assertIn("Imported 2 appliances", stdout)
+    self.assertIn("rows/s", stdout)
+    self.assertIn("Row 3: unknown appliance_type 'Blender'", stderr)
+    self.assertIn("Row 4: cost cannot be negative", stderr)
+    updated = Appliance.objects.get(brand="Smeg", model="Victoria")
+    self.assertEqual(
+      (updated.cost, updated.efficiency_rating, updated.warranty_period.days),
+      (950, EfficiencyRating.HIGH.value, 730),
+    )
+    self.assertEqual(updated.image.name, "appliance_pictures/a.png")
+    created = Appliance.objects.get(brand="Bosch")
+    self.assertEqual(created.appliance_type, ApplianceType.WASHING_MACHINE.name)
+    self.assertEqual(created.efficiency_rating, EfficiencyRating.VERY_LOW.value)
+
+  def test_upserts_refresh_installed_warranty_dates(self):
+    appliance = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Smeg",
+      model="Victoria",
+      cost=900,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+      image="appliance_pictures/a.png",
+    )
+    installed = PropertyAppliance.objects.create(
+      property=Property.objects.create(name="Flat", address="1 Road"),
+      appliance=appliance,
+      purchase_date=date(2024, 1, 1),
+      usage=Usage.LOW.value,
+    )
+    self.run_import(self.feed([self.header, "Oven,Smeg,Victoria,900,good,730,\n"]))
+    installed.refresh_from_db()
+    self.assertEqual(installed.warranty_ends_on, date(2025, 12, 31))
+
+  def test_upserted_ids_match_brand_and_model_pairs_only(self):
+    appliances = [
+      Appliance.objects.create(
+        appliance_type=ApplianceType.OVEN.name,
+        brand=brand,
+        model=model,
+        cost=500,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+      )
+      for brand, model in (("Smeg", "A"), ("Neff", "B"), ("Smeg", "B"))
+    ]
+    upserted = [
+      Appliance(brand=appliance.brand, model=appliance.model)
+      for appliance in appliances[:2]
+    ]
+    self.assertCountEqual(
+      ApplianceImporter.upserted_ids(upserted),
+      [appliance.id for appliance in appliances[:2]],
+    )
+
+  def test_jsonl_import_resumes_from_checkpoint(self):
+    rows = [
+      json.dumps(
+        {
+          "appliance_type": "Dryer",
+          "brand": "Miele",
+          "model": f"T{i}",
+          "cost": 100 + i,
+          "efficiency_rating": "good",
+        }
+      )
+      + "\n"
+      for i in range(5)
+    ]
+    path = self.feed(rows, name="feed.jsonl")
+    write_checkpoint(checkpoint_path(path), path, 3)
+
+    stdout, _ = self.run_import(path)
+    self.assertIn("Resuming after row 3", stdout)
+    self.assertEqual(
+      sorted(Appliance.objects.values_list("model", flat=True)), ["T3", "T4"]
+    )
+    self.assertFalse(os.path.exists(checkpoint_path(path)))
+
+  def test_stale_checkpoints_are_ignored(self):
+    path = self.feed([self.header, "Dryer,Miele,T1,100,good,,\n"])
+    write_checkpoint(checkpoint_path(path), path, 1)
+    with open(path, "a") as handle:
+      handle.write("Dryer,Miele,T2,100,good,,\n")
+    self.run_import(path)
+    self.assertEqual(Appliance.objects.count(), 2)
+
+  def test_images_are_downloaded_concurrently(self):
+    path = self.feed(
+      [
+        self.header,
+        "Dryer,Miele,T1,100,good,,https://example.com/t1.png\n",
+        "Dryer,Miele,T2,100,good,,https://example.com/t2.png\n",
+      ]
+    )
+    with mock.patch(
+      "appliance.importers.download_image",
+      side_effect=lambda url: f"appliance_pictures/{url.rsplit('/', 1)[1]}",
+    ) as download_image:
+      call_command("import_appliances", path, "--workers", "2", stdout=StringIO())
+    self.assertEqual(download_image.call_count, 2)
+    self.assertEqual(
+      Appliance.objects.get(model="T2").image.name, "appliance_pictures/t2.png"
+    )
+
+
+class PortfolioExportTests(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.login(username="landlord", password="testpass123")
+    self.property = Property.objects.create(name="Mill Flat", address="1 Mill Road")
+    UserProperty.objects.create(user=self.user, property=self.property)
+    self.oven = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Smeg",
+      model="Victoria",
+      cost=900,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+      image="appliance_pictures/a.png",
+    )
+    self.replacement = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Bosch",
+      model="Serie 8",
+      cost=1200,
+      efficiency_rating=EfficiencyRating.HIGH.value,
+      image="appliance_pictures/b.png",
+    )
+    self.installed = PropertyAppliance.objects.create(
+      property=self.property,
+      appliance=self.oven,
+      purchase_date=date.today() - timedelta(days=400),
+      usage=Usage.LOW.value,
+    )
+    PropertyAppliance.objects.create(
+      property=self.property,
+      appliance=self.replacement,
+      actual_cost=1100,
+      usage=Usage.HIGH.value,
+    )
+    for days in (9, 3):
+      Schedule.objects.create(
+        property_appliance=self.installed,
+        replacement_appliance=self.replacement,
+        date=date.today() + timedelta(days=days),
+        hour=10,
+        minute=30,
+      )
+    other = Property.objects.create(name="Someone else's", address="2 Road")
+    PropertyAppliance.objects.create(
+      property=other, appliance=self.oven, usage=Usage.LOW.value
+    )
+
+  def export(self, **params):
+    response = self.client.get(reverse("export_portfolio"), params)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.streaming)
+    return response, b"".join(response.streaming_content)
+
+  def test_csv_export_joins_costs_warranty_and_next_replacement(self):
+    response, content = self.export(format="csv")
+    self.assertIn("attachment;", response["Content-Disposition"])
+    rows = list(csv.DictReader(StringIO(content.decode())))
+    self.assertEqual(len(rows), 2)
+    oven, replacement = rows
+    self.assertEqual(oven["property"], "Mill Flat")
+    self.assertEqual(oven["cost"], "900")
+    self.assertEqual(oven["warranty_status"], "expired")
+    self.assertEqual(
+      oven["next_replacement_date"], (date.today() + timedelta(days=3)).isoformat()
+    )
+    self.assertEqual(oven["next_replacement_model"], "Serie 8")
+    self.assertEqual(replacement["cost"], "1100")
+    self.assertEqual(replacement["warranty_status"], "within")
+    self.assertEqual(replacement["next_replacement_date"], "")
+
+  def test_export_reads_rows_in_one_query(self):
+    response = self.client.get(reverse("export_portfolio"), {"format": "jsonl"})
+    with self.assertNumQueries(1):
+      lines = b"".join(response.streaming_content).splitlines()
+    self.assertEqual(json.loads(lines[0])["brand"], "Smeg")
+
+  def test_compressed_exports(self):
+    _, plain = self.export(format="csv")
+    response, gzipped = self.export(format="csv", compression="gzip")
+    self.assertEqual(response["Content-Type"], "application/gzip")
+    self.assertIn('.csv.gz"', response["Content-Disposition"])
+    self.assertEqual(gzip.decompress(gzipped), plain)
+    _, zstd = self.export(format="csv", compression="zstd")
+    self.assertEqual(
+      zstandard.ZstdDecompressor().decompressobj().decompress(zstd), plain
+    )
+
+  def test_xlsx_export_is_a_valid_workbook(self):
+    _, content = self.export(format="xlsx")
+    with zipfile.ZipFile(BytesIO(content)) as workbook:
+      self.assertIsNone(workbook.testzip())
+      sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+    self.assertEqual(sheet.count("<row>"), 3)
+    self.assertIn("<t>Mill Flat</t>", sheet)
+    self.assertIn("<c><v>900</v></c>", sheet)
+
+  def test_unknown_format_is_rejected(self):
+    response = self.client.get(reverse("export_portfolio"), {"format": "pdf"})
+    self.assertEqual(response.status_code, 400)
+
+  async def test_asgi_exports_stream_chunk_by_chunk(self):
+    await self.async_client.alogin(username="landlord", password="testpass123")
+    with mock.patch("appliance.exports.CHUNK_ROWS", 1):
+      response = await self.async_client.get(
+        reverse("export_portfolio"), {"format": "jsonl"}
+      )
+      self.assertTrue(response.is_async)
+      chunks = [chunk async for chunk in response.streaming_content]
+    self.assertEqual(len(chunks), 2)
+    self.assertEqual(json.loads(chunks[0])["brand"], "Smeg")
+
+  def test_non_integer_property_ids_are_rejected(self):
+    response = self.client.get(reverse("export_portfolio"), {"property": "abc"})
+    self.assertEqual(response.status_code, 400)
+
+  def test_export_command_writes_a_file(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    path = f"{directory}/portfolio.csv"
+    call_command(
+      "export_portfolio", "--user", "landlord", "--output", path, stdout=StringIO()
+    )
+    with open(path) as handle:
+      self.assertEqual(len(list(csv.DictReader(handle))), 2)
+
+
+class NotificationOutboxTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.sms_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.sms_dir)
+    settings_override = override_settings(
+      SMS_BACKEND="appliance.sms.FileSMSBackend", SMS_FILE_PATH=self.sms_dir
+    )
+    settings_override.enable()
+    self.addCleanup(settings_override.disable)
+
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.login(username="landlord", password="testpass123")
+    self.property = Property.objects.create(name="Flat 2", address="9 Quay Street")
+    self.appliance = Appliance.objects.create(
+      appliance_type=ApplianceType.DISHWASHER.name,
+      brand="Miele",
+      model="G 5000",
+      cost=600,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+    )
+    self.property_appliance = PropertyAppliance.objects.create(
+      property=self.property, appliance=self.appliance, usage=Usage.MEDIUM.value
+    )
+    # A weekday at least a week ahead
+    self.day = timezone.localdate() + timedelta(days=7)
+    self.day += timedelta(days=(7 - self.day.weekday()) % 7)
+
+  def submit(self, minute=0, **data):
+    return self.client.post(
+      reverse("appliance_replacement_modal_submit"),
+      {
+        "property_appliance_id": self.property_appliance.id,
+        "replacement_appliance_id": self.appliance.id,
+        "date": self.day.isoformat(),
+        "hour": 9,
+        "minute": minute,
+        "notifications_enabled": "on",
+        "tenant_email": "tenant@example.com",
+        "tenant_phone": "07700 900123",
+        **data,
+      },
+    )
+
+  def sent_sms(self):
+    lines = []
+    for name in sorted(os.listdir(self.sms_dir)):
+      with open(os.path.join(self.sms_dir, name)) as handle:
+        lines += [json.loads(line) for line in handle]
+    return lines
+
+  def test_booking_queues_messages_without_delivering_them(self):
+    response = self.submit()
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(mail.outbox), 0)
+    self.assertEqual(self.sent_sms(), [])
+
+    schedule = Schedule.objects.get()
+    messages = {message.channel: message for message in schedule.outbox_messages.all()}
+    self.assertEqual(set(messages), {"email", "sms"})
+    self.assertEqual(messages["sms"].recipient, "07700900123")
+    self.assertIn("Flat 2", messages["email"].body)
+    self.assertEqual(messages["email"].status, DeliveryStatus.PENDING.value)
+
+  def test_disabled_notifications_queue_nothing(self):
+    self.submit(notifications_enabled="")
+    self.assertEqual(OutboxMessage.objects.count(), 0)
+
+  def test_a_rejected_booking_leaves_no_messages(self):
+    self.submit()
+    response = self.submit(tenant_email="other@example.com")
+    self.assertEqual(response.status_code, 409)
+    self.assertFalse(OutboxMessage.objects.filter(recipient="other@example.com"))
+
+  def test_enqueueing_is_idempotent(self):
+    self.submit()
+    enqueue_schedule_notifications(Schedule.objects.get())
+    self.assertEqual(OutboxMessage.objects.count(), 2)
+
+  def test_worker_delivers_over_one_connection(self):
+    for minute in (0, 15, 30):
+      self.submit(minute=minute)
+    with mock.patch(
+      "django.core.mail.backends.locmem.EmailBackend.open", autospec=True
+    ) as opened:
+      call_command("dispatch_notifications", "--once", stdout=StringIO())
+    self.assertEqual(opened.call_count, 1)
+
+    self.assertEqual(len(mail.outbox), 3)
+    self.assertEqual(
+      len({message.extra_headers["Message-ID"] for message in mail.outbox}), 3
+    )
+    self.assertEqual(len(self.sent_sms()), 3)
+    self.assertEqual(
+      self.sent_sms()[0]["idempotency_key"],
+      OutboxMessage.objects.filter(channel="sms").earliest("id").idempotency_key,
+    )
+    self.assertFalse(OutboxMessage.objects.exclude(status=DeliveryStatus.SENT.value))
+
+    # Sent rows are not delivered again
+    call_command("dispatch_notifications", "--once", stdout=StringIO())
+    self.assertEqual(len(mail.outbox), 3)
+
+  def test_failures_back_off_and_then_give_up(self):
+    self.submit(tenant_phone="")
+    message = OutboxMessage.objects.get()
+    dispatcher = Dispatcher(max_attempts=2)
+    with mock.patch(
+      "django.core.mail.backends.locmem.EmailBackend.send_messages",
+      side_effect=ConnectionRefusedError("smtp down"),
+    ):
+      self.assertEqual(dispatcher.drain(), (1, 0))
+      message.refresh_from_db()
+      self.assertEqual(message.status, DeliveryStatus.PENDING.value)
+      self.assertEqual(message.attempts, 1)
+      self.assertGreater(message.next_attempt_at, timezone.now())
+      self.assertIn("smtp down", message.last_error)
+
+      # Not due yet
+      self.assertEqual(dispatcher.drain(), (0, 0))
+      OutboxMessage.objects.update(next_attempt_at=timezone.now())
+      dispatcher.drain()
+    message.refresh_from_db()
+    self.assertEqual(message.status, DeliveryStatus.FAILED.value)
+    self.assertEqual(message.attempts, 2)
+
+  def test_claimed_rows_are_leased(self):
+    self.submit()
+    first = Dispatcher().claim()
+    self.assertEqual(len(first), 2)
+    self.assertEqual(Dispatcher().claim(), [])
+
+    # A worker that died mid-batch releases its rows when the lease runs out
+    OutboxMessage.objects.update(next_attempt_at=timezone.now())
+    self.assertEqual(len(Dispatcher().claim()), 2)
+
+  def test_retry_delay_grows_to_the_cap(self):
+    with override_settings(
+      NOTIFICATION_RETRY_BASE_DELAY=10, NOTIFICATION_RETRY_MAX_DELAY=100
+    ):
+      self.assertLessEqual(retry_delay(1), timedelta(seconds=10))
+      self.assertGreaterEqual(retry_delay(3), timedelta(seconds=20))
+      self.assertLessEqual(retry_delay(10), timedelta(seconds=100))
+
+
+class NotificationFeedTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.login(username="landlord", password="testpass123")
+    self.other = User.objects.create_user(username="other", password="testpass123")
+    self.property = Property.objects.create(name="Flat 3", address="1 Dock Road")
+    self.user_property = UserProperty.objects.create(
+      user=self.user, property=self.property
+    )
+    self.appliance = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Neff",
+      model="B6ACH7HH0B",
+      cost=700,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+    )
+    self.property_appliance = PropertyAppliance.objects.create(
+      property=self.property, appliance=self.appliance, usage=Usage.LOW.value
+    )
+
+  def feed(self, since=None):
+    params = {} if since is None else {"since": since}
+    return self.client.get(reverse("notification_feed"), params)
+
+  def test_events_reach_every_landlord_of_the_property(self):
+    co_owner = User.objects.create_user(username="co-owner")
+    UserProperty.objects.create(user=co_owner, property=self.property)
+    schedule = Schedule.objects.create(
+      property_appliance=self.property_appliance,
+      replacement_appliance=self.appliance,
+      date=date.today() + timedelta(days=3),
+      hour=11,
+      minute=0,
+    )
+    with self.captureOnCommitCallbacks(execute=True):
+      self.client.post(reverse("delete_schedule", args=[schedule.id]))
+      self.client.post(
+        reverse("delete_property_appliance", args=[self.property_appliance.id])
+      )
+
+    kinds = list(
+      Notification.objects.filter(user=co_owner).order_by("id").values_list("kind")
+    )
+    self.assertEqual(
+      kinds,
+      [
+        (NotificationKind.REPLACEMENT_CANCELLED.value,),
+        (NotificationKind.APPLIANCE_REMOVED.value,),
+      ],
+    )
+    self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+    self.assertFalse(Notification.objects.filter(user=self.other))
+    self.assertEqual(
+      Notification.objects.filter(user=self.user).first().link,
+      reverse("property_view", args=[self.user_property.id]),
+    )
+
+  def test_first_request_renders_the_feed(self):
+    notify_landlords(
+      self.property.id, NotificationKind.APPLIANCE_ADDED, "Oven added to Flat 3"
+    )
+    response = self.feed()
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, "Oven added to Flat 3")
+    self.assertContains(response, "innerHTML:#notification-list")
+    self.assertContains(response, 'id="notification-dot"')
+
+  def test_unchanged_polls_are_not_modified_without_queries(self):
+    notify_landlords(self.property.id, NotificationKind.APPLIANCE_ADDED, "Added")
+    latest = Notification.objects.get().id
+    self.feed(since=latest)
+
+    with CaptureQueriesContext(connection) as queries:
+      response = self.feed(since=latest)
+    self.assertEqual(response.status_code, 304)
+    self.assertFalse(
+      [query for query in queries if "appliance_notification" in query["sql"]]
+    )
+
+  def test_other_workers_see_new_rows_once_the_entry_expires(self):
+    notify_landlords(self.property.id, NotificationKind.APPLIANCE_ADDED, "First")
+    cursor = Notification.objects.get().id
+    self.assertEqual(self.feed(since=cursor).status_code, 304)
+    # Written by another worker, whose invalidation this cache never saw
+    Notification.objects.create(
+      user=self.user, kind=NotificationKind.APPLIANCE_ADDED.value, message="Second"
+    )
+    later = time.time() + LATEST_TIMEOUT + 1
+    with mock.patch("time.time", return_value=later):
+      self.assertEqual(self.feed(since=cursor).status_code, 200)
+
+  def test_polls_return_only_newer_rows(self):
+    notify_landlords(self.property.id, NotificationKind.APPLIANCE_ADDED, "First")
+    cursor = Notification.objects.get().id
+    self.assertEqual(self.feed(since=cursor).status_code, 304)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      notify_landlords(self.property.id, NotificationKind.APPLIANCE_ADDED, "Second")
+    response = self.feed(since=cursor)
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, "Second")
+    self.assertNotContains(response, "First")
+    self.assertContains(response, "afterbegin:#notification-list")
+    self.assertContains(response, f"since={cursor + 1}")
+
+  def test_opening_the_bell_marks_rows_read(self):
+    notify_landlords(self.property.id, NotificationKind.APPLIANCE_ADDED, "Added")
+    latest = Notification.objects.get().id
+    response = self.client.post(reverse("mark_notifications_read"), {"up_to": latest})
+    self.assertEqual(response.status_code, 204)
+    self.assertIsNotNone(Notification.objects.get().read_at)
+    self.assertNotContains(self.feed(), 'id="notification-dot"')
+
+  def test_poll_query_reads_the_cursor_index(self):
+    if connection.vendor != "postgresql":
+      self.skipTest("Plan check needs PostgreSQL")
+    plan = (
+      Notification.objects.filter(user=self.user, id__gt=0)
+      .order_by("-id")[:20]
+      .explain()
+    )
+    self.assertIn("notification_feed_idx", plan)
+
+
+@override_settings(FORECAST_COST_INFLATION=0.0)
+class ReplacementForecastTests(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.login(username="landlord", password="testpass123")
+    self.property = Property.objects.create(name="Flat 4", address="8 Canal Walk")
+    self.user_property = UserProperty.objects.create(
+      user=self.user, property=self.property
+    )
+    self.oven = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Bosch",
+      model="HBS534BS0B",
+      cost=500,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+    )
+    self.newer_oven = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Bosch",
+      model="HBG7741B1B",
+      cost=800,
+      efficiency_rating=EfficiencyRating.HIGH.value,
+    )
+    today = timezone.localdate()
+    # Worn out a year ago, and just installed
+    self.old = PropertyAppliance.objects.create(
+      property=self.property,
+      appliance=self.oven,
+      usage=Usage.VERY_HIGH.value,
+      purchase_date=today - timedelta(days=11 * 365),
+    )
+    self.new = PropertyAppliance.objects.create(
+      property=self.property,
+      appliance=self.newer_oven,
+      usage=Usage.LOW.value,
+      purchase_date=today,
+      actual_cost=450,
+    )
+
+  def fleet(self, *rows):
+    return Fleet([(index, *row) for index, row in enumerate(rows, start=1)])
+
+  def test_usage_shortens_the_expected_life(self):
+    purchased = date(2020, 1, 1)
+    fleet = self.fleet(
+      (purchased, ApplianceType.OVEN.name, Usage.MEDIUM.value, None, 500),
+      (purchased, ApplianceType.OVEN.name, Usage.VERY_HIGH.value, None, 500),
+      (purchased, "UNKNOWN", Usage.MEDIUM.value, None, 500),
+    )
+    due, cost = forecast(fleet, date(2020, 1, 1), inflation=0.0)
+    self.assertEqual(
+      date.fromordinal(int(due[0])), purchased + timedelta(days=round(15 * 365.25))
+    )
+    self.assertLess(due[1], due[0])
+    self.assertEqual(
+      date.fromordinal(int(due[2])), purchased + timedelta(days=round(10 * 365.25))
+    )
+    self.assertEqual(cost.tolist(), [500, 500, 500])
+
+  def test_never_due_before_the_warranty_ends(self):
+    purchased = date(2020, 1, 1)
+    warranty_ends = date(2040, 1, 1)
+    fleet = self.fleet(
+      (purchased, ApplianceType.TOASTER.name, Usage.HIGH.value, warranty_ends, 30)
+    )
+    due, _ = forecast(fleet, purchased, inflation=0.0)
+    self.assertEqual(date.fromordinal(int(due[0])), warranty_ends)
+
+  def test_costs_grow_until_the_due_date(self):
+    today = date(2020, 1, 1)
+    fleet = self.fleet(
+      (today, ApplianceType.DISHWASHER.name, Usage.MEDIUM.value, None, 1000),
+      (date(2000, 1, 1), ApplianceType.DISHWASHER.name, Usage.MEDIUM.value, None, 1000),
+    )
+    _, cost = forecast(fleet, today, inflation=0.03)
+    self.assertEqual(cost[0], round(1000 * 1.03**10))
+    # Already overdue, so priced at today's cost
+    self.assertEqual(cost[1], 1000)
+
+  def test_batch_run_forecasts_every_unit(self):
+    ReplacementForecast.objects.all().delete()
+    self.assertEqual(forecast_replacements(chunk_size=1), 2)
+    self.assertEqual(ReplacementForecast.objects.count(), 2)
+    self.assertEqual(
+      ReplacementForecast.objects.get(pk=self.new.pk).replacement_cost, 450
+    )
+    self.assertEqual(forecast_replacements(), 2)
+    self.assertEqual(ReplacementForecast.objects.count(), 2)
+
+  def test_saving_a_unit_refreshes_its_forecast(self):
+    with self.captureOnCommitCallbacks(execute=True):
+      self.new.actual_cost = 600
+      self.new.save()
+    self.assertEqual(
+      ReplacementForecast.objects.get(pk=self.new.pk).replacement_cost, 600
+    )
+
+  def test_due_view_lists_units_due_within_the_horizon(self):
+    forecast_replacements()
+    ReplacementScore.objects.create(
+      property_appliance=self.old, candidate=self.newer_oven, score=0.9
+    )
+    response = self.client.get(
+      reverse("replacements_due", args=[self.user_property.id]), {"months": 6}
+    )
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+      [forecast.pk for forecast in response.context["forecasts"]], [self.old.pk]
+    )
+    self.assertContains(response, "HBG7741B1B")
+    self.assertContains(response, "overdue")
+
+  def test_due_view_is_limited_to_the_landlord(self):
+    other = User.objects.create_user(username="other", password="testpass123")
+    other_property = UserProperty.objects.create(user=other, property=self.property)
+    response = self.client.get(reverse("replacements_due", args=[other_property.id]))
+    self.assertEqual(response.status_code, 404)
+
+  def test_command_reports_throughput(self):
+    out = StringIO()
+    call_command("forecast_replacements", stdout=out)
+    self.assertIn("Forecast 2 installed units", out.getvalue())
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class PortfolioAnalyticsTests(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.login(username="landlord", password="testpass123")
+    self.flat = Property.objects.create(name="Flat 5", address="3 Wharf Road")
+    self.house = Property.objects.create(name="House", address="7 Hill Street")
+    for property in (self.flat, self.house):
+      UserProperty.objects.create(user=self.user, property=property)
+    self.fridge = Appliance.objects.create(
+      appliance_type=ApplianceType.REFRIGERATOR.name,
+      brand="Liebherr",
+      model="CNd 5023",
+      cost=800,
+      efficiency_rating=EfficiencyRating.HIGH.value,
+    )
+    self.oven = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Beko",
+      model="BBIF22100X",
+      cost=300,
+      efficiency_rating=EfficiencyRating.LOW.value,
+    )
+    with self.captureOnCommitCallbacks(execute=True):
+      self.units = [
+        PropertyAppliance.objects.create(
+          property=self.flat, appliance=self.fridge, usage=Usage.LOW.value
+        ),
+        PropertyAppliance.objects.create(
+          property=self.flat,
+          appliance=self.oven,
+          usage=Usage.HIGH.value,
+          actual_cost=250,
+          purchase_date=date.today() - timedelta(days=3 * 365),
+        ),
+        PropertyAppliance.objects.create(
+          property=self.house, appliance=self.fridge, usage=Usage.MEDIUM.value
+        ),
+      ]
+
+  def test_summaries_match_the_row_by_row_totals(self):
+    for property in (self.flat, self.house):
+      summary = PropertySummary.objects.get(property=property)
+      units = PropertyAppliance.objects.filter(property=property)
+      self.assertEqual(summary.total_spend, sum(unit.get_cost() for unit in units))
+      self.assertEqual(summary.appliance_count, units.count())
+      self.assertEqual(
+        summary.under_warranty, sum(unit.is_within_warranty() for unit in units)
+      )
+
+    portfolio = portfolio_summary(self.user)
+    self.assertEqual(portfolio.total_spend, 1850)
+    self.assertEqual(portfolio.appliance_count, 3)
+    self.assertAlmostEqual(portfolio.warranty_coverage, 2 / 3)
+    self.assertEqual(portfolio.average_efficiency, EfficiencyRating.GOOD)
+    self.assertEqual(
+      [(row["appliance_type"], row["total_spend"]) for row in portfolio.by_type],
+      [(ApplianceType.REFRIGERATOR.name, 1600), (ApplianceType.OVEN.name, 250)],
+    )
+
+  def test_unit_changes_refresh_their_property(self):
+    with self.captureOnCommitCallbacks(execute=True):
+      self.units[0].delete()
+    self.assertEqual(PropertySummary.objects.get(property=self.flat).total_spend, 250)
+    self.assertEqual(PropertySummary.objects.get(property=self.house).total_spend, 800)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      self.units[1].actual_cost = 400
+      self.units[1].save()
+    self.assertEqual(PropertySummary.objects.get(property=self.flat).total_spend, 400)
+
+  def test_overlapping_refreshes_of_a_property_both_succeed(self):
+    bulk_create = PropertySummary.objects.bulk_create
+    raced = []
+
+    def after_another_refresh(*args, **kwargs):
+      # Another refresh of the flat commits just before this one writes
+      if not raced:
+        raced.append(True)
+        refresh_property_summaries([self.flat.id])
+      return bulk_create(*args, **kwargs)
+
+    self.units[0].delete()
+    with mock.patch.object(
+      PropertySummary.objects, "bulk_create", side_effect=after_another_refresh
+    ):
+      refresh_property_summaries([self.flat.id])
+    self.assertEqual(PropertySummary.objects.get(property=self.flat).total_spend, 250)
+    self.assertEqual(
+      list(
+        PropertyTypeSpend.objects.filter(property=self.flat).values_list(
+          "appliance_type", flat=True
+        )
+      ),
+      [ApplianceType.OVEN.name],
+    )
+
+  def test_catalogue_price_changes_refresh_every_property_using_it(self):
+    with self.captureOnCommitCallbacks(execute=True):
+      self.fridge.cost = 900
+      self.fridge.save()
+    self.assertEqual(portfolio_summary(self.user).total_spend, 2050)
+
+  def test_reads_do_not_grow_with_installed_units(self):
+    portfolio_summary(self.user)
+    with CaptureQueriesContext(connection) as before:
+      portfolio_summary(self.user)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      for i in range(20):
+        oven = Appliance.objects.create(
+          appliance_type=ApplianceType.OVEN.name,
+          brand="Beko",
+          model=f"BBIF{i}",
+          cost=300,
+          efficiency_rating=EfficiencyRating.LOW.value,
+        )
+        PropertyAppliance.objects.create(
+          property=self.house, appliance=oven, usage=Usage.LOW.value
+        )
+    with self.assertNumQueries(len(before)):
+      portfolio = portfolio_summary(self.user)
+    self.assertEqual(portfolio.appliance_count, 23)
+
+  def test_summaries_from_an_earlier_day_are_rebuilt(self):
+    PropertySummary.objects.update(
+      computed_on=timezone.localdate() - timedelta(days=1), under_warranty=0
+    )
+    portfolio = portfolio_summary(self.user)
+    self.assertEqual(portfolio.under_warranty, 2)
+    self.assertFalse(
+      PropertySummary.objects.filter(computed_on__lt=timezone.localdate())
+    )
+
+  def test_home_shows_the_portfolio(self):
+    response = self.client.get(reverse("home"))
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, "$1850")
+    self.assertContains(response, "Spend by appliance type")
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class AdminChangelistTests(TestCase):
+  def setUp(self):
+    self.admin = User.objects.create_superuser(
+      username="admin", password="testpass123", email="admin@example.com"
+    )
+    self.client.login(username="admin", password="testpass123")
+    self.rows = 0
+
+  def add_rows(self, count):
+    """Adds count rows to every table with a registered admin"""
+    for i in range(self.rows, self.rows + count):
+      user = User.objects.create_user(username=f"landlord{i}", password="x")
+      property = Property.objects.create(name=f"Flat {i}", address=f"{i} Quay Street")
+      UserProperty.objects.create(user=user, property=property)
+      appliance = Appliance.objects.create(
+        appliance_type=ApplianceType.OVEN.name,
+        brand="Beko",
+        model=f"BBIF{i}",
+        cost=300 + i,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+      )
+      property_appliance = PropertyAppliance.objects.create(
+        property=property, appliance=appliance, usage=Usage.LOW.value
+      )
+      ReplacementScore.objects.create(
+        property_appliance=property_appliance, candidate=appliance, score=0.5
+      )
+      schedule = Schedule.objects.create(
+        property_appliance=property_appliance,
+        replacement_appliance=appliance,
+        date=date.today() + timedelta(days=1 + i),
+        hour=9,
+        minute=0,
+      )
+      OutboxMessage.objects.create(
+        schedule=schedule,
+        channel="email",
+        recipient=f"tenant{i}@example.com",
+        body="Booked",
+        idempotency_key=f"admin-test:{i}",
+      )
+    self.rows += count
+
+  def changelist_queries(self):
+    counts = {}
+    for model in admin.site._registry:
+      url = reverse(
+        f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist"
+      )
+      with CaptureQueriesContext(connection) as queries:
+        response = self.client.get(url)
+      self.assertEqual(response.status_code, 200, url)
+      counts[model._meta.label] = len(queries)
+    return counts
+
+  def test_changelists_run_a_constant_number_of_queries(self):
+    self.add_rows(1)
+    baseline = self.changelist_queries()
+    self.add_rows(10)
+    self.assertEqual(self.changelist_queries(), baseline)
+    # Every admin of this app must be covered by add_rows
+    for model in admin.site._registry:
+      if model._meta.app_label == "appliance":
+        self.assertGreater(model._default_manager.count(), 1, model._meta.label)
+
+  def test_property_changelist_annotates_appliance_count(self):
+    self.add_rows(2)
+    response = self.client.get(
+      reverse("admin:appliance_property_changelist"), {"o": "-3"}
+    )
+    self.assertContains(response, '<td class="field-appliance_count">1</td>', 2)
+
+  def test_estimated_count_is_used_above_the_threshold_only(self):
+    self.add_rows(3)
+    queryset = Appliance.objects.order_by("id")
+    with mock.patch.object(
+      EstimatedCountPaginator, "estimated_count", return_value=250_000
+    ):
+      self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 250_000)
+    with mock.patch.object(EstimatedCountPaginator, "estimated_count", return_value=2):
+      self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 3)
+    # Only PostgreSQL keeps usable table statistics
+    self.assertIsNone(EstimatedCountPaginator(queryset, 10).estimated_count())
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, VIEW_BUDGETS={})
+class AsyncModalViewTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.property = Property.objects.create(name="Flat 6", address="9 Dock Street")
+    self.user_property = UserProperty.objects.create(
+      user=self.user, property=self.property
+    )
+    self.appliance = Appliance.objects.create(
+      appliance_type=ApplianceType.OVEN.name,
+      brand="Bosch",
+      model="HBS534BS0B",
+      cost=500,
+      efficiency_rating=EfficiencyRating.GOOD.value,
+    )
+    PropertyAppliance.objects.create(
+      property=self.property, appliance=self.appliance, usage=Usage.LOW.value
+    )
+
+  async def test_replacement_modal_is_served_asynchronously(self):
+    await self.async_client.aforce_login(self.user)
+    with self.assertLogs("appliance.metrics", "INFO") as logs:
+      response = await self.async_client.post(
+        reverse(
+          "appliance_replacement_modal", args=[self.property.id, self.appliance.id]
+        ),
+        {"appliance_id": self.appliance.id},
+      )
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response["HX-Trigger-After-Swap"], "showModal")
+    self.assertContains(response, "9 Dock Street")
+    # Queries made from the ORM's worker thread are still counted
+    sample = json.loads(logs.records[-1].getMessage())
+    self.assertGreater(sample["queries"], 0)
+
+  async def test_add_appliance_modal_lists_the_catalogue(self):
+    other = await Property.objects.acreate(name="Flat 7", address="9 Dock Street")
+    await UserProperty.objects.acreate(user=self.user, property=other)
+    await self.async_client.aforce_login(self.user)
+    response = await self.async_client.post(
+      reverse("add_property_appliance", args=[self.user_property.id])
+    )
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, "HBS534BS0B")
+    self.assertContains(response, 'name="rows-TOTAL_FORMS" value="1"')
+    # Offered as a target for copying this property's appliances
+    self.assertContains(response, "Flat 7")
+
+  async def test_month_dates_answer_conditional_requests(self):
+    await self.async_client.aforce_login(self.user)
+    url = reverse("get_month_dates")
+    # A month no other test memoizes
+    params = {"year": 2099, "month": 1}
+    response = await self.async_client.get(url, params)
+    self.assertEqual(response.status_code, 200)
+    self.assertIn("Last-Modified", response)
+
+    response = await self.async_client.get(
+      url, params, headers={"If-None-Match": response["ETag"]}
+    )
+    self.assertEqual(response.status_code, 304)
+
+  async def test_anonymous_requests_are_redirected_to_login(self):
+    response = await self.async_client.get(reverse("get_month_dates"))
+    self.assertEqual(response.status_code, 302)
+
+
+class EnsureSuperuserTests(TestCase):
+  def call(self, **env):
+    out = StringIO()
+    with mock.patch.dict(os.environ, env):
+      call_command("ensure_superuser", stdout=out)
+    return out.getvalue()
+
+  def test_creates_the_superuser_once(self):
+    env = {"SUPERUSER_NAME": "root", "SUPERUSER_PASSWORD": "testpass123"}
+    self.assertIn("Created superuser root", self.call(**env))
+    self.assertIn("already exists", self.call(**env))
+    user = User.objects.get(username="root")
+    self.assertTrue(user.is_superuser)
+    self.assertTrue(user.check_password("testpass123"))
+
+  def test_skips_without_credentials(self):
+    with mock.patch.dict(os.environ):
+      os.environ.pop("SUPERUSER_NAME", None)
+      self.assertIn("skipping", self.call())
+    self.assertFalse(User.objects.filter(is_superuser=True).exists())
+
+
+CACHED_TEMPLATES = [
+  {
+    **settings.TEMPLATES[0],
+    "OPTIONS": {
+      **settings.TEMPLATES[0]["OPTIONS"],
+      "loaders": [("django.template.loaders.cached.Loader", settings.TEMPLATE_LOADERS)],
+    },
+  }
+]
+
+
+@override_settings(
+  STORAGES=LOCAL_STORAGES, TEMPLATE_CACHE=True, TEMPLATES=CACHED_TEMPLATES
+)
+class TemplateLoadingTests(TestCase):
+  def test_warm_up_compiles_every_app_template(self):
+    loader = engines.all()[0].engine.template_loaders[0]
+    self.assertIsInstance(loader, CachedLoader)
+    names = app_template_names()
+    self.assertIn("partial/property_appliances/modal/calendar.html", names)
+    self.assertEqual(warm_templates(), len(names))
+    self.assertEqual(set(loader.get_template_cache), set(names))
+    # Rendering a warm template loads nothing from disk
+    with mock.patch.object(
+      loader.loaders[1], "get_contents", side_effect=AssertionError
+    ):
+      render_to_string("partial/property_view/clone_result.html", {"copied": 0})
+
+  @override_settings(TEMPLATE_CACHE=False)
+  def test_warm_up_is_skipped_without_the_cached_loader(self):
+    self.assertEqual(warm_templates(), 0)
+
+  def test_benchmark_reports_each_partial(self):
+    user = User.objects.create_user(username="landlord")
+    property = Property.objects.create(name="Flat 6", address="9 Dock Street")
+    UserProperty.objects.create(user=user, property=property)
+    PropertyAppliance.objects.create(
+      property=property,
+      appliance=Appliance.objects.create(
+        appliance_type=ApplianceType.OVEN.name,
+        brand="Bosch",
+        model="HBS534BS0B",
+        cost=500,
+        efficiency_rating=EfficiencyRating.GOOD.value,
+      ),
+      usage=Usage.LOW.value,
+    )
+    out = StringIO()
+    call_command(
+      "benchmark_templates", "--username", "landlord", "--renders", "3", stdout=out
+    )
+    lines = out.getvalue().splitlines()
+    self.assertEqual(len(lines), 7)
+    self.assertTrue(lines[1].startswith("partial/property_appliances/modal/index.html"))
+    self.assertNotIn("skipped", out.getvalue())
+
+
+class CacheBackendTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    cache.reset_stats()
+    metrics.registry.reset()
+    self.addCleanup(metrics.registry.reset)
+
+  def test_lookups_are_counted(self):
+    cache.set("present", 1)
+    self.assertEqual(cache.get("present"), 1)
+    self.assertIsNone(cache.get("absent"))
+    self.assertEqual(cache.get_many(["present", "absent"]), {"present": 1})
+    for result, count in (("hit", 2), ("miss", 2)):
+      self.assertEqual(
+        metrics.registry.value("cache_requests_total", backend="locmem", result=result),
+        count,
+      )
+    self.assertEqual(cache.stats(), {"hit": 2, "miss": 2})
+
+  def test_file_cache_shares_counts_between_workers(self):
+    location = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, location)
+    workers = [FileBasedCache(location, {"KEY_PREFIX": "test"}) for _ in range(2)]
+    workers[0].set("row", "<tr></tr>")
+    self.assertEqual(workers[1].get("row"), "<tr></tr>")
+    self.assertIsNone(workers[0].get("other"))
+    workers[0].flush_stats()
+    self.assertEqual(workers[1].stats(), {"hit": 1, "miss": 1})
+    self.assertEqual(workers[1].usage()["entries"], 3)
+
+  def test_file_cache_scans_for_culling_every_few_writes(self):
+    location = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, location)
+    worker = FileBasedCache(
+      location, {"KEY_PREFIX": "test", "OPTIONS": {"MAX_ENTRIES": 10}}
+    )
+    with mock.patch.object(
+      worker, "_list_cache_files", wraps=worker._list_cache_files
+    ) as list_cache_files:
+      for index in range(CULL_CHECK_INTERVAL):
+        worker.set(f"row:{index}", index)
+    self.assertEqual(list_cache_files.call_count, 1)
+    self.assertLessEqual(worker.usage()["entries"], CULL_CHECK_INTERVAL)
+
+  def test_cache_stats_command_reports_the_hit_ratio(self):
+    cache.set("present", 1)
+    cache.get("present")
+    cache.get("absent")
+    out = StringIO()
+    call_command("cache_stats", stdout=out)
+    self.assertIn("Backend      locmem", out.getvalue())
+    self.assertIn("Hit ratio    50.0% (1 hits, 1 misses)", out.getvalue())
+    self.assertIn("prefix 'appliance', version 1", out.getvalue())
+
+
+@override_settings(
+  SESSION_ENGINE="django.contrib.sessions.backends.cached_db", AUTH_CACHE_TIMEOUT=300
+)
+class CachedAuthTests(TestCase):
+  def setUp(self):
+    cache.clear()
+    self.user = User.objects.create_user(username="landlord", password="testpass123")
+    self.client.login(username="landlord", password="testpass123")
+
+  def poll(self):
+    return self.client.get(reverse("notification_feed"), {"since": 0})
+
+  def test_htmx_poll_makes_no_queries_once_cached(self):
+    self.assertEqual(self.poll().status_code, 304)
+    with self.assertNumQueries(0):
+      self.assertEqual(self.poll().status_code, 304)
+
+  @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+  def test_signed_cookie_sessions_make_no_queries(self):
+    self.client.login(username="landlord", password="testpass123")
+    self.assertEqual(self.poll().status_code, 304)
+    with self.assertNumQueries(0):
+      self.assertEqual(self.poll().status_code, 304)
+
+  @override_settings(
+    SESSION_ENGINE="django.contrib.sessions.backends.db", AUTH_CACHE_TIMEOUT=0
+  )
+  def test_uncached_poll_loads_the_session_and_user(self):
+    self.client.login(username="landlord", password="testpass123")
+    self.poll()
+    with self.assertNumQueries(2):
+      self.assertEqual(self.poll().status_code, 304)
+
+  def test_password_change_signs_out_cached_sessions(self):
+    self.poll()
+    self.user.set_password("changed456")
+    self.user.save()
+    response = self.poll()
+    self.assertEqual(response.status_code, 302)
+
+  def test_permission_changes_reach_the_cached_user(self):
+    backend = CachedModelBackend()
+    permission = Permission.objects.get(codename="change_appliance")
+    self.assertFalse(
+      backend.get_user(self.user.pk).has_perm("appliance.change_appliance")
+    )
+
+    self.user.user_permissions.add(permission)
+    self.assertTrue(
+      backend.get_user(self.user.pk).has_perm("appliance.change_appliance")
+    )
+    self.user.user_permissions.clear()
+    self.assertFalse(
+      backend.get_user(self.user.pk).has_perm("appliance.change_appliance")
+    )
+
+    group = Group.objects.create(name="Managers")
+    group.user_set.add(self.user)
+    group.permissions.add(permission)
+    self.assertTrue(
+      backend.get_user(self.user.pk).has_perm("appliance.change_appliance")
+    )
+    group.delete()
+    self.assertFalse(
+      backend.get_user(self.user.pk).has_perm("appliance.change_appliance")
+    )
+
+  def test_deactivated_user_is_not_served_from_the_cache(self):
+    backend = CachedModelBackend()
+    self.assertEqual(backend.get_user(self.user.pk), self.user)
+    self.user.is_active = False
+    self.user.save()
+    self.assertIsNone(backend.get_user(self.user.pk))
@@ -32,6 +32,15 @@ urlpatterns = [
   #
   #
   #
+  path(
+    "<int:user_property_id>/due/",
+    views.replacements_due,
+    name="replacements_due",
+  ),
+  #
+  #
+  #
+  #
   path(
     "<int:property_id>/<int:appliance_id>/",
     views.property_appliance_view,
@@ -97,6 +106,29 @@ urlpatterns += [
     views.add_property_appliance,
     name="add_property_appliance",
   ),
+  #
+  #
+  #
+  #
+  path("appliances/search/", views.appliance_search, name="appliance_search"),
+  #
+  #
+  #
+  #
+  path(
+    "<int:user_property_id>/add-appliances/",
+    views.bulk_add_property_appliances,
+    name="bulk_add_property_appliances",
+  ),
+  #
+  #
+  #
+  #
+  path(
+    "<int:user_property_id>/clone-appliances/",
+    views.clone_appliance_set,
+    name="clone_appliance_set",
+  ),
 ]
 
 # ============================================================================
@@ -129,5 +161,43 @@ urlpatterns += [
   #
   #
   #
+  path("notifications/", views.notification_feed, name="notification_feed"),
+  #
+  #
+  #
+  #
+  path(
+    "notifications/read/",
+    views.mark_notifications_read,
+    name="mark_notifications_read",
+  ),
+  #
+  #
+  #
+  #
   path("logout/", views.logout_view, name="logout"),
 ]
+
+# ============================================================================
+# Export
+# ============================================================================
+
+urlpatterns += [
+  #
+  #
+  #
+  #
+  path("export/", views.export_portfolio_view, name="export_portfolio"),
+]
+
+# ============================================================================
+# Metrics
+# ============================================================================
+
+urlpatterns += [
+  #
+  #
+  #
+  #
+  path("metrics", views.metrics_view, name="metrics"),
+]
@@ -2,94 +2,57 @@
 #
 #
 #
-from calendar import monthrange
-from datetime import date, timedelta
-
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError
+from django.http import (
+  Http404,
+  HttpResponse,
+  HttpResponseBadRequest,
+  HttpResponseNotModified,
+  JsonResponse,
+  StreamingHttpResponse,
+)
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.http import require_http_methods
 
-from appliance.forms import PropertyApplianceForm, ScheduleForm
+from appliance import metrics, notifications, onboarding
+from appliance.analytics import portfolio_summary
+from appliance.availability import get_availability_context, month_availability
+from appliance.exports import aiter_chunks, export_portfolio
+from appliance.forecasting import due_within
+from appliance.forms import (
+  ApplianceFilterForm,
+  CloneApplianceSetForm,
+  PropertyApplianceForm,
+  PropertyApplianceFormSet,
+  ScheduleForm,
+)
+from appliance.matching import top_replacements
 from appliance.models import (
   Appliance,
   Property,
   PropertyAppliance,
+  ReplacementScore,
   Schedule,
   UserProperty,
 )
+from appliance.pagination import keyset_page
+from appliance.search import search_appliances
 
-# ============================================================================
-# Helper Functions
-# ============================================================================
-
-def get_availability_context(month=None, year=None):
-  today = timezone.now().date()
-  current_year = today.year
-  current_month = today.month
-
-  if month and year:
-    current_year = int(year)
-    current_month = int(month)
-
-  first_day = date(current_year, current_month, 1)
-  last_day = date(
-    current_year, current_month, monthrange(current_year, current_month)[1]
-  )
-
-  dates = []
-
-  first_weekday = (first_day.weekday() + 1) % 7
-  for _ in range(first_weekday):
-    dates.append(
-      {
-        "date": "",
-        "day": "",
-        "is_available": False,
-        "available_hours": [],
-        "available_minutes": [],
-      }
-    )
-
-  current_date = first_day
-  while current_date <= last_day:
-    weekday = (current_date.weekday() + 1) % 7
-    is_available = current_date > today and weekday not in [0, 6]
-    dates.append(
-      {
-        "date": current_date.strftime("%Y-%m-%d"),
-        "day": current_date.day,
-        "is_available": is_available,
-        "available_hours": [8, 9, 10, 11, 12, 13, 14, 15, 16, 17]
-        if is_available
-        else [],
-        "available_minutes": [0, 15, 30, 45] if is_available else [],
-      }
-    )
-    current_date += timedelta(days=1)
-
-  last_weekday = (last_day.weekday() + 1) % 7
-  for _ in range(6 - last_weekday):
-    dates.append(
-      {
-        "date": "",
-        "day": "",
-        "is_available": False,
-        "available_hours": [],
-        "available_minutes": [],
-      }
-    )
-
-  return {
-    "dates": dates,
-    "current_month": first_day,
-    "month_name": first_day.strftime("%B %Y"),
-    "prev_month": (first_day - timedelta(days=1)).strftime("%Y-%m"),
-    "next_month": (last_day + timedelta(days=1)).strftime("%Y-%m"),
-  }
+CATALOGUE_ORDERING = ("appliance_type", "cost", "id")
 
+# Async views render in the request's sync thread, where templates can load the
+# session, user or media URLs lazily without blocking the event loop
+arender = sync_to_async(render)
 
 # ============================================================================
 # Main Views
@@ -98,10 +61,13 @@ def get_availability_context(month=None, year=None):
 
 @login_required
 def home(request):
-  user_properties = UserProperty.objects.filter(user=request.user)
+  user_properties = UserProperty.objects.filter(user=request.user).select_related(
+    "property"
+  )
   context = {
     "user": request.user,
     "user_properties": user_properties,
+    "portfolio": portfolio_summary(request.user),
   }
   return render(request, "partial/home/index.html", context)
 
@@ -112,7 +78,9 @@ def home(request):
 #
 @login_required
 def property_view(request, user_property_id=1):
-  user_property = get_object_or_404(UserProperty, id=user_property_id)
+  user_property = get_object_or_404(
+    UserProperty.objects.with_dashboard(), id=user_property_id
+  )
   context = {
     "user": request.user,
     "user_property": user_property,
@@ -120,17 +88,76 @@ def property_view(request, user_property_id=1):
   return render(request, "partial/property_view/index.html", context)
 
 
+# Replacements due
+#
+#
+#
+@login_required
+@require_http_methods(["GET"])
+def replacements_due(request, user_property_id):
+  user_property = get_object_or_404(
+    UserProperty.objects.select_related("property"),
+    id=user_property_id,
+    user=request.user,
+  )
+  try:
+    months = int(request.GET.get("months", settings.FORECAST_HORIZON_MONTHS))
+  except ValueError:
+    months = settings.FORECAST_HORIZON_MONTHS
+  months = min(max(months, 1), 120)
+
+  context = {
+    "user_property": user_property,
+    "months": months,
+    "forecasts": due_within(user_property.property_id, months),
+    "today": timezone.localdate(),
+  }
+  return render(request, "partial/property_view/due_rows.html", context)
+
+
 # Explore appliances
 #
 #
 #
 @login_required
 def explore(request):
-  appliances = Appliance.objects.all()
+  is_fragment = request.headers.get("HX-Request") == "true"
+  brands = ()
+  if not is_fragment:
+    brands = (
+      Appliance.objects.order_by("brand").values_list("brand", flat=True).distinct()
+    )
+  filter_form = ApplianceFilterForm(request.GET, brands=brands)
+  appliances = filter_form.filter(Appliance.objects.all())
+
+  next_url = None
+  if filter_form.query:
+    # Ranked search results are a single page, best match first
+    appliances = search_appliances(
+      filter_form.query, limit=settings.SEARCH_RESULTS_LIMIT, queryset=appliances
+    )
+  else:
+    page = keyset_page(
+      appliances,
+      CATALOGUE_ORDERING,
+      cursor=request.GET.get("cursor"),
+      page_size=settings.CATALOGUE_PAGE_SIZE,
+    )
+    appliances = page.items
+    if page.has_next:
+      query = request.GET.copy()
+      query["cursor"] = page.next_cursor
+      next_url = f"{reverse('explore')}?{query.urlencode()}"
+
   context = {
     "user": request.user,
     "appliances": appliances,
+    "filter_form": filter_form,
+    "next_url": next_url,
+    "is_first_page": not request.GET.get("cursor"),
   }
+  if is_fragment:
+    return render(request, "partial/explore/rows.html", context)
   return render(request, "partial/explore/index.html", context)
 
 
@@ -157,13 +184,12 @@ def property_appliance_view(request, property_id=1, appliance_id=1):
   property_appliance = get_object_or_404(
     PropertyAppliance, property=property, appliance=appliance
   )
-  print("############# ID", property_appliance.id)
-  appliances = Appliance.objects.filter(appliance_type=appliance.appliance_type)
+  recommendations = top_replacements(property_appliance)
   context = {
     "user": request.user,
     "property": property,
     "current_appliance": property_appliance,
-    "appliances": appliances,
+    "recommendations": recommendations,
     "property_appliance_id": property_appliance.id,
   }
   return render(request, "partial/property_appliances/index.html", context)
@@ -180,24 +206,36 @@ def property_appliance_view(request, property_id=1, appliance_id=1):
 #
 @login_required
 @require_http_methods("POST")
-def appliance_replacement_modal(request, property_id, appliance_id):
-  current_property_appliance = get_object_or_404(
-    PropertyAppliance, property_id=property_id, appliance_id=appliance_id
+async def appliance_replacement_modal(request, property_id, appliance_id):
+  current_property_appliance = await aget_object_or_404(
+    PropertyAppliance.objects.select_related("property"),
+    property_id=property_id,
+    appliance_id=appliance_id,
   )
 
   replacement_appliance_id = request.POST.get("appliance_id")
-  replacement_appliance = get_object_or_404(Appliance, id=replacement_appliance_id)
+  replacement_appliance = await aget_object_or_404(
+    Appliance, id=replacement_appliance_id
+  )
 
-  availability_context = get_availability_context()
+  availability_context = await sync_to_async(get_availability_context)()
+  matching_score = await (
+    ReplacementScore.objects.filter(
+      property_appliance=current_property_appliance, candidate=replacement_appliance
+    )
+    .values_list("score", flat=True)
+    .afirst()
+  )
 
   context = {
     "appliance": replacement_appliance,
+    "matching_score": matching_score,
     "property": current_property_appliance.property,
     "property_appliance_id": current_property_appliance.id,
     **availability_context,
   }
 
-  response = render(
+  response = await arender(
     request,
     "partial/property_appliances/modal/index.html",
     context,
@@ -220,7 +258,12 @@ def appliance_replacement_modal_submit(request):
   form = ScheduleForm(request.POST)
 
   if form.is_valid():
-    form.save()
+    try:
+      schedule = form.save()
+    except ValidationError as error:
+      form.add_error(None, error)
+      return JsonResponse({"status": "error", "errors": form.errors}, status=409)
+    notifications.replacement_booked(schedule)
     return HttpResponse(
       '<div class="alert alert-success">Schedule created successfully!</div>'
     )
@@ -239,16 +282,19 @@ def appliance_replacement_modal_submit(request):
 #
 @login_required
 @require_http_methods("POST")
-def add_property_appliance(request, property_id):
-  appliances = Appliance.objects.all()
-  user_property = get_object_or_404(UserProperty, id=property_id)
+async def add_property_appliance(request, property_id):
+  appliances = [appliance async for appliance in Appliance.objects.all()]
+  user_property = await aget_object_or_404(UserProperty, id=property_id)
 
   context = {
     "appliances": appliances,
     "user_property": user_property,
+    "clone_form": CloneApplianceSetForm(
+      user=await request.auser(), source=user_property
+    ),
   }
 
-  response = render(
+  response = await arender(
     request,
     "partial/property_view/appliance_add_modal.html",
     context,
@@ -261,6 +307,49 @@ def add_property_appliance(request, property_id):
   return response
 
 
+# Appliance search
+#
+#
+#
+@login_required
+def appliance_search(request):
+  appliance_type = request.GET.get("appliance_type") or None
+  query = request.GET.get("q", "").strip()
+  appliances = search_appliances(
+    query, limit=settings.SEARCH_RESULTS_LIMIT, appliance_type=appliance_type
+  )
+
+  if request.headers.get("HX-Request") == "true":
+    # The add-appliance modal swaps its rows; an empty query restores the list
+    try:
+      user_property_id = int(request.GET.get("property", ""))
+    except ValueError:
+      return HttpResponseBadRequest("property must be an integer id")
+    user_property = get_object_or_404(
+      UserProperty.objects.select_related("property"), id=user_property_id
+    )
+    if not query:
+      appliances = Appliance.objects.all()
+    context = {"appliances": appliances, "user_property": user_property}
+    return render(request, "partial/property_view/appliance_add_rows.html", context)
+
+  return JsonResponse(
+    {
+      "results": [
+        {
+          "id": appliance.id,
+          "appliance_type": appliance.appliance_type,
+          "brand": appliance.brand,
+          "model": appliance.model,
+          "cost": appliance.cost,
+          "score": round(appliance.search_score, 4),
+        }
+        for appliance in appliances
+      ]
+    }
+  )
+
+
 # Add appliance submit
 #
 #
@@ -271,8 +360,13 @@ def add_property_appliance_submit(request):
   form = PropertyApplianceForm(request.POST, property_id=request.POST.get("property"))
   if form.is_valid():
     property_appliance = form.save()
-    property_appliance.save()
-    user_property = get_object_or_404(UserProperty, id=request.POST.get("property"))
+    property_appliance = PropertyAppliance.objects.for_dashboard().get(
+      id=property_appliance.id
+    )
+    user_property = get_object_or_404(
+      UserProperty.objects.select_related("property"), id=request.POST.get("property")
+    )
+    notifications.appliance_added(property_appliance)
     context = {
       "property_appliance": property_appliance,
       "user_property": user_property,
@@ -288,6 +382,85 @@ def add_property_appliance_submit(request):
     return JsonResponse({"status": "error", "errors": form.errors}, status=400)
 
 
+# Bulk add appliances
+#
+#
+#
+@login_required
+@require_http_methods("POST")
+def bulk_add_property_appliances(request, user_property_id):
+  user_property = get_object_or_404(
+    UserProperty.objects.select_related("property"),
+    id=user_property_id,
+    user=request.user,
+  )
+  formset = PropertyApplianceFormSet(
+    request.POST, prefix="rows", property_id=user_property.property_id
+  )
+  if not formset.is_valid():
+    return JsonResponse(
+      {
+        "status": "error",
+        "errors": [form.errors.get_json_data() for form in formset.forms],
+        "non_form_errors": formset.non_form_errors().get_json_data(),
+      },
+      status=400,
+    )
+  try:
+    units = onboarding.install(formset.units(user_property.property))
+  except IntegrityError:
+    # A concurrent request installed one of the appliances first
+    return JsonResponse(
+      {
+        "status": "error",
+        "errors": [],
+        "non_form_errors": ["An appliance is already installed at the property"],
+      },
+      status=400,
+    )
+
+  context = {
+    "property_appliances": PropertyAppliance.objects.for_dashboard().filter(
+      id__in=[unit.id for unit in units]
+    ),
+    "user_property": user_property,
+  }
+  response = render(request, "partial/property_view/appliance_rows.html", context)
+  response["HX-Trigger"] = "refreshApplianceList"
+  return response
+
+
+# Clone appliance set
+#
+#
+#
+@login_required
+@require_http_methods("POST")
+def clone_appliance_set(request, user_property_id):
+  user_property = get_object_or_404(
+    UserProperty, id=user_property_id, user=request.user
+  )
+  form = CloneApplianceSetForm(request.POST, user=request.user, source=user_property)
+  if not form.is_valid():
+    return JsonResponse({"status": "error", "errors": form.errors}, status=400)
+  targets = form.cleaned_data["targets"]
+  try:
+    units = onboarding.clone_appliance_set(
+      user_property.property_id, [target.property_id for target in targets]
+    )
+  except IntegrityError:
+    return JsonResponse(
+      {
+        "status": "error",
+        "errors": {"targets": ["A property changed while copying, please retry"]},
+      },
+      status=400,
+    )
+
+  context = {"copied": len(units), "targets": targets}
+  return render(request, "partial/property_view/clone_result.html", context)
+
+
 # ============================================================================
 # API Views
 # ============================================================================
@@ -297,9 +470,7 @@ def add_property_appliance_submit(request):
 #
 #
 #
-@login_required
-@require_http_methods(["GET"])
-def get_month_dates(request):
+def requested_month(request):
   year = request.GET.get("year")
   month = request.GET.get("month")
 
@@ -310,8 +481,28 @@ def get_month_dates(request):
     year = None
     month = None
 
-  context = get_availability_context(month, year)
-  return JsonResponse(context)
+  if not (year and month and 1 <= month <= 12):
+    today = timezone.localdate()
+    year, month = today.year, today.month
+  return year, month
+
+
+@login_required
+@require_http_methods(["GET"])
+async def get_month_dates(request):
+  # The condition decorator calls its validators synchronously, so a month
+  # built on a cache miss would query from the event loop; check here instead
+  availability = await sync_to_async(month_availability)(*requested_month(request))
+  etag = quote_etag(availability.etag)
+  last_modified = int(availability.last_modified.timestamp())
+
+  response = get_conditional_response(
+    request, etag=etag, last_modified=last_modified
+  ) or JsonResponse(availability.context)
+  response.headers.setdefault("ETag", etag)
+  response.headers.setdefault("Last-Modified", http_date(last_modified))
+  patch_cache_control(response, private=True, no_cache=True)
+  return response
 
 
 # Delete schedule
@@ -322,8 +513,14 @@ def get_month_dates(request):
 @login_required
 @require_http_methods("POST")
 def delete_schedule(request, schedule_id):
-  schedule = get_object_or_404(Schedule, id=schedule_id)
+  schedule = get_object_or_404(
+    Schedule.objects.select_related(
+      "property_appliance__property", "property_appliance__appliance"
+    ),
+    id=schedule_id,
+  )
   schedule.delete()
+  notifications.replacement_cancelled(schedule)
   return HttpResponse(
     '<div class="alert alert-success">Schedule deleted successfully!</div>'
   )
@@ -337,13 +534,68 @@ def delete_schedule(request, schedule_id):
 @login_required
 @require_http_methods("POST")
 def delete_property_appliance(request, property_appliance_id):
-  property_appliance = get_object_or_404(PropertyAppliance, id=property_appliance_id)
+  property_appliance = get_object_or_404(
+    PropertyAppliance.objects.select_related("property", "appliance"),
+    id=property_appliance_id,
+  )
   property_appliance.delete()
+  notifications.appliance_removed(property_appliance)
   return HttpResponse(
     '<div class="alert alert-success">Property appliance deleted successfully!</div>'
   )
 
 
+# Notification feed
+#
+#
+#
+#
+@login_required
+@require_http_methods(["GET"])
+def notification_feed(request):
+  """
+  Polled by the bell. The first request, without a cursor, renders the newest
+  notifications; later polls pass the id they have seen as since= and get a
+  304 until something newer exists, then only the new rows.
+  """
+  try:
+    since = int(request.GET["since"]) if "since" in request.GET else None
+  except ValueError:
+    return HttpResponseBadRequest("since must be an integer")
+
+  latest = notifications.latest_notification_id(request.user.id)
+  if since is not None and since >= latest:
+    return HttpResponseNotModified()
+
+  items = notifications.notifications_since(
+    request.user.id, since or 0, settings.NOTIFICATION_FEED_SIZE
+  )
+  response = render(
+    request,
+    "partial/headbar/notification_feed.html",
+    {
+      "notifications": items,
+      "cursor": max([since or 0, *(item.id for item in items)]),
+      "initial": since is None,
+      "unread": any(item.read_at is None for item in items),
+      "poll_interval": settings.NOTIFICATION_POLL_INTERVAL,
+    },
+  )
+  patch_cache_control(response, private=True, no_store=True)
+  return response
+
+
+@login_required
+@require_http_methods("POST")
+def mark_notifications_read(request):
+  try:
+    up_to = int(request.POST.get("up_to", ""))
+  except ValueError:
+    return HttpResponseBadRequest("up_to must be an integer")
+  notifications.mark_read(request.user.id, up_to)
+  return HttpResponse(status=204)
+
+
 # ============================================================================
 # Logout
 # ============================================================================
@@ -358,3 +610,60 @@ def delete_property_appliance(request, property_appliance_id):
 def logout_view(request):
   logout(request)
   return redirect("/admin/login/")
+
+
+# ============================================================================
+# Export
+# ============================================================================
+
+
+# Portfolio export
+#
+#
+#
+@login_required
+@require_http_methods(["GET"])
+def export_portfolio_view(request):
+  try:
+    property_ids = [int(value) for value in request.GET.getlist("property")]
+  except ValueError:
+    return HttpResponseBadRequest("property must be an integer id")
+  properties = Property.objects.filter(landlords__user=request.user)
+  if property_ids:
+    properties = properties.filter(id__in=property_ids)
+
+  try:
+    chunks, content_type, extension = export_portfolio(
+      properties,
+      file_format=request.GET.get("format", "csv"),
+      compression=request.GET.get("compression") or None,
+    )
+  except ValueError as error:
+    return HttpResponseBadRequest(str(error))
+
+  if isinstance(request, ASGIRequest):
+    # A sync iterator would be read whole before the first byte is sent
+    chunks = aiter_chunks(chunks)
+  filename = f"portfolio-{timezone.localdate().isoformat()}.{extension}"
+  response = StreamingHttpResponse(chunks, content_type=content_type)
+  response["Content-Disposition"] = f'attachment; filename="{filename}"'
+  patch_cache_control(response, private=True, no_store=True)
+  return response
+
+
+# ============================================================================
+# Metrics
+# ============================================================================
+
+
+# Prometheus metrics
+#
+#
+#
+@require_http_methods(["GET"])
+def metrics_view(request):
+  if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+    raise Http404
+  return HttpResponse(
+    metrics.registry.render(), content_type="text/plain; version=0.0.4"
+  )
@@ -1,36 +1,31 @@
 #!/bin/bash
 # entrypoint.sh
+#
+# Web and worker containers start straight into their command. Migrations and
+# the superuser bootstrap run once per release in "migrate" mode, from the k3s
+# migration Job, the Heroku release phase or the compose migrate service.
+# Static files are collected when the image is built.
 set -e  # Exit immediately if a command exits with a non-zero status
 
-# Create staticfiles directory explicitly
-echo "Creating staticfiles directory..."
-mkdir -p /app/staticfiles
-chmod 755 /app/staticfiles
+export CONTAINER_STARTED_AT="${CONTAINER_STARTED_AT:-$(date +%s.%N)}"
 
-# Run database migrations
-echo "Running migrations..."
-python manage.py migrate --noinput
+# Logs a startup step as one JSON line, with seconds since the container started
+log_step() {
+  local elapsed
+  elapsed=$(awk -v now="$(date +%s.%N)" -v start="$CONTAINER_STARTED_AT" \
+    'BEGIN { printf "%.3f", now - start }')
+  echo "{\"event\": \"startup\", \"step\": \"$1\", \"elapsed_s\": $elapsed}"
+}
 
-# Collect static files
-echo "Collecting static files..."
-python manage.py collectstatic --noinput
-
-# Verify static files were collected
-echo "Verifying static files..."
-ls -la /app/staticfiles
-
-# Create superuser if it doesn't exist
-echo "Creating superuser..."
-python manage.py shell <<EOF
-from django.contrib.auth import get_user_model
-import os
-User = get_user_model()
-superuser = os.getenv("SUPERUSER_NAME")
-password = os.getenv("SUPERUSER_PASSWORD")
-if not User.objects.filter(username=superuser).exists():
-  User.objects.create_superuser(superuser, f'{superuser}@example.com', password)
-EOF
-
-# Execute the command passed to the container
-echo "Starting server..."
-exec "$@"
+case "$1" in
+  migrate)
+    python manage.py migrate --noinput
+    log_step "migrate"
+    python manage.py ensure_superuser
+    log_step "ensure_superuser"
+    ;;
+  *)
+    log_step "exec $1"
+    exec "$@"
+    ;;
+esac
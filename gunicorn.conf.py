@@ -0,0 +1,64 @@
+#
+#
+#
+#
+import json
+import multiprocessing
+import os
+import time
+
+# SERVER_MODE=asgi runs the ASGI application on uvicorn workers, where async
+# views wait on the database without holding a whole worker. The default keeps
+# sync WSGI workers.
+server_mode = os.getenv("SERVER_MODE", "wsgi")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+errorlog = "-"
+# Import the application once in the master so workers fork ready to serve
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+if server_mode == "asgi":
+  wsgi_app = "app_manager.asgi:application"
+  worker_class = "uvicorn.workers.UvicornWorker"
+else:
+  wsgi_app = "app_manager.wsgi:application"
+  # More than one thread switches to gthread workers
+  threads = int(os.getenv("GUNICORN_THREADS", "1"))
+
+
+# Startup timing
+#
+#
+#
+# Set by entrypoint.sh; without it time is counted from loading this file
+started_at = float(os.getenv("CONTAINER_STARTED_AT") or time.time())
+
+
+def log_step(server, step, **fields):
+  elapsed = round(time.time() - started_at, 3)
+  server.log.info(
+    json.dumps({"event": "startup", "step": step, "elapsed_s": elapsed, **fields})
+  )
+
+
+def warm_templates(server):
+  # Imported here as Django is only set up once the application is loaded
+  from appliance.template_backends import warm_templates
+
+  log_step(server, "templates_warm", templates=warm_templates())
+
+
+def when_ready(server):
+  if preload_app:
+    warm_templates(server)
+  log_step(server, "listening", mode=server_mode)
+
+
+def post_worker_init(worker):
+  if not preload_app:
+    warm_templates(worker)
+  log_step(worker, "worker_ready", pid=worker.pid)